@@ -1,65 +1,175 @@
 
 import os
-import io
-import re
-import pandas as pd
+import time
+import uuid
 import streamlit as st
-from utils import count_tokens, estimate_tokens_per_tc
-from bedrock_client import call_bedrock_model
-from file_utils import read_uploaded_file
-from prompts import ESTIMATE_PROMPT, GENERATE_PROMPT, FORMAT_INSTRUCTIONS
+from bedrock_client import call_bedrock_model, client_stats, stream_bedrock_model
+from file_utils import extract_uploaded_file, supported_extensions
+from estimator import estimate_case_count, format_local_estimate, record_ai_estimate
+from exports import XLSX_MIME, csv_bytes, get_export, txt_bytes, xlsx_bytes
+from generation import (GENERATION_BATCH_SIZE, MAX_TOKENS_PER_CALL, build_estimate_prompt, build_generate_prompt,
+                        continue_truncated, generate_incremental, generate_paged, parse_estimated_count, record_usage,
+                        split_stable_sections)
+from parsers import make_parser, parse_store
+from response_cache import get_response_cache
+from token_budget import get_token_stats, output_token_budget
+from rate_limiter import get_rate_limiter
+from router import get_router
+from scheduler import get_scheduler
+from telemetry import log_event, metrics, session_summary
+from tracing import TRACE_STAGES, add_span, profiled, span, start_trace, traced, use_trace
+from jobs import DONE, FAILED, JOB_POLL_SECONDS, QUEUED, RUNNING, get_job_store
+
+
+def get_parsed_cases(test_type: str):
+    # Parsed once per generation and format into a CaseStore; reruns reuse it
+    # and build the DataFrames from its columns only for what is shown
+    parsed = st.session_state.parsed_results
+    if test_type not in parsed:
+        parsed[test_type] = parse_store(st.session_state.generated_cases, test_type,
+                                        st.session_state.generation_format)
+    return parsed[test_type]
+
+
+def run_generation(job, trace=None, **params) -> dict:
+    """Job body; with stage tracing on, the stages are timed into trace (and profiled if configured)."""
+    with use_trace(trace), profiled(trace), span("generation"):
+        result = _run_generation(job, **params)
+    if trace is not None:
+        trace.finish()
+        log_event("trace", session=job.session_id, job=job.id, stages=trace.table(), profile=trace.profile_path)
+    result["trace"] = trace
+    return result
+
+
+def _run_generation(job, requirements_text: str, test_type: str, model_id: str, temperature: float,
+                    use_two_step: bool, local_estimate: bool, count_override: int,
+                    use_streaming: bool, use_chunking: bool, use_cache: bool, output_format: str = "text",
+                    previous_plan: list = None) -> dict:
+    """Estimate and generate on a job worker thread. Reports through job.update(), never st.*."""
+    # Step 1: estimate count
+    estimation = None
+    count = count_override
+    with span("estimate"):
+        if use_two_step and local_estimate:
+            count, signals = estimate_case_count(requirements_text)
+            estimation = format_local_estimate(count, signals)
+        elif use_two_step:
+            job.update(progress=0.02, message="Estimating the test case count")
+            estimation = call_bedrock_model(
+                prompt=build_estimate_prompt(requirements_text),
+                model_id=model_id,
+                max_tokens=1000,
+                temperature=0.0,
+                use_cache=use_cache
+            )
+            estimated = parse_estimated_count(estimation)
+            if estimated:
+                record_ai_estimate(requirements_text, estimated, model_id)
+                count = estimated
+
+    # Step 2: generate
+    job.update(progress=0.05, message=f"Generating {count} test cases")
+    note = None
+    cases = None
+    plan = None
+    reused = 0
+    # Sized for the final count from the usage learned for this model and format
+    max_tokens = min(output_token_budget(model_id, test_type, output_format, count), MAX_TOKENS_PER_CALL)
+    with span("generate"):
+        sections = split_stable_sections(requirements_text) if use_chunking else []
+        if len(sections) > 1:
+            # Map-reduce: one concurrent call per requirement section, reusing
+            # the stored cases of sections unchanged since an earlier run
+            gen, plan, reused = generate_incremental(
+                requirements_text, count, test_type, model_id, temperature=temperature, use_cache=use_cache,
+                on_section_done=lambda done, total: job.update(progress=done / total, message=f"Generated {done}/{total} sections"),
+                output_format=output_format, previous_plan=previous_plan
+            )
+            if reused:
+                note = f"Reused the stored test cases of {reused} of {len(plan)} unchanged requirement sections"
+        elif count > GENERATION_BATCH_SIZE:
+            # Page through large counts in batches that fit the token limit
+            gen = generate_paged(
+                requirements_text, count, test_type, model_id, temperature=temperature, use_cache=use_cache,
+                on_batch_done=lambda done, total: job.update(progress=done / total, message=f"Generated {done}/{total} batches"),
+                output_format=output_format
+            )
+        else:
+            gen_kwargs = dict(
+                prompt=build_generate_prompt(requirements_text, count, test_type, output_format),
+                model_id=model_id,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                use_cache=use_cache
+            )
+            if use_streaming:
+                # Publish each case as soon as its block closes
+                parser = make_parser(test_type, output_format)
+                pieces = []
+                started = time.perf_counter()
+                first_case_at = None
+                parse_seconds = 0.0
+                details = {}
+                for piece in stream_bedrock_model(**gen_kwargs, details=details):
+                    pieces.append(piece)
+                    parse_started = time.perf_counter()
+                    new_cases = parser.feed(piece)
+                    parse_seconds += time.perf_counter() - parse_started
+                    if new_cases:
+                        if first_case_at is None:
+                            first_case_at = time.perf_counter() - started
+                        job.update(progress=len(parser.cases) / max(count, 1), partial_cases=parser.cases)
+                parser.close()
+                add_span("parse", parse_seconds)
+                gen = "".join(pieces)
+                cases = parser.cases
+                record_usage(model_id, test_type, output_format, gen_kwargs["prompt"], details)
+                if details.get("truncated"):
+                    # Hit max_tokens: keep the complete cases and generate the rest
+                    job.update(message="Output hit the token limit, continuing")
+                    gen = continue_truncated(gen, requirements_text, count, test_type, model_id, temperature, use_cache,
+                                             output_format)
+                    cases = None
+                if first_case_at is not None:
+                    note = f"First test case after {first_case_at:.1f}s, all {len(parser.cases)} after {time.perf_counter() - started:.1f}s"
+                if getattr(parser, "rejected", 0):
+                    # JSON mode: objects that failed to decode or lacked required fields
+                    note = f"{note or ''} ({parser.rejected} malformed case(s) skipped)".strip()
+            else:
+                result = call_bedrock_model(**gen_kwargs, return_details=True)
+                gen = result["text"]
+                record_usage(model_id, test_type, output_format, gen_kwargs["prompt"], result)
+                if result["truncated"]:
+                    gen = continue_truncated(gen, requirements_text, count, test_type, model_id, temperature, use_cache,
+                                             output_format)
+    if cases is None:
+        # Parsed here so the script thread only builds the tables
+        with span("parse"):
+            cases = parse_store(gen, test_type, output_format)
+    elapsed = time.time() - job.started
+    metrics.observe("generation_seconds", elapsed, test_type=test_type)
+    log_event("generation", session=job.session_id, job=job.id, model=model_id, test_type=test_type,
+              output_format=output_format, requested=count, generated=len(cases), chars=len(gen), max_tokens=max_tokens,
+              sections=len(plan) if plan else len(sections), reused_sections=reused, wall_ms=round(elapsed * 1000))
+    return {"estimation": estimation, "generated": gen, "test_type": test_type, "output_format": output_format,
+            "cases": cases, "note": note, "plan": plan}
+
+
+def load_job_result(job):
+    """Show a finished job's output as the current generation."""
+    result = job.result
+    st.session_state.estimation = result["estimation"]
+    st.session_state.generated_cases = result["generated"]
+    st.session_state.generation_id = job.id
+    st.session_state.generation_note = result["note"]
+    st.session_state.generation_trace = result["trace"]
+    st.session_state.generation_format = result["output_format"]
+    if result["plan"]:
+        st.session_state.generation_plan = result["plan"]
+    st.session_state.parsed_results = {result["test_type"]: result["cases"]}
 
 
-def parse_test_cases_to_rows(ai_output: str):
-    """
-    Parse AI output into structured test cases with steps as separate rows.
-    """
-    test_cases = []
-    current_id = None
-    current_title = None
-    current_preconditions = None
-    current_expected = None
-    current_priority = None
-    current_tags = None
-
-    for block in ai_output.strip().split("\n\n"):
-        lines = block.strip().split("\n")
-        steps = []
-        for line in lines:
-            if line.lower().startswith("tc-") or line.lower().startswith("id:"):  # Match TC-001 or just a number
-                ##current_id = line.split(":", 1)[1].strip()
-                current_id = line.strip().removeprefix("ID:").strip()
-            elif line.lower().startswith("title:"):
-                current_title = line.split(":", 1)[1].strip()
-            elif line.lower().startswith("preconditions:"):
-                current_preconditions = line.split(":", 1)[1].strip()
-            elif line.lower().startswith("expected result:"):
-                current_expected = line.split(":", 1)[1].strip()
-            elif line.lower().startswith("priority:"):
-                current_priority = line.split(":", 1)[1].strip()
-            elif line.lower().startswith("tags:"):
-                current_tags = line.split(":", 1)[1].strip()
-            elif re.match(r"^\d+[\).]", line.strip()):  # e.g., "1. " or "2) "
-                steps.append(line.strip())
-
-        for idx, step in enumerate(steps, start=1):
-            test_cases.append({
-                "ID": current_id,
-                "Title": current_title,
-                "Preconditions": current_preconditions,
-                "Step": f"{idx}. {step.split('.', 1)[1].strip()}" if '.' in step else step,
-                "Expected Result": current_expected,
-                "Priority": current_priority,
-                "Tags": current_tags
-            })
-
-    return pd.DataFrame(test_cases)
-
-
-def export_test_cases_excel(df: pd.DataFrame, filename="test_cases.xlsx"):
-    df.to_excel(filename, index=False)
-    return filename
-
 ######Sidebar Style#######
 st.markdown(
     """
@@ -117,8 +227,29 @@ if "generated_cases" not in st.session_state:
     st.session_state.generated_cases = None
 if "estimation" not in st.session_state:
     st.session_state.estimation = None
+if "generation_id" not in st.session_state:
+    st.session_state.generation_id = None
+if "parsed_results" not in st.session_state:
+    st.session_state.parsed_results = {}
 if "req_token_count" not in st.session_state:
     st.session_state.req_token_count = 0    
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if "active_job_id" not in st.session_state:
+    st.session_state.active_job_id = None
+if "job_error" not in st.session_state:
+    st.session_state.job_error = None
+if "generation_note" not in st.session_state:
+    st.session_state.generation_note = None
+if "generation_trace" not in st.session_state:
+    st.session_state.generation_trace = None
+if "generation_format" not in st.session_state:
+    st.session_state.generation_format = "text"
+if "generation_plan" not in st.session_state:
+    st.session_state.generation_plan = None
+
+# Stage spans for this script run (upload extraction here, the rest in the job)
+run_trace = start_trace("run", enabled=st.session_state.get("trace_stages", TRACE_STAGES))
 # if "count_override" not in st.session_state:
 #     st.session_state.count_override = 10
 
@@ -145,11 +276,15 @@ requirements_text = ""
 if source == "Paste text":
     requirements_text = st.text_area("Paste requirements here", height=240, placeholder="Paste product/feature requirements...")
 else:
-    up = st.file_uploader("Upload (txt, pdf, docx)", type=["txt", "pdf", "docx"])
+    upload_types = [ext.lstrip(".") for ext in supported_extensions()]
+    up = st.file_uploader(f"Upload ({', '.join(upload_types)})", type=upload_types)
+    pdf_pages = None
+    if up and up.name.lower().endswith(".pdf"):
+        pdf_pages = st.text_input("PDF pages", placeholder="All pages (e.g. 1-20, 25)",
+                                  help="Only extract these pages, e.g. to skip appendices.")
     if up:
         try:
-            requirements_text = read_uploaded_file(up)
-            st.session_state.req_token_count = count_tokens(requirements_text)
+            requirements_text, st.session_state.req_token_count = extract_uploaded_file(up, pdf_pages)
         except Exception as e:
             st.error(f"Failed to read file: {e}")
         st.text_area("Preview", value=requirements_text, height=200)
@@ -201,26 +336,89 @@ with colC:
 ### Side Bar Config
 test_type = st.sidebar.selectbox("**Test Case Format**", ["Traditional", "BDD"])
 
+output_format = st.sidebar.selectbox("Output Mode", ["text", "json"],
+                                format_func=lambda mode: {"text": "Text", "json": "Structured JSON"}[mode],
+                                help="Structured JSON asks for a JSON array of test cases and validates each "
+                                     "case as it streams in, instead of parsing free text.")
+
 # use_two_step = st.sidebar.checkbox("$\\textsf{\\scriptsize Let AI Estimate the TC Count}$", value=True,
 #                                 help="First estimate the optimal number of cases, then generate.")
 
-use_two_step = st.sidebar.checkbox("Let AI Estimate the TC Count", value=True,
+use_two_step = st.sidebar.checkbox("Estimate the TC Count", value=True,
                                 help="First estimate the optimal number of cases, then generate.")
 
+estimator = st.sidebar.selectbox("Estimator", ["AI (Bedrock)", "Local (instant)"], disabled=not use_two_step,
+                                help="Local derives the count from the requirement structure without a model call.")
+
+use_streaming = st.sidebar.checkbox("Stream Results", value=True,
+                                help="Show each test case as soon as the model finishes writing it.")
+
+bypass_cache = st.sidebar.checkbox("Bypass Response Cache", value=False,
+                                help="Always call the model, even if the same request was answered before.")
+
+use_chunking = st.sidebar.checkbox("Chunk Large Documents", value=True,
+                                help="Split long requirements into sections and generate them in parallel.")
+
+st.sidebar.checkbox("Trace Stages", value=TRACE_STAGES, key="trace_stages",
+                    help="Time each pipeline stage and show a breakdown that is saved with the exports.")
+
 st.sidebar.number_input("Required Test Case Count",help="Manual count (if not using estimate or to override)", disabled=use_two_step,
                 min_value=1, max_value=500, value=10, key="count_override") ###"Manual count (if not using estimate or to override)",
 
 # Display token info dynamically
 req_tokens = st.session_state.req_token_count ###count_tokens(st.session_state.get("requirement_text", ""), selected_model)
-output_tokens_est = estimate_tokens_per_tc(st.session_state.selected_model) * st.session_state.get("count_override")
-total_tokens_est = req_tokens + output_tokens_est + 200  # buffer
+# Calibrated to the selected model once its usage has been seen; the GPT-4 tokenizer count until then
+req_tokens = get_token_stats().input_tokens(st.session_state.selected_model, len(requirements_text)) or req_tokens
+output_tokens_est = output_token_budget(st.session_state.selected_model, test_type, output_format,
+                                        st.session_state.get("count_override"))
+total_tokens_est = req_tokens + output_tokens_est
 # st.sidebar.write(f"$\\textsf{{\\scriptsize Requirement Tokens: {req_tokens}}}$")
 # st.sidebar.write(f"$\\textsf{{\\scriptsize Estimated Output Tokens: {output_tokens_est}}}$")
 # st.sidebar.write(f"$\\textsf{{\\scriptsize Total Estimated Tokens: {total_tokens_est}}}$")
 st.sidebar.write(f"Requirement Tokens: {req_tokens}")
-st.sidebar.write(f"Estimated Output Tokens: {output_tokens_est}")
+per_case = get_token_stats().tokens_per_case(st.session_state.selected_model, test_type, output_format)
+st.sidebar.write(f"Estimated Output Tokens: {output_tokens_est}"
+                 + (f" (learned, ~{per_case:.0f} per case)" if per_case else ""))
 st.sidebar.write(f"Total Estimated Tokens: {total_tokens_est}")
 
+response_cache = get_response_cache()
+if response_cache is not None:
+    cache_stats = response_cache.stats()
+    st.sidebar.write(f"Response Cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                     f"({cache_stats['hit_rate']:.0%}), {cache_stats['entries']} entries")
+
+limits = get_rate_limiter(st.session_state.selected_model).status()
+st.sidebar.write(f"Rate Limit: {limits['rpm']:g} req/min, {limits['tpm']} tokens/min "
+                 f"({limits['scale']:.0%} of quota), {limits['queue_depth']} queued, "
+                 f"{limits['throttled']} throttled")
+sched = get_scheduler().status(st.session_state.session_id)
+st.sidebar.write(f"Model Calls: {sched['running']}/{sched['limit']} running, {sched['waiting']} queued "
+                 f"across {sched['sessions']} session(s)")
+routing = get_router(st.session_state.selected_model).status()
+if len(routing["targets"]) > 1 or routing["hedged"]:
+    regions = ", ".join(f"{t['name'].split('/')[0]} ({'up' if t['healthy'] else 'down'})" for t in routing["targets"])
+    st.sidebar.write(f"Routing: {regions}; {routing['hedged']} of {routing['calls']} calls hedged "
+                     f"({routing['hedge_wins']} won by the hedge)")
+
+usage = session_summary(st.session_state.session_id)
+if usage:
+    with st.sidebar.expander("Session Telemetry"):
+        latency, ttft = usage["latency"], usage["ttft"]
+        st.write(f"Calls: {usage['calls']} ({usage['cache_hits']} cached, {usage['retries']} retries, "
+                 f"{usage['errors']} errors)")
+        st.write(f"Tokens: {usage['input_tokens']:,} in / {usage['output_tokens']:,} out")
+        st.write(f"Estimated cost: ${usage['cost_usd']:.4f}")
+        if usage["cache_read_tokens"] or usage["cache_write_tokens"]:
+            st.write(f"Prompt cache: {usage['cache_read_tokens']:,} tokens read / "
+                     f"{usage['cache_write_tokens']:,} written (saved ${usage['cache_saved_usd']:.4f})")
+        if latency["count"]:
+            st.write(f"Latency p50/p95/p99: {latency['p50']:.1f}s / {latency['p95']:.1f}s / {latency['p99']:.1f}s")
+        if ttft["count"]:
+            st.write(f"First token p50/p95: {ttft['p50']:.1f}s / {ttft['p95']:.1f}s")
+        clients = client_stats()
+        st.write(f"Bedrock clients: {clients['cached']} pooled ({clients['max_pool_connections']} connections each), "
+                 f"{clients['created']} created / {clients['reused']} reused")
+
 # go = st.button("🚀 Generate Test Cases", use_container_width=True)
 # reset = st.button("♻️ Reset", use_container_width=True)
 
@@ -233,52 +431,83 @@ st.sidebar.write(f"Total Estimated Tokens: {total_tokens_est}")
 if reset:
     st.session_state.generated_cases = None
     st.session_state.estimation = None
+    st.session_state.generation_id = None
+    st.session_state.generation_note = None
+    st.session_state.generation_trace = None
+    st.session_state.generation_plan = None
+    st.session_state.parsed_results = {}
+    st.session_state.job_error = None
 
 # ---- Action ----
+jobs = get_job_store()
 if go:
     if not requirements_text.strip():
         st.error("Please provide requirements text or upload a document.")
     else:
-        try:
-            # Step 1: estimate count
-            max_tokens_total = min(total_tokens_est, 8000)
-            st.session_state.max_tokens = max_tokens_total
-            if use_two_step:
-                est_prompt = ESTIMATE_PROMPT.format(requirements=requirements_text)
-
-                est = call_bedrock_model(
-                    prompt=est_prompt,
-                    model_id=st.session_state.get("selected_model", os.getenv("BEDROCK_MODEL_ID_INSTANT", "anthropic.claude-3-sonnet-20240229-v1:0")),
-                    max_tokens=max_tokens_total,
-                    temperature=0.0
-                )
-                st.session_state.estimation = est
-                m = re.search(r'number:\s*(\d+)', est, re.IGNORECASE)
-                count = int(m.group(1)) if m else st.session_state.get("count_override")
-            else:
-                count = st.session_state.get("count_override")
-
-            # Step 2: generate
-            fmt_inst = FORMAT_INSTRUCTIONS["traditional"] if test_type == "Traditional" else FORMAT_INSTRUCTIONS["bdd"]
-            gen_prompt = GENERATE_PROMPT.format(
-                count=count,
-                format=test_type.upper(),
-                requirements=requirements_text,
-                format_instructions=fmt_inst
-            )
-            gen = call_bedrock_model(
-                prompt=gen_prompt,
-                model_id=st.session_state.get("selected_model", os.getenv("BEDROCK_MODEL_ID_SONNET", "anthropic.claude-3-sonnet-20240229-v1:0")),
-                max_tokens=st.session_state.get("max_tokens", 8000),
-                temperature=st.session_state.get("temperature", 0.0)
-            )
-            print(f'-------------max_tokens {st.session_state.max_tokens}--------------------------')
-            print(gen)
-            print('---------------------------------------')
-            st.session_state.generated_cases = gen
-            st.session_state.generated_cases_df = parse_test_cases_to_rows(gen)
-        except Exception as e:
-            st.error(f"Error during generation: {e}")
+        # Runs on the job pool; earlier results stay on screen until it finishes
+        job = jobs.submit(
+            st.session_state.session_id,
+            f"{test_type} test cases from {len(requirements_text):,} characters of requirements",
+            run_generation,
+            requirements_text=requirements_text,
+            test_type=test_type,
+            model_id=st.session_state.get("selected_model", os.getenv("BEDROCK_MODEL_ID_SONNET", "anthropic.claude-3-sonnet-20240229-v1:0")),
+            temperature=st.session_state.get("temperature", 0.0),
+            use_two_step=use_two_step,
+            local_estimate=estimator.startswith("Local"),
+            count_override=st.session_state.get("count_override"),
+            use_streaming=use_streaming,
+            use_chunking=use_chunking,
+            use_cache=not bypass_cache,
+            output_format=output_format,
+            previous_plan=st.session_state.generation_plan,
+            trace=run_trace,
+        )
+        st.session_state.active_job_id = job.id
+        st.session_state.job_error = None
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_monitor():
+    # Polls the active job; only this fragment reruns while it is working
+    job = jobs.get(st.session_state.active_job_id)
+    if job is None:
+        st.session_state.active_job_id = None
+        return
+    snap = job.snapshot()
+    if snap["status"] in (QUEUED, RUNNING):
+        st.progress(snap["progress"], text=f"{snap['message']} ({snap['elapsed']:.0f}s)")
+        if snap["partial_cases"]:
+            partial_df = snap["partial_cases"].cases_frame()
+            st.caption(f"Generated {len(partial_df)} test case(s) so far...")
+            st.dataframe(partial_df, use_container_width=True)
+        if st.button("Cancel generation", key=f"cancel_{job.id}"):
+            job.cancel()
+        return
+    st.session_state.active_job_id = None
+    if snap["status"] == DONE:
+        load_job_result(job)
+    elif snap["status"] == FAILED:
+        st.session_state.job_error = snap["error"]
+    st.rerun(scope="app")
+
+
+if st.session_state.active_job_id:
+    job_monitor()
+if st.session_state.job_error:
+    st.error(f"Error during generation: {st.session_state.job_error}")
+
+session_jobs = jobs.for_session(st.session_state.session_id)
+if len(session_jobs) > 1:
+    with st.expander(f"Background Jobs ({len(session_jobs)})"):
+        for job in session_jobs:
+            snap = job.snapshot()
+            c1, c2 = st.columns([5, 1])
+            c1.write(f"{snap['label']}: **{snap['status']}** ({snap['message']}, {snap['elapsed']:.0f}s)")
+            if snap["status"] == DONE and job.id != st.session_state.generation_id:
+                if c2.button("Show", key=f"show_{job.id}"):
+                    load_job_result(job)
+                    st.rerun()
 
 st.markdown("---")
 
@@ -298,92 +527,9 @@ if st.session_state.generated_cases:
     #     title = p.splitlines()[0][:120] if p.splitlines() else f"Case {i}"
     #     rows.append({"ID": f"TC-{i:03d}", "Title": title, "Details": p})
     # df = pd.DataFrame(rows) if rows else pd.DataFrame([{"ID":"TC-001","Title":"Generated Test Case","Details": st.session_state.generated_cases}])
-################
-    rows = []
-    parts = [p.strip() for p in st.session_state.generated_cases.split('\n\n')]
-    parts = [p for p in parts if p]
-    tc_counter = 1  # Initialize test case counter
-    for i, p in enumerate(parts, 1):
-        if test_type == 'Traditional':
-            # Parse traditional test case format
-            title = ""
-            preconditions = ""
-            steps = []
-            expected = ""
-            collecting_steps = False
-            collecting_expected = False
-            for line in p.split('\n'):
-                line_lower = line.lower().strip()
-                if line_lower.startswith("title:"):
-                    title = line.split(":", 1)[1].strip()
-                    collecting_steps = False
-                    collecting_expected = False
-                elif line_lower.startswith("preconditions:"):
-                    preconditions = line.split(":", 1)[1].strip()
-                    collecting_steps = False
-                    collecting_expected = False
-                elif line_lower.startswith("steps:"):
-                    collecting_steps = True
-                    collecting_expected = False
-                elif line_lower.startswith("expected result:"):
-                    collecting_steps = False
-                    collecting_expected = True
-                    expected = line.split(":", 1)[1].strip()
-                elif collecting_steps:
-                    if line.strip():
-                        steps.append(line.strip())
-                elif collecting_expected:
-                    if line.strip():  # skip empty lines
-                        expected += "\n" + line.strip()
-            # Only add non-empty test cases
-            if title or steps or expected:    
-                rows.append({
-                    'ID': f'TC-{tc_counter:03d}', 
-                    'Title': title,
-                    'Preconditions': preconditions,
-                    'Steps': "\n".join(steps),
-                    'Expected Results': expected
-                })
-                tc_counter += 1  # Increment counter for each test case
-            
-        else: #BDD
-            # Parse title, scenario
-            scenario = ""
-            preconditions = ""
-            description = []
-            found_scenario = False
-            for line in p.split('\n'):
-                line_stripped = line.strip()
-                line_lower = line_stripped.lower()  # <-- Add this line
-
-                # Find the scenario line
-                if 'scenario:' in line_stripped.lower():
-                    # Extract scenario name after '**Scenario:**'
-                    scenario = line_stripped.split('Scenario:', 1)[1].strip()
-                    found_scenario = True
-                # Match both "**Preconditions:**" and "Preconditions:"
-                precond_match = re.search(r"(?:- )?\*\*precondition[s]?:\*\*|precondition[s]?:", line_lower)
-                if precond_match:
-                    preconditions = line_stripped.split(":", 1)[1].strip()
-                elif found_scenario:
-                    # Only add lines that are NOT preconditions
-                    if line_stripped and not re.search(r"(?:- )?\*\*precondition[s]?:\*\*|precondition[s]?", line_lower):
-                        description.append(line_stripped)
-            # Only add non-empty BDD test cases
-            if scenario or description:
-                rows.append({
-                    'ID': f'TC-{tc_counter:03d}',
-                    'Scenario': scenario,
-                    'Preconditions': preconditions,
-                    'Description': "\n".join(description)  # Use space to keep all in one line
-                })
-                tc_counter += 1  # Increment counter for each test case
-            
-    # Create DataFrame after processing all cases
-    if test_type == 'Traditional':
-        df = pd.DataFrame(rows, columns=['ID', 'Title', 'Preconditions','Steps', 'Expected Results'])
-    else:
-        df = pd.DataFrame(rows, columns=['ID', 'Scenario', 'Preconditions','Description'])
+    # Parsed when generation finished; only a format change triggers a re-parse
+    cases = get_parsed_cases(test_type)
+    df = cases.cases_frame()
 
 ################
 
@@ -393,36 +539,46 @@ if st.session_state.generated_cases:
 
     st.subheader("Test Cases")
     st.dataframe(df, use_container_width=True)
+    if st.session_state.generation_note:
+        st.caption(st.session_state.generation_note)
 
-    # Downloads
-    csv_bytes = df.to_csv(index=False).encode("utf-8")
-    excel_buf = io.BytesIO()
-    with pd.ExcelWriter(excel_buf, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="TestCases")
-
-
+    # Downloads are built on first click and memoized per generation
+    gen_id = st.session_state.generation_id
+    trace = st.session_state.generation_trace
+    timing_sheets = {"Timing": trace.frame()} if trace else None
     c1, c2, c3 = st.columns(3)
     with c1:
-        st.download_button("⬇️ Download CSV", data=csv_bytes, file_name="testcases.csv", mime="text/csv", use_container_width=True)
+        st.download_button("⬇️ Download CSV",
+                        data=lambda: get_export(gen_id, test_type, "csv", traced("export.csv", lambda: csv_bytes(df), trace)),
+                        file_name="testcases.csv", mime="text/csv", on_click="ignore", use_container_width=True)
     with c2:
-        st.download_button("⬇️ Download Excel", data=excel_buf.getvalue(), file_name="testcases.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
-        # excel_file = export_test_cases_excel(st.session_state.generated_cases_df)
-        # with open(excel_file, "rb") as f:
-        #     st.download_button("Download ExcelX1", f, file_name="test_cases.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        st.download_button("⬇️ Download Excel",
+                        data=lambda: get_export(gen_id, test_type, "xlsx", traced("export.xlsx", lambda: xlsx_bytes(df, extra_sheets=timing_sheets), trace)),
+                        file_name="testcases.xlsx", mime=XLSX_MIME, on_click="ignore", use_container_width=True)
 
     with c3:
-        st.download_button("⬇️ Download TXT", data=st.session_state.generated_cases, file_name="testcases.txt",
-                        mime="text/plain", use_container_width=True)
+        raw_json = st.session_state.generation_format == "json"
+        st.download_button("⬇️ Download JSON" if raw_json else "⬇️ Download TXT", data=txt_bytes(st.session_state.generated_cases),
+                        file_name="testcases.json" if raw_json else "testcases.txt",
+                        mime="application/json" if raw_json else "text/plain", on_click="ignore", use_container_width=True)
     
     
 ###########
     if test_type != 'BDD':
         st.subheader("Test Cases with Steps as Rows")
-        if "generated_cases_df" in st.session_state and st.session_state.generated_cases_df is not None:
-            st.dataframe(st.session_state.generated_cases_df)
-
-            excel_file = export_test_cases_excel(st.session_state.generated_cases_df)
-            with open(excel_file, "rb") as f:
-                st.download_button("Download as Excel", f, file_name="test_case_steps.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-
+        steps_df = cases.steps_frame()
+        if not steps_df.empty:
+            st.dataframe(steps_df)
+
+            st.download_button("Download as Excel",
+                               data=lambda: get_export(gen_id, "steps", "xlsx", traced("export.steps_xlsx", lambda: xlsx_bytes(steps_df, "TestSteps", timing_sheets), trace)),
+                               file_name="test_case_steps.xlsx", mime=XLSX_MIME, on_click="ignore")
+
+    if trace:
+        with st.expander("Stage Timings"):
+            timing_df = trace.frame()
+            st.dataframe(timing_df, use_container_width=True, hide_index=True)
+            if trace.profile_path:
+                st.caption(f"cProfile stats: {trace.profile_path}")
+            st.download_button("Download Timings (CSV)", data=csv_bytes(timing_df), file_name="stage_timings.csv",
+                               mime="text/csv", on_click="ignore")
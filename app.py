@@ -3,6 +3,7 @@ import pandas as pd
 import io
 from bedrock_client import call_bedrock_model
 from file_utils import read_uploaded_file
+from parsers import parse_cases, TRADITIONAL_COLUMNS, BDD_COLUMNS
 from prompts import ESTIMATE_PROMPT, GENERATE_PROMPT, FORMAT_INSTRUCTIONS
 
 def main():
@@ -73,92 +74,11 @@ def main():
         st.subheader('Generated Test Cases')
         st.text_area('Raw', value=st.session_state.generated_cases, height=400)
 
-        rows = []
-        parts = [p.strip() for p in st.session_state.generated_cases.split('\n\n')]
-        parts = [p for p in parts if p]
-        tc_counter = 1  # Initialize test case counter
-        for i, p in enumerate(parts, 1):
-            if test_type == 'Traditional':
-                # Parse traditional test case format
-                title = ""
-                preconditions = ""
-                steps = []
-                expected = ""
-                collecting_steps = False
-                collecting_expected = False
-                for line in p.split('\n'):
-                    line_lower = line.lower().strip()
-                    if line_lower.startswith("title:"):
-                        title = line.split(":", 1)[1].strip()
-                        collecting_steps = False
-                        collecting_expected = False
-                    elif line_lower.startswith("preconditions:"):
-                        preconditions = line.split(":", 1)[1].strip()
-                        collecting_steps = False
-                        collecting_expected = False
-                    elif line_lower.startswith("steps:"):
-                        collecting_steps = True
-                        collecting_expected = False
-                    elif line_lower.startswith("expected result:"):
-                        collecting_steps = False
-                        collecting_expected = True
-                        expected = line.split(":", 1)[1].strip()
-                    elif collecting_steps:
-                        if line.strip():
-                            steps.append(line.strip())
-                    elif collecting_expected:
-                        if line.strip():  # skip empty lines
-                            expected += "\n" + line.strip()
-                # Only add non-empty test cases
-                if title or steps or expected:    
-                    rows.append({
-                        'ID': f'TC-{tc_counter:03d}', 
-                        'Title': title,
-                        'Preconditions': preconditions,
-                        'Steps': "\n".join(steps),
-                        'Expected Results': expected
-                    })
-                    tc_counter += 1  # Increment counter for each test case
-                
-            else: #BDD
-                # Parse title, scenario
-                scenario = ""
-                preconditions = ""
-                description = []
-                found_scenario = False
-                for line in p.split('\n'):
-                    line_stripped = line.strip()
-                    line_lower = line_stripped.lower()  # <-- Add this line
-
-                    # Find the scenario line
-                    if '**scenario:**' in line_stripped.lower():
-                        # Extract scenario name after '**Scenario:**'
-                        scenario = line_stripped.split('**Scenario:**', 1)[1].strip()
-                        found_scenario = True
-                    # Match both "**Preconditions:**" and "Preconditions:"
-                    import re
-                    precond_match = re.search(r"(?:- )?\*\*precondition[s]?:\*\*|precondition[s]?:", line_lower)
-                    if precond_match:
-                        preconditions = line_stripped.split(":", 1)[1].strip()
-                    elif found_scenario:
-                        # Only add lines that are NOT preconditions
-                        if line_stripped and not re.search(r"(?:- )?\*\*precondition[s]?:\*\*|precondition[s]?:", line_lower):
-                            description.append(line_stripped)
-                # Only add non-empty BDD test cases
-                if scenario or description:
-                    rows.append({
-                        'ID': f'TC-{tc_counter:03d}',
-                        'Scenario': scenario,
-                        'Preconditions': preconditions,
-                        'Description': "\n".join(description)  # Use space to keep all in one line
-                    })
-                    tc_counter += 1  # Increment counter for each test case
-                
-        # Create DataFrame after processing all cases
+        rows = parse_cases(st.session_state.generated_cases, test_type)
         if test_type == 'Traditional':
-            df = pd.DataFrame(rows, columns=['ID', 'Title', 'Preconditions','Steps', 'Expected Results'])
+            df = pd.DataFrame(rows, columns=TRADITIONAL_COLUMNS)
         else:
-            df = pd.DataFrame(rows, columns=['ID', 'Scenario', 'Preconditions','Description'])
+            df = pd.DataFrame(rows, columns=BDD_COLUMNS)
 
         st.dataframe(df)
 
@@ -0,0 +1,221 @@
+"""
+Headless batch generation over a directory or glob of requirement files.
+
+    python batch_cli.py specs/ --out results/ --format Traditional --estimate
+    python batch_cli.py "specs/**/*.pdf" --out results/ --count 25 --concurrency 4
+
+Writes <stem>.csv, <stem>.xlsx and <stem>.txt (<stem>.json with --output json)
+per input plus manifest.json and metrics.json (call latency/token percentiles
+and estimated cost).
+Inputs already recorded as done (same content hash, format, output mode and
+model, outputs present) are skipped, so an interrupted run can simply be started again. With --chunked,
+an edited file only regenerates its changed sections; the rest reuse their
+stored cases and keep their TC ids.
+"""
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from bedrock_client import call_bedrock_model, client_stats
+from estimator import estimate_case_count, format_local_estimate
+from exports import txt_bytes, xlsx_bytes
+from file_utils import read_uploaded_file, supported_extensions
+from generation import build_estimate_prompt, generate_incremental, generate_paged, parse_estimated_count
+from parsers import parse_store
+from telemetry import metrics
+
+SUPPORTED_EXTENSIONS = tuple(supported_extensions())
+DEFAULT_MODEL = os.getenv("BEDROCK_MODEL_ID_SONNET", "anthropic.claude-3-sonnet-20240229-v1:0")
+MANIFEST_NAME = "manifest.json"
+
+
+def collect_inputs(target: str, recursive: bool = False) -> list:
+    if os.path.isdir(target):
+        pattern = os.path.join(target, "**", "*") if recursive else os.path.join(target, "*")
+        paths = glob.glob(pattern, recursive=recursive)
+    else:
+        paths = glob.glob(target, recursive=True)
+    return sorted(p for p in paths if os.path.isfile(p) and p.lower().endswith(SUPPORTED_EXTENSIONS))
+
+
+def extract_file(path: str):
+    """Runs in a worker process: returns (path, sha256, text)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    # read_uploaded_file expects an upload-like object with a name
+    upload = io.BytesIO(data)
+    upload.name = os.path.basename(path)
+    return path, hashlib.sha256(data).hexdigest(), read_uploaded_file(upload)
+
+
+def output_stem(path: str, root: str) -> str:
+    base = root if os.path.isdir(root) else os.path.dirname(root.split("*", 1)[0]) or "."
+    rel = os.path.relpath(path, base)
+    return os.path.splitext(rel)[0].replace(os.sep, "__")
+
+
+def load_manifest(out_dir: str) -> dict:
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return {entry["source"]: entry for entry in json.load(f)["inputs"]}
+
+
+def save_manifest(out_dir: str, entries: dict):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"updated": time.strftime("%Y-%m-%dT%H:%M:%S"), "inputs": sorted(entries.values(), key=lambda e: e["source"])},
+                  f, indent=2)
+    os.replace(tmp, path)
+
+
+def run_settings(args) -> dict:
+    """Every option that changes what is generated for an input."""
+    return {"format": args.format, "output": args.output, "model": args.model, "temperature": args.temperature,
+            "count": args.count, "estimate": args.estimate, "chunked": args.chunked}
+
+
+def is_done(entry, sha256: str, args) -> bool:
+    """Whether an input was already generated from the same content with the same settings."""
+    return bool(entry) and entry.get("status") == "done" and entry.get("sha256") == sha256 \
+        and entry.get("settings") == run_settings(args) and all(os.path.exists(p) for p in entry.get("outputs", []))
+
+
+def generate_for_text(text: str, args, previous_plan: list = None) -> tuple:
+    estimation = None
+    count = args.count
+    if args.estimate == "local":
+        count, signals = estimate_case_count(text)
+        estimation = format_local_estimate(count, signals)
+    elif args.estimate:
+        estimation = call_bedrock_model(
+            prompt=build_estimate_prompt(text),
+            model_id=args.model,
+            max_tokens=1000,
+            temperature=0.0,
+            use_cache=not args.no_cache
+        )
+        count = parse_estimated_count(estimation) or args.count
+    plan = None
+    if args.chunked:
+        # Sections unchanged since the file's last run reuse their stored cases and ids
+        gen, plan, _ = generate_incremental(text, count, args.format, args.model, temperature=args.temperature,
+                                            use_cache=not args.no_cache, output_format=args.output,
+                                            previous_plan=previous_plan)
+    else:
+        # Files already run concurrently, so batches within a file run in order
+        gen = generate_paged(text, count, args.format, args.model, temperature=args.temperature,
+                             max_workers=1, use_cache=not args.no_cache, output_format=args.output)
+    return count, estimation, gen, plan
+
+
+def write_outputs(gen: str, stem: str, args) -> tuple:
+    cases = parse_store(gen, args.format, args.output)
+    df = cases.cases_frame()
+    target = os.path.join(args.out, stem)
+    outputs = [target + ".csv", target + ".xlsx", target + (".json" if args.output == "json" else ".txt")]
+    df.to_csv(outputs[0], index=False)
+    # Same workbook layout as the app's Excel download
+    with open(outputs[1], "wb") as f:
+        f.write(xlsx_bytes(df))
+    with open(outputs[2], "wb") as f:
+        f.write(txt_bytes(gen))
+    return len(cases), outputs
+
+
+def run(args) -> int:
+    paths = collect_inputs(args.input, args.recursive)
+    if not paths:
+        print(f"No {', '.join(SUPPORTED_EXTENSIONS)} files match {args.input}", file=sys.stderr)
+        return 1
+    os.makedirs(args.out, exist_ok=True)
+    manifest = load_manifest(args.out)
+    manifest_lock = threading.Lock()
+
+    def _record(entry):
+        with manifest_lock:
+            manifest[entry["source"]] = entry
+            save_manifest(args.out, manifest)
+            print(f"[{entry['status']}] {entry['source']} ({entry['seconds']}s)", flush=True)
+
+    def _process(path, sha256, text):
+        started = time.perf_counter()
+        entry = {"source": path, "sha256": sha256, "settings": run_settings(args)}
+        previous_plan = (manifest.get(path) or {}).get("sections")
+        try:
+            if not text.strip():
+                raise ValueError("no text could be extracted")
+            count, estimation, gen, plan = generate_for_text(text, args, previous_plan)
+            cases, outputs = write_outputs(gen, output_stem(path, args.input), args)
+            # e.g. the .txt of a text-mode run once the file is regenerated as JSON
+            for stale in set((manifest.get(path) or {}).get("outputs", [])) - set(outputs):
+                if os.path.exists(stale):
+                    os.remove(stale)
+            entry.update(status="done", requested=count, cases=cases, outputs=outputs, estimation=estimation)
+            if plan:
+                entry["sections"] = plan
+        except Exception as e:
+            entry.update(status="failed", error=str(e))
+            if previous_plan:
+                entry["sections"] = previous_plan
+        entry["seconds"] = round(time.perf_counter() - started, 2)
+        _record(entry)
+        return entry
+
+    skipped = 0
+    results = []
+    # Extraction is CPU bound (pdfplumber/docx), model calls are I/O bound
+    with ProcessPoolExecutor(max_workers=args.workers) as extract_pool, \
+            ThreadPoolExecutor(max_workers=args.concurrency) as call_pool:
+        calls = []
+        for future in as_completed([extract_pool.submit(extract_file, p) for p in paths]):
+            try:
+                path, sha256, text = future.result()
+            except Exception as e:
+                print(f"[failed] extraction: {e}", file=sys.stderr)
+                continue
+            if not args.force and is_done(manifest.get(path), sha256, args):
+                skipped += 1
+                continue
+            calls.append(call_pool.submit(_process, path, sha256, text))
+        results = [c.result() for c in calls]
+
+    failed = sum(1 for r in results if r["status"] != "done")
+    # Latency/token percentiles and cost for the run, for tuning max_tokens and concurrency
+    with open(os.path.join(args.out, "metrics.json"), "w", encoding="utf-8") as f:
+        json.dump(dict(metrics.snapshot(), clients=client_stats()), f, indent=2)
+    print(f"{len(results) - failed} generated, {failed} failed, {skipped} skipped (already done)")
+    return 1 if failed else 0
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Generate test cases for a batch of requirement files.")
+    parser.add_argument("input", help="Directory or glob of .txt/.pdf/.docx requirement files")
+    parser.add_argument("--out", default="batch_output", help="Output directory (default: batch_output)")
+    parser.add_argument("--format", choices=["Traditional", "BDD"], default="Traditional")
+    parser.add_argument("--output", choices=["text", "json"], default="text",
+                        help="Model output mode: free text or a structured JSON array (written as <stem>.json)")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--count", type=int, default=10, help="Cases per file (fallback when --estimate fails)")
+    parser.add_argument("--estimate", nargs="?", const="ai", choices=["ai", "local"],
+                        help="Estimate the case count first, with the model (default) or the local rules")
+    parser.add_argument("--chunked", action="store_true", help="Generate large documents section by section")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Extraction processes")
+    parser.add_argument("--concurrency", type=int, default=4, help="Files generated concurrently")
+    parser.add_argument("--recursive", action="store_true", help="Recurse into subdirectories")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache")
+    parser.add_argument("--force", action="store_true", help="Regenerate inputs already marked done")
+    return parser
+
+
+if __name__ == "__main__":
+    sys.exit(run(build_arg_parser().parse_args()))
@@ -1,31 +1,154 @@
 import json
 import os
-import boto3
+import re
+import threading
+import time
+from rate_limiter import estimate_request_tokens, get_rate_limiter
+from response_cache import cache_key, get_response_cache
+from router import get_router, latency_kind
+from scheduler import get_scheduler
+from telemetry import record_call
 
-def call_bedrock_model(prompt: str, model_id: str, max_tokens: int, temperature: float) -> str:
-    region = os.getenv("AWS_REGION", "us-east-1")
-    client = boto3.client('bedrock-runtime', region_name=region)
+# Connection settings for the shared bedrock-runtime clients. Generation calls
+# can run for minutes on large token budgets, so the read timeout is generous.
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.getenv("BEDROCK_MAX_POOL_CONNECTIONS", "25"))
+BEDROCK_CONNECT_TIMEOUT = float(os.getenv("BEDROCK_CONNECT_TIMEOUT", "10"))
+BEDROCK_READ_TIMEOUT = float(os.getenv("BEDROCK_READ_TIMEOUT", "300"))
+BEDROCK_TCP_KEEPALIVE = os.getenv("BEDROCK_TCP_KEEPALIVE", "1") not in ("0", "false", "False")
+# Serve every call from fake_bedrock.FakeBedrockClient (simulated latency, no AWS)
+BEDROCK_FAKE = os.getenv("BEDROCK_FAKE", "0") in ("1", "true", "True")
+# Prompt caching of the leading prompt segments: "auto" marks them on models in
+# BEDROCK_PROMPT_CACHE_MODELS (matched as substrings of the model id), "1" on
+# every Claude messages-API model, "0" never.
+BEDROCK_PROMPT_CACHE = os.getenv("BEDROCK_PROMPT_CACHE", "auto")
+BEDROCK_PROMPT_CACHE_MODELS = [m.strip() for m in os.getenv(
+    "BEDROCK_PROMPT_CACHE_MODELS",
+    "claude-3-5-haiku,claude-3-7-sonnet,claude-sonnet-4,claude-opus-4,claude-haiku-4").split(",") if m.strip()]
 
-    if model_id.startswith("anthropic.claude-3"):
+# Process-wide registry of clients keyed by (region, config). botocore clients are
+# thread-safe once built, so every Streamlit session and worker thread shares them.
+_clients = {}
+_clients_lock = threading.Lock()
+_client_stats = {"created": 0, "reused": 0}
+
+
+def get_bedrock_client(region: str = None, max_pool_connections: int = None,
+                       connect_timeout: float = None, read_timeout: float = None,
+                       tcp_keepalive: bool = None):
+    """Return a cached bedrock-runtime client for the given region and settings."""
+    region = region or os.getenv("AWS_REGION", "us-east-1")
+    key = (
+        region,
+        max_pool_connections or BEDROCK_MAX_POOL_CONNECTIONS,
+        connect_timeout or BEDROCK_CONNECT_TIMEOUT,
+        read_timeout or BEDROCK_READ_TIMEOUT,
+        BEDROCK_TCP_KEEPALIVE if tcp_keepalive is None else tcp_keepalive,
+    )
+    if BEDROCK_FAKE:
+        key = ("fake", region)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            _client_stats["reused"] += 1
+            return client
+        if BEDROCK_FAKE:
+            from fake_bedrock import FakeBedrockClient
+            client = _clients[key] = FakeBedrockClient(region=region)
+            _client_stats["created"] += 1
+            return client
+        # boto3 is imported with the first client, not when the page loads
+        import boto3
+        from botocore.config import Config
+        config = Config(
+            max_pool_connections=key[1],
+            connect_timeout=key[2],
+            read_timeout=key[3],
+            tcp_keepalive=key[4],
+            # Throttling and transient errors are retried by rate_limiter with
+            # backoff and rate adaptation, so botocore makes a single attempt.
+            retries={"total_max_attempts": 1, "mode": "standard"},
+        )
+        # Client creation through the default session is not thread-safe, so
+        # each client gets its own session while the lock is held.
+        client = boto3.session.Session().client("bedrock-runtime", region_name=region, config=config)
+        _clients[key] = client
+        _client_stats["created"] += 1
+        return client
+
+
+def client_stats() -> dict:
+    """Counters for client creation vs. reuse, the number of cached clients and their pool size."""
+    with _clients_lock:
+        return dict(_client_stats, cached=len(_clients), max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS)
+
+
+def reset_clients():
+    with _clients_lock:
+        _clients.clear()
+        _client_stats["created"] = 0
+        _client_stats["reused"] = 0
+
+
+# Cross-region inference profiles prefix the model id, e.g. "us.anthropic..."
+_GEO_PREFIX_RE = re.compile(r"^(?:us|us-gov|eu|apac|jp|au|ca|global)\.")
+
+
+def model_family(model_id: str) -> str:
+    """Request schema of a model: "messages" (Claude 3 and later), "anthropic" (legacy text completions), "titan" or ""."""
+    base = _GEO_PREFIX_RE.sub("", model_id)
+    if base.startswith(("anthropic.claude-v", "anthropic.claude-instant")):
+        return "anthropic"
+    if base.startswith("anthropic.claude"):
+        return "messages"
+    if base.startswith("amazon.titan"):
+        return "titan"
+    return ""
+
+
+def prompt_text(prompt) -> str:
+    """Full text of a prompt given as a string or as a tuple of segments."""
+    return prompt if isinstance(prompt, str) else "".join(prompt)
+
+
+def prompt_caching_enabled(model_id: str) -> bool:
+    if BEDROCK_PROMPT_CACHE in ("0", "false", "False") or model_family(model_id) != "messages":
+        return False
+    return BEDROCK_PROMPT_CACHE != "auto" or any(m in model_id for m in BEDROCK_PROMPT_CACHE_MODELS)
+
+
+def _content_blocks(prompt, model_id: str) -> list:
+    if isinstance(prompt, str) or not prompt_caching_enabled(model_id):
+        return [{"type": "text", "text": prompt_text(prompt)}]
+    # Every segment but the last ends a cache checkpoint (at most 4 per request)
+    segments = [segment for segment in prompt if segment]
+    blocks = [{"type": "text", "text": segment} for segment in segments]
+    for block in blocks[:-1][-4:]:
+        block["cache_control"] = {"type": "ephemeral"}
+    return blocks
+
+
+def build_request_body(prompt, model_id: str, max_tokens: int, temperature: float) -> str:
+    family = model_family(model_id)
+    if family == "messages":
         body = json.dumps({
             "anthropic_version": "bedrock-2023-05-31",
             "messages": [
-                {"role": "user", "content": [{"type": "text", "text": prompt}]}
+                {"role": "user", "content": _content_blocks(prompt, model_id)}
             ],
             "max_tokens": max_tokens,
             "temperature": temperature
         })
-    elif model_id.startswith("anthropic."):
-        anthropic_prompt = f"\n\nHuman: {prompt}\n\nAssistant:"
+    elif family == "anthropic":
+        anthropic_prompt = f"\n\nHuman: {prompt_text(prompt)}\n\nAssistant:"
         body = json.dumps({
             "prompt": anthropic_prompt,
             "max_tokens_to_sample": max_tokens,
             "temperature": temperature,
             "stop_sequences": ["\n\nHuman:"]
         })
-    elif model_id.startswith("amazon.titan"):
+    elif family == "titan":
         body = json.dumps({
-            "inputText": prompt,
+            "inputText": prompt_text(prompt),
             "textGenerationConfig": {
                 "maxTokenCount": max_tokens,
                 "temperature": temperature,
@@ -34,6 +157,145 @@ def call_bedrock_model(prompt: str, model_id: str, max_tokens: int, temperature:
         })
     else:
         raise ValueError(f"Unsupported model schema for {model_id}")
+    return body
+
+
+# Stop reasons are normalized to Claude's vocabulary; "max_tokens" means the
+# completion was cut off by the token budget.
+_STOP_REASONS = {"LENGTH": "max_tokens", "FINISH": "end_turn", "STOP_CRITERIA_MET": "stop_sequence",
+                 "CONTENT_FILTERED": "content_filtered"}
+
+
+def _result(text: str, stop_reason=None, input_tokens=None, output_tokens=None,
+            cache_read_tokens=None, cache_write_tokens=None) -> dict:
+    # With prompt caching, input_tokens counts only the uncached part of the
+    # prompt; cached prefix tokens are reported as read or written
+    stop_reason = _STOP_REASONS.get(stop_reason, stop_reason)
+    return {
+        "text": text,
+        "stop_reason": stop_reason,
+        "truncated": stop_reason == "max_tokens",
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cache_read_tokens": cache_read_tokens,
+        "cache_write_tokens": cache_write_tokens,
+    }
+
+
+def _cached_result(value: str) -> dict:
+    try:
+        result = json.loads(value)
+        if isinstance(result, dict) and "text" in result:
+            return result
+    except ValueError:
+        pass
+    # Entries written before usage was recorded hold the bare completion text
+    return _result(value)
+
+
+class BedrockStreamError(RuntimeError):
+    """An error event received in the middle of a response stream."""
+
+    def __init__(self, code: str, message: str):
+        super().__init__(f"Bedrock stream error ({code}): {message}")
+        self.code = code
+
+
+def _used_tokens(result: dict):
+    if result.get("input_tokens") is None or result.get("output_tokens") is None:
+        return None
+    return result["input_tokens"] + result["output_tokens"]
+
+
+def _limited_invoke(prompt, model_id: str, max_tokens: int, temperature: float, info: dict) -> dict:
+    # Waits for a process-wide slot, then the router picks the region/model
+    # target (possibly hedging to a second one); each attempt waits for its
+    # target's RPM/TPM budget and retries throttling with backoff
+    reserved = estimate_request_tokens(prompt_text(prompt), max_tokens)
+
+    def attempt(target, attempt_info):
+        yield "done", get_rate_limiter(target.model_id, target.region).call(
+            lambda: _invoke_model(prompt, target.model_id, max_tokens, temperature, target.region),
+            reserved, _used_tokens, info=attempt_info)
+
+    with get_scheduler().slot(reserved):
+        routed = get_router(model_id).run(attempt, reserved, latency_kind("invoke", max_tokens), info)
+        try:
+            while True:
+                next(routed)
+        except StopIteration as done:
+            return done.value
+
+
+def _limited_stream(prompt, model_id: str, max_tokens: int, temperature: float, details: dict, info: dict):
+    reserved = estimate_request_tokens(prompt_text(prompt), max_tokens)
+
+    def attempt(target, attempt_info):
+        # Each attempt fills its own details; the winner's are copied over
+        attempt_details = {}
+        pieces = get_rate_limiter(target.model_id, target.region).stream(
+            lambda: _stream_model(prompt, target.model_id, max_tokens, temperature, attempt_details, target.region),
+            reserved, lambda: _used_tokens(attempt_details), info=attempt_info)
+        try:
+            for piece in pieces:
+                yield "piece", piece
+        finally:
+            pieces.close()
+        yield "done", attempt_details
+
+    with get_scheduler().slot(reserved):
+        details.update((yield from get_router(model_id).run(attempt, reserved, latency_kind("stream", max_tokens),
+                                                            info)))
+
+
+def call_bedrock_model(prompt, model_id: str, max_tokens: int, temperature: float,
+                       use_cache: bool = True, return_details: bool = False):
+    """
+    Return the completion text, or with return_details=True a dict with
+    text, stop_reason, truncated, input_tokens, output_tokens,
+    cache_read_tokens and cache_write_tokens (plus cache_hit=True when
+    served from the response cache).
+
+    prompt is a string or a tuple of segments (see prompts.py); on models
+    with prompt caching every segment but the last is a cache checkpoint.
+    """
+    started = time.perf_counter()
+    info = {"retries": 0, "cache_hit": False}
+    try:
+        result = _cached_invoke(prompt, model_id, max_tokens, temperature, use_cache, info)
+    except Exception as e:
+        record_call(model_id, "invoke", time.perf_counter() - started, max_tokens,
+                    retries=info["retries"], error=e)
+        raise
+    record_call(model_id, "invoke", time.perf_counter() - started, max_tokens, result,
+                cache_hit=info["cache_hit"], retries=info["retries"], target=info.get("target"),
+                hedged=info.get("hedged", False))
+    return result if return_details else result["text"]
+
+
+def _cached_invoke(prompt, model_id: str, max_tokens: int, temperature: float, use_cache: bool,
+                   info: dict) -> dict:
+    cache = get_response_cache() if use_cache else None
+    if cache is not None and cache.cacheable(temperature):
+        key = cache_key(model_id, prompt_text(prompt), max_tokens, temperature)
+        cached = cache.get(key)
+        if cached is not None:
+            info["cache_hit"] = True
+            return dict(_cached_result(cached), cache_hit=True)
+        result = _limited_invoke(prompt, model_id, max_tokens, temperature, info)
+        cache.put(key, json.dumps(result))
+        return result
+    return _limited_invoke(prompt, model_id, max_tokens, temperature, info)
+
+
+def _header_tokens(response: dict, name: str):
+    value = response.get("ResponseMetadata", {}).get("HTTPHeaders", {}).get(f"x-amzn-bedrock-{name}-token-count")
+    return int(value) if value is not None else None
+
+
+def _invoke_model(prompt, model_id: str, max_tokens: int, temperature: float, region: str = None) -> dict:
+    client = get_bedrock_client(region)
+    body = build_request_body(prompt, model_id, max_tokens, temperature)
 
     response = client.invoke_model(
         modelId=model_id,
@@ -43,59 +305,145 @@ def call_bedrock_model(prompt: str, model_id: str, max_tokens: int, temperature:
     )
 
     resp_body = json.loads(response["body"].read())
-    if model_id.startswith("anthropic.claude-3"):
-        return resp_body["content"][0]["text"]
-    elif model_id.startswith("anthropic."):
-        return resp_body.get("completion", "")
-    elif model_id.startswith("amazon.titan"):
-        return resp_body.get("results", [{}])[0].get("outputText", "")
-    return str(resp_body)
-
-
-# def call_bedrock_model(prompt: str, model_id: str, max_tokens: int = 1500, temperature: float = 0.0) -> str:
-#     client = boto3.client('bedrock-runtime')
-
-#     if model_id.startswith("anthropic.claude-3"):
-#         body = json.dumps({
-#             "anthropic_version": "bedrock-2023-05-31",
-#             "messages": [
-#                 {"role": "user", "content": [{"type": "text", "text": prompt}]}
-#             ],
-#             "max_tokens": max_tokens,
-#             "temperature": temperature
-#         })
-#     elif model_id.startswith("anthropic."):
-#         anthropic_prompt = f"\n\nHuman: {prompt}\n\nAssistant:"
-#         body = json.dumps({
-#             "prompt": anthropic_prompt,
-#             "max_tokens_to_sample": max_tokens,
-#             "temperature": temperature,
-#             "stop_sequences": ["\n\nHuman:"]
-#         })
-#     elif model_id.startswith("amazon.titan"):
-#         body = json.dumps({
-#             "inputText": prompt,
-#             "textGenerationConfig": {
-#                 "maxTokenCount": max_tokens,
-#                 "temperature": temperature,
-#                 "stopSequences": []
-#             }
-#         })
-#     else:
-#         raise ValueError(f"Unsupported model schema for {model_id}")
-
-#     response = client.invoke_model(
-#         modelId=model_id,
-#         body=body,
-#         contentType="application/json",
-#         accept="application/json"
-#     )
-
-#     resp_body = json.loads(response["body"].read())
-#     if model_id.startswith("anthropic.claude-3"):
-#         return resp_body["content"][0]["text"]
-#     elif model_id.startswith("anthropic."):
-#         return resp_body.get("completion", "")
-#     elif model_id.startswith("amazon.titan"):
-#         return resp_body.get("results", [{}])[0].get("outputText", "")
-#     return str(resp_body)
\ No newline at end of file
+    # Bedrock reports token usage in headers for every model family
+    input_tokens = _header_tokens(response, "input")
+    output_tokens = _header_tokens(response, "output")
+    family = model_family(model_id)
+    if family == "messages":
+        usage = resp_body.get("usage", {})
+        return _result(resp_body["content"][0]["text"], resp_body.get("stop_reason"),
+                       usage.get("input_tokens", input_tokens), usage.get("output_tokens", output_tokens),
+                       usage.get("cache_read_input_tokens"), usage.get("cache_creation_input_tokens"))
+    elif family == "anthropic":
+        return _result(resp_body.get("completion", ""), resp_body.get("stop_reason"), input_tokens, output_tokens)
+    elif family == "titan":
+        first = resp_body.get("results", [{}])[0]
+        return _result(first.get("outputText", ""), first.get("completionReason"),
+                       resp_body.get("inputTextTokenCount", input_tokens), first.get("tokenCount", output_tokens))
+    return _result(str(resp_body), None, input_tokens, output_tokens)
+
+
+def _chunk_text(model_id: str, chunk: dict) -> str:
+    # Claude 3 streams typed message events; only text deltas carry output.
+    family = model_family(model_id)
+    if family == "messages":
+        if chunk.get("type") == "content_block_delta":
+            return chunk.get("delta", {}).get("text", "")
+        return ""
+    elif family == "anthropic":
+        return chunk.get("completion", "")
+    elif family == "titan":
+        return chunk.get("outputText", "")
+    return ""
+
+
+def _chunk_details(model_id: str, chunk: dict, details: dict):
+    # Stop reason and usage arrive on the closing events of a stream
+    metrics = chunk.get("amazon-bedrock-invocationMetrics")
+    if metrics:
+        details["input_tokens"] = metrics.get("inputTokenCount", details.get("input_tokens"))
+        details["output_tokens"] = metrics.get("outputTokenCount", details.get("output_tokens"))
+        details["cache_read_tokens"] = metrics.get("cacheReadInputTokenCount", details.get("cache_read_tokens"))
+        details["cache_write_tokens"] = metrics.get("cacheWriteInputTokenCount", details.get("cache_write_tokens"))
+    family = model_family(model_id)
+    if family == "messages":
+        if chunk.get("type") == "message_start":
+            # Prompt cache usage is known before the first token
+            usage = chunk.get("message", {}).get("usage", {})
+            details["cache_read_tokens"] = usage.get("cache_read_input_tokens")
+            details["cache_write_tokens"] = usage.get("cache_creation_input_tokens")
+        elif chunk.get("type") == "message_delta":
+            details["stop_reason"] = chunk.get("delta", {}).get("stop_reason")
+    elif family == "anthropic":
+        if chunk.get("stop_reason"):
+            details["stop_reason"] = chunk["stop_reason"]
+    elif family == "titan":
+        if chunk.get("completionReason"):
+            details["stop_reason"] = chunk["completionReason"]
+
+
+def stream_bedrock_model(prompt, model_id: str, max_tokens: int, temperature: float,
+                         use_cache: bool = True, details: dict = None):
+    """
+    Yield completion text pieces as they arrive via invoke_model_with_response_stream.
+    If a details dict is passed it is filled with the same fields that
+    call_bedrock_model(return_details=True) returns once the stream ends.
+    """
+    details = {} if details is None else details
+    started = time.perf_counter()
+    first_piece = None
+    info = {"retries": 0, "cache_hit": False}
+    try:
+        for text in _cached_stream(prompt, model_id, max_tokens, temperature, use_cache, details, info):
+            if first_piece is None:
+                first_piece = time.perf_counter() - started
+            yield text
+    except Exception as e:
+        record_call(model_id, "stream", time.perf_counter() - started, max_tokens, details,
+                    ttft=first_piece, retries=info["retries"], error=e)
+        raise
+    record_call(model_id, "stream", time.perf_counter() - started, max_tokens, details,
+                ttft=first_piece, cache_hit=info["cache_hit"], retries=info["retries"], target=info.get("target"),
+                hedged=info.get("hedged", False))
+
+
+def _cached_stream(prompt, model_id: str, max_tokens: int, temperature: float, use_cache: bool,
+                   details: dict, info: dict):
+    cache = get_response_cache() if use_cache else None
+    if cache is None or not cache.cacheable(temperature):
+        yield from _limited_stream(prompt, model_id, max_tokens, temperature, details, info)
+        return
+    key = cache_key(model_id, prompt_text(prompt), max_tokens, temperature)
+    cached = cache.get(key)
+    if cached is not None:
+        info["cache_hit"] = True
+        details.update(_cached_result(cached), cache_hit=True)
+        yield details["text"]
+        return
+    for text in _limited_stream(prompt, model_id, max_tokens, temperature, details, info):
+        yield text
+    # Only completed streams are stored
+    cache.put(key, json.dumps(details))
+
+
+def _stream_model(prompt, model_id: str, max_tokens: int, temperature: float, details: dict,
+                  region: str = None):
+    client = get_bedrock_client(region)
+    body = build_request_body(prompt, model_id, max_tokens, temperature)
+
+    response = client.invoke_model_with_response_stream(
+        modelId=model_id,
+        body=body,
+        contentType="application/json",
+        accept="application/json"
+    )
+
+    pieces = []
+    raw = {}
+    stream = response["body"]
+    completed = False
+    try:
+        for event in stream:
+            chunk = event.get("chunk")
+            if not chunk:
+                # Mid-stream failures arrive as events such as throttlingException.
+                for name, detail in event.items():
+                    raise BedrockStreamError(name, detail.get("message", ""))
+                continue
+            payload = json.loads(chunk["bytes"])
+            _chunk_details(model_id, payload, raw)
+            text = _chunk_text(model_id, payload)
+            if text:
+                pieces.append(text)
+                yield text
+        completed = True
+    finally:
+        # Also runs when a losing hedged stream is cancelled
+        if hasattr(stream, "close"):
+            stream.close()
+        if not completed:
+            # Usage so far, for settling the rate-limit reservation
+            details.update(input_tokens=raw.get("input_tokens") or len(prompt_text(prompt)) // 4,
+                           output_tokens=raw.get("output_tokens") or len("".join(pieces)) // 4)
+    details.update(_result("".join(pieces), raw.get("stop_reason"), raw.get("input_tokens"), raw.get("output_tokens"),
+                           raw.get("cache_read_tokens"), raw.get("cache_write_tokens")))
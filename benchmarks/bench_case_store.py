@@ -0,0 +1,59 @@
+"""
+Memory held per parsed generation: case/step dict rows plus their DataFrames
+(the previous layout) versus the columnar CaseStore, measured with tracemalloc.
+
+    python benchmarks/bench_case_store.py --cases 5000
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pandas as pd  # noqa: E402
+from bench_parser import synthetic_output  # noqa: E402
+from case_store import STEP_COLUMNS, TRADITIONAL_COLUMNS  # noqa: E402
+from parsers import parse_output, parse_store  # noqa: E402
+
+
+def measure(build) -> tuple:
+    """(bytes still held by what build() returns, peak bytes while building, seconds)."""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    kept = build()
+    seconds = time.perf_counter() - started
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return size, peak, seconds
+
+
+def rows_and_frames(text: str):
+    rows, step_rows = parse_output(text, "Traditional")
+    return (rows, step_rows, pd.DataFrame(rows, columns=TRADITIONAL_COLUMNS),
+            pd.DataFrame(step_rows, columns=STEP_COLUMNS))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--cases", type=int, default=5000)
+    args = ap.parse_args()
+
+    text = synthetic_output(args.cases)
+    parse_store(text, "Traditional").steps_frame()  # warm up imports and caches
+    cases = parse_store(text, "Traditional")
+    print(f"{args.cases} cases, {len(cases.step_text)} steps")
+    print(f"{'':<24}{'held MB':>9}{'peak MB':>9}{'ms':>9}")
+    for label, build in (("dict rows + DataFrames", lambda: rows_and_frames(text)),
+                         ("CaseStore", lambda: parse_store(text, "Traditional")),
+                         ("  frames on demand", lambda: (cases.cases_frame(), cases.steps_frame()))):
+        held, peak, seconds = measure(build)
+        print(f"{label:<24}{held / 1e6:>9.2f}{peak / 1e6:>9.2f}{seconds * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
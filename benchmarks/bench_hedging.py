@@ -0,0 +1,70 @@
+"""
+Tail latency of streamed calls routed over two fake regions, one of which
+has a slow tail, with and without hedged requests.
+
+    python benchmarks/bench_hedging.py --calls 300 --tail-rate 0.05 --tail-latency 2
+    python benchmarks/bench_hedging.py --no-hedge   # primary target only, for comparison
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ["BEDROCK_FAKE"] = "1"
+os.environ["BEDROCK_CACHE_ENABLED"] = "0"
+os.environ.setdefault("TELEMETRY_LOG", "off")
+os.environ.setdefault("BEDROCK_RPM", "100000")
+os.environ.setdefault("BEDROCK_TPM", "100000000")
+os.environ.setdefault("BEDROCK_TARGETS", '{"*": ["us-east-1", "us-west-2"]}')
+os.environ.setdefault("FAKE_BEDROCK_REGION_LATENCY", '{"us-east-1": 0.05, "us-west-2": 0.08}')
+os.environ.setdefault("FAKE_BEDROCK_TOKENS_PER_SECOND", "20000")
+# The fake answers in tens of milliseconds, so the hedge delay floor is lowered to match
+os.environ.setdefault("BEDROCK_HEDGE_MIN_DELAY", "0.1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--calls", type=int, default=300)
+    ap.add_argument("--tail-rate", type=float, default=0.05, help="share of calls hitting the slow tail")
+    ap.add_argument("--tail-latency", type=float, default=2.0, help="extra seconds for slow calls")
+    ap.add_argument("--max-rate", type=float, default=0.1, help="BEDROCK_HEDGE_MAX_RATE")
+    ap.add_argument("--no-hedge", action="store_true")
+    args = ap.parse_args()
+    os.environ["FAKE_BEDROCK_TAIL_RATE"] = str(args.tail_rate)
+    os.environ["FAKE_BEDROCK_TAIL_LATENCY"] = str(args.tail_latency)
+    os.environ["BEDROCK_HEDGE_MAX_RATE"] = str(args.max_rate)
+    os.environ["BEDROCK_HEDGE"] = "0" if args.no_hedge else "auto"
+
+    from bedrock_client import stream_bedrock_model
+    from generation import build_generate_prompt
+    from router import router_status
+
+    model_id = "anthropic.claude-3-sonnet-20240229-v1:0"
+    prompt = build_generate_prompt("Users must be able to log in with email and password.", 2, "Traditional")
+    first_token, total = [], []
+    for _ in range(args.calls):
+        started = time.perf_counter()
+        first = None
+        for _piece in stream_bedrock_model(prompt, model_id, 1000, 0.0, use_cache=False):
+            if first is None:
+                first = time.perf_counter() - started
+        first_token.append(first)
+        total.append(time.perf_counter() - started)
+
+    status = router_status()[0]
+    print(f"hedging: {'off' if args.no_hedge else 'on'}  calls: {args.calls}  hedged: {status['hedged']} "
+          f"({status['hedged'] / args.calls:.1%}), hedge won: {status['hedge_wins']}")
+    print(f"{'':<14}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}")
+    for label, values in (("first token", first_token), ("total", total)):
+        ordered = sorted(values)
+        print(f"{label:<14}" + "".join(f"{percentile(ordered, q):>8.2f}" for q in (0.5, 0.95, 0.99)) +
+              f"{ordered[-1]:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Time the single-pass parser on synthetic model output.
+
+    python benchmarks/bench_parser.py --cases 5000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from parsers import TestCaseParser, parse_output  # noqa: E402
+
+CASE_TEMPLATE = """ID: TC-{n:03d}
+Title: Verify behaviour {n}
+Preconditions: User account {n} exists
+Steps:
+1. Open the login page
+2. Enter the credentials for account {n}
+3. Click 'Login'
+Expected Result: The dashboard for account {n} is shown
+Priority: High
+Tags: login, smoke
+"""
+
+
+def synthetic_output(cases: int) -> str:
+    return "\n".join(CASE_TEMPLATE.format(n=n) for n in range(1, cases + 1))
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--cases", type=int, default=5000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    text = synthetic_output(args.cases)
+
+    def _streamed():
+        parser = TestCaseParser("Traditional")
+        for i in range(0, len(text), 64):
+            parser.feed(text[i:i + 64])
+        parser.close()
+
+    whole = best_of(lambda: parse_output(text, "Traditional"), args.repeat)
+    streamed = best_of(_streamed, args.repeat)
+    cases, steps = parse_output(text, "Traditional")
+    print(f"{len(cases)} cases / {len(steps)} step rows from {len(text) / 1e6:.1f} MB")
+    print(f"whole text : {whole * 1000:8.1f} ms ({len(cases) / whole:,.0f} cases/s)")
+    print(f"64B chunks : {streamed * 1000:8.1f} ms ({len(cases) / streamed:,.0f} cases/s)")
+
+
+if __name__ == "__main__":
+    main()
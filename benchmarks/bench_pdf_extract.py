@@ -0,0 +1,87 @@
+"""
+Compare sequential and process-pool PDF extraction on a generated fixture.
+
+    python benchmarks/bench_pdf_extract.py --pages 200 --workers 4
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from file_utils import extract_text_from_pdf, iter_pdf_pages  # noqa: E402
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: int, lines_per_page: int = 45) -> bytes:
+    """Minimal multi-page text PDF with a repeated header and page footer."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for p in range(1, pages + 1):
+        lines = ["ACME Payments - Requirements Specification"]
+        lines += [f"REQ-{p}.{n} The system shall validate field {n} on screen {p} before submission."
+                  for n in range(1, lines_per_page + 1)]
+        lines.append(f"Page {p} of {pages}")
+        ops = ["BT /F1 9 Tf 40 800 Td 11 TL"] + [f"({_escape(l)}) Tj T*" for l in lines] + ["ET"]
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref)
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % pages
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % num + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for off in offsets:
+        out.write(b"%010d 00000 n \n" % off)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--pages", type=int, default=200)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = ap.parse_args()
+
+    data = make_pdf(args.pages)
+    print(f"fixture: {args.pages} pages, {len(data) / 1e6:.1f} MB, {args.workers} workers")
+
+    seq, _ = timed(lambda: list(iter_pdf_pages(io.BytesIO(data), workers=1)))
+    # The first parallel run includes spawning the pool; the second reuses it
+    cold, _ = timed(lambda: list(iter_pdf_pages(io.BytesIO(data), workers=args.workers)))
+    warm, _ = timed(lambda: list(iter_pdf_pages(io.BytesIO(data), workers=args.workers)))
+    first = time.perf_counter()
+    next(iter_pdf_pages(io.BytesIO(data), workers=args.workers))
+    first = time.perf_counter() - first
+    ranged, _ = timed(lambda: list(iter_pdf_pages(io.BytesIO(data), pages=f"1-{max(args.pages // 10, 1)}", workers=1)))
+    _, text = timed(lambda: extract_text_from_pdf(io.BytesIO(data)))
+
+    print(f"sequential        : {seq:7.2f}s")
+    print(f"parallel (cold)   : {cold:7.2f}s")
+    print(f"parallel (warm)   : {warm:7.2f}s  ({seq / warm:.1f}x)")
+    print(f"first page (warm) : {first:7.2f}s")
+    print(f"first 10% of pages: {ranged:7.2f}s")
+    print(f"header/footer lines left: {text.count('ACME Payments')} header, {text.count(' of ' + str(args.pages))} footer")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Simulate concurrent users against the fake Bedrock client and report how
+long each session waits. One heavy session submits a burst of large
+generation calls; the light sessions arrive shortly after with one small
+call each.
+
+    python benchmarks/bench_scheduler.py --concurrency 4 --heavy-calls 20 --light-sessions 8
+    python benchmarks/bench_scheduler.py --fifo   # plain arrival order, for comparison
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ["BEDROCK_FAKE"] = "1"
+os.environ.setdefault("BEDROCK_RPM", "100000")
+os.environ.setdefault("BEDROCK_TPM", "100000000")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import scheduler  # noqa: E402
+from bedrock_client import call_bedrock_model, get_bedrock_client  # noqa: E402
+from generation import build_generate_prompt  # noqa: E402
+
+MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+
+
+def run_session(name: str, calls: int, count: int, max_tokens: int, latencies: dict):
+    scheduler.bind_session(name)
+    prompt = build_generate_prompt("Users must be able to log in with email and password.", count, "Traditional")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=calls) as pool:
+        futures = [scheduler.run_in_context(pool, call_bedrock_model, prompt, MODEL_ID, max_tokens, 0.0, False)
+                   for _ in range(calls)]
+        for future in futures:
+            future.result()
+    latencies[name] = time.perf_counter() - started
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--heavy-calls", type=int, default=20)
+    ap.add_argument("--light-sessions", type=int, default=8)
+    ap.add_argument("--latency", type=float, default=0.2, help="simulated time to first token (seconds)")
+    ap.add_argument("--fifo", action="store_true", help="disable small-request priority and fair sharing")
+    args = ap.parse_args()
+
+    client = get_bedrock_client()
+    client.latency = args.latency
+    client.tokens_per_second = 1000
+    sched = scheduler.get_scheduler()
+    sched.max_concurrency = args.concurrency
+    if args.fifo:
+        sched._key = lambda ticket: ticket.seq
+
+    latencies = {}
+    heavy = threading.Thread(target=run_session, args=("heavy", args.heavy_calls, 25, 8000, latencies))
+    heavy.start()
+    time.sleep(args.latency / 2)
+    lights = [threading.Thread(target=run_session, args=(f"light-{i}", 1, 3, 1000, latencies))
+              for i in range(args.light_sessions)]
+    for t in lights:
+        t.start()
+    for t in lights + [heavy]:
+        t.join()
+
+    light = [v for k, v in latencies.items() if k.startswith("light")]
+    print(f"mode: {'fifo' if args.fifo else 'fair'}  concurrency: {args.concurrency}  calls: {client.calls}")
+    print(f"heavy session:  {latencies['heavy']:.2f}s for {args.heavy_calls} calls")
+    print(f"light sessions: median {statistics.median(light):.2f}s, max {max(light):.2f}s")
+    print(f"scheduler: {sched.status()}")
+
+
+if __name__ == "__main__":
+    main()
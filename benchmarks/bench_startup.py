@@ -0,0 +1,64 @@
+"""
+Measure cold start: importing the app's modules, and running the Streamlit
+script to its first rendered page, each in a fresh interpreter. "eager"
+imports the heavy dependencies up front, as the app did before they were
+deferred; "lazy" is the current behaviour.
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ["pandas", "boto3", "tiktoken", "pdfplumber", "docx", "openpyxl"]
+APP_MODULES = ["bedrock_client", "file_utils", "exports", "estimator", "generation", "parsers",
+               "response_cache", "jobs", "telemetry", "tracing", "utils"]
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+if {eager}:
+    for name in {heavy!r}:
+        __import__(name)
+if {render}:
+    from streamlit.testing.v1 import AppTest
+    AppTest.from_file({script!r}, default_timeout=120).run()
+else:
+    for name in {modules!r}:
+        __import__(name)
+print(json.dumps({{"seconds": time.perf_counter() - started,
+                  "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def probe(eager: bool, render: bool) -> dict:
+    code = PROBE.format(root=ROOT, eager=eager, render=render, heavy=HEAVY, modules=APP_MODULES,
+                        script=os.path.join(ROOT, "Test_Case_Generator_V3.py"))
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True,
+                         env=dict(os.environ, TELEMETRY_LOG="off", BEDROCK_CACHE_ENABLED="0"))
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--imports-only", action="store_true", help="skip the first-render measurement")
+    args = ap.parse_args()
+
+    stages = [("imports", False)] + ([] if args.imports_only else [("first render", True)])
+    print(f"{'stage':<14}{'mode':<7}{'median s':>10}{'min s':>8}  heavy modules loaded")
+    for label, render in stages:
+        for mode, eager in (("eager", True), ("lazy", False)):
+            results = [probe(eager, render) for _ in range(args.runs)]
+            times = [r["seconds"] for r in results]
+            print(f"{label:<14}{mode:<7}{statistics.median(times):>10.3f}{min(times):>8.3f}  "
+                  f"{', '.join(results[-1]['loaded']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
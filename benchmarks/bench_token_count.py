@@ -0,0 +1,68 @@
+"""
+Token counting on multi-MB requirement text: the full encode, a repeated
+count served from the memo, and the sampled approximation with its error.
+
+    python benchmarks/bench_token_count.py --mb 2 5 10
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("TELEMETRY_LOG", "off")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SENTENCES = [
+    "The system shall allow a registered user to log in with an email address and password.",
+    "If the password is entered incorrectly five times, the account is locked for 15 minutes.",
+    "Administrators can export the audit log as CSV, filtered by date range and user id.",
+    "Order totals are rounded to two decimals; VAT is computed per line item (see §4.2).",
+    "| Field | Type | Required |\n|---|---|---|\n| customer_id | UUID | yes |",
+    "GET /api/v2/orders?status=open&page=3 returns HTTP 200 with a JSON array of orders.",
+    "Passwörter müssen mindestens 12 Zeichen lang sein und Sonderzeichen enthalten.",
+]
+
+
+def synthetic_text(chars: int, seed: int = 7) -> str:
+    rng = random.Random(seed)
+    parts, size, number = [], 0, 0
+    while size < chars:
+        number += 1
+        paragraph = f"REQ-{number:05d}: " + " ".join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 6)))
+        parts.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(parts)[:chars]
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    value = fn(*args)
+    return value, time.perf_counter() - started
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mb", type=float, nargs="+", default=[1, 4, 8], help="text sizes in millions of characters")
+    args = ap.parse_args()
+
+    import utils
+
+    encoding, load = timed(utils.get_encoding)
+    if encoding is None:
+        sys.exit("tokenizer unavailable: run python fetch_tokenizer.py or set TOKENIZER_BPE_DIR")
+    _, cached_load = timed(utils.get_encoding)
+    print(f"encoder load: {load * 1000:.0f} ms first, {cached_load * 1e6:.1f} us cached")
+    print(f"{'chars':>10}{'tokens':>11}{'exact s':>9}{'approx s':>10}{'memo s':>9}{'error':>9}{'bound':>8}")
+    for mb in args.mb:
+        text = synthetic_text(int(mb * 1_000_000))
+        exact, exact_s = timed(lambda: len(encoding.encode_ordinary(text)))
+        (estimate, bound), approx_s = timed(utils.approximate_token_count, text, encoding)
+        utils.count_tokens(text)
+        _, memo_s = timed(utils.count_tokens, text)
+        print(f"{len(text):>10}{exact:>11}{exact_s:>9.3f}{approx_s:>10.3f}{memo_s:>9.3f}"
+              f"{(estimate - exact) / exact:>+9.2%}{bound:>8.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compare the local estimator against AI estimates logged by the app.
+
+    python benchmarks/compare_estimators.py [--log .cache/ai_estimates.jsonl]
+
+The app logs AI estimates only with ESTIMATE_LOG_ENABLED=1, and it logs the
+requirement signal counts rather than the text. The current scoring is
+re-run on every logged entry's signals, so weight changes can be checked
+against the saved AI answers.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from estimator import ESTIMATE_LOG_PATH, count_from_signals  # noqa: E402
+
+
+def load_log(path: str) -> list:
+    latest = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                if "signals" not in entry:
+                    continue  # written by an older version
+                # Keep the most recent AI answer per requirements text
+                latest[(entry["sha256"], entry["model"])] = entry
+    return list(latest.values())
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--log", default=ESTIMATE_LOG_PATH)
+    ap.add_argument("--show", type=int, default=10, help="Print the N largest disagreements")
+    args = ap.parse_args()
+
+    if not os.path.exists(args.log):
+        print(f"No AI estimates logged yet at {args.log}")
+        return
+    entries = load_log(args.log)
+    if not entries:
+        print(f"No AI estimates with signal counts in {args.log}")
+        return
+    rows = []
+    elapsed = 0.0
+    for entry in entries:
+        started = time.perf_counter()
+        local = count_from_signals(entry["signals"])
+        elapsed += time.perf_counter() - started
+        rows.append((entry["ai_count"], local, entry["chars"], entry["sha256"][:10]))
+
+    errors = [local - ai for ai, local, _, _ in rows]
+    pct = [abs(local - ai) / ai for ai, local, _, _ in rows if ai]
+    print(f"{len(rows)} logged estimates")
+    print(f"mean abs error : {statistics.mean(abs(e) for e in errors):.1f} cases")
+    print(f"mean abs % err : {statistics.mean(pct) * 100:.0f}%" if pct else "mean abs % err : n/a")
+    print(f"bias (local-ai): {statistics.mean(errors):+.1f} cases")
+    if len(rows) > 1:
+        try:
+            print(f"correlation    : {statistics.correlation([r[0] for r in rows], [r[1] for r in rows]):.2f}")
+        except statistics.StatisticsError:
+            print("correlation    : n/a (constant counts)")
+    print(f"scoring time   : {elapsed / len(rows) * 1000:.3f} ms per document")
+    print("\nlargest disagreements (ai, local, chars, sha):")
+    for ai, local, chars, sha in sorted(rows, key=lambda r: abs(r[1] - r[0]), reverse=True)[:args.show]:
+        print(f"  {ai:4d} {local:4d} {chars:8d} {sha}")
+
+
+if __name__ == "__main__":
+    main()
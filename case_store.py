@@ -0,0 +1,193 @@
+import re
+import sys
+from array import array
+
+TRADITIONAL_COLUMNS = ['ID', 'Title', 'Preconditions', 'Steps', 'Expected Results']
+BDD_COLUMNS = ['ID', 'Scenario', 'Preconditions', 'Description']
+STEP_COLUMNS = ['ID', 'Title', 'Preconditions', 'Step', 'Expected Result', 'Priority', 'Tags']
+
+
+class Step:
+    __slots__ = ('line', 'text', 'expected')
+
+    def __init__(self, line: str, text: str = None, expected: str = None):
+        self.line = line                            # as written, e.g. "1. Open the page"
+        self.text = line if text is None else text  # without numbering
+        self.expected = expected                    # None: the case's expected result
+
+
+class TestCase:
+    __slots__ = ('source_id', 'title', 'preconditions', 'steps', 'expected',
+                 'priority', 'tags', 'scenario', 'description')
+
+    def __init__(self):
+        self.source_id = ""
+        self.title = ""
+        self.preconditions = ""
+        self.steps = []
+        self.expected = ""
+        self.priority = ""
+        self.tags = ""
+        self.scenario = None
+        self.description = []   # BDD lines, starting with the "Scenario:" line
+
+
+_SOURCE_ID_RE = re.compile(r"TC-(\d+)", re.IGNORECASE)
+
+
+def _case_id(index: int) -> str:
+    return f'TC-{index + 1:03d}'
+
+
+def _source_id(value: str) -> str:
+    m = _SOURCE_ID_RE.search(value or "")
+    return f'TC-{int(m.group(1)):03d}' if m else ""
+
+
+class CaseStore:
+    """
+    Parsed test cases held column by column instead of as one dict per row.
+
+    Step rows only store what differs per step (its text and, when the model
+    gave one, its own expected result) plus the index of their case; the
+    case columns are shared through that index. Priority and tag values
+    repeat across cases and are interned. DataFrames are built on demand
+    by cases_frame() / steps_frame() and are not kept.
+
+    Cases keep the TC-### ids written in the output when every case has one
+    and they are unique (e.g. stable ids from incremental regeneration);
+    otherwise they are numbered in order.
+
+    Appends come from one writer thread; readers (e.g. the page showing
+    partial results) may read concurrently and see a consistent prefix.
+    """
+
+    def __init__(self, test_type: str):
+        self.test_type = test_type
+        self.traditional = test_type == 'Traditional'
+        self.columns = TRADITIONAL_COLUMNS if self.traditional else BDD_COLUMNS
+        self.source_ids = []
+        self.preconditions = []
+        if self.traditional:
+            self.title = []
+            self.expected = []
+            self.priority = []
+            self.tags = []
+            self.step_start = array('I')  # first step of each case
+            self.step_case = array('I')   # owning case of each step
+            self.step_line = []
+            self.step_text = []
+            self.step_expected = []
+        else:
+            self.scenario = []
+            self.description = []
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, case: TestCase):
+        index = self._count
+        self.source_ids.append(_source_id(case.source_id))
+        self.preconditions.append(case.preconditions)
+        if self.traditional:
+            self.title.append(case.title)
+            self.expected.append(case.expected)
+            self.priority.append(sys.intern(case.priority))
+            self.tags.append(sys.intern(case.tags))
+            self.step_start.append(len(self.step_case))
+            for step in case.steps:
+                self.step_line.append(step.line)
+                self.step_text.append(step.text)
+                self.step_expected.append(step.expected or None)
+                self.step_case.append(index)
+        else:
+            self.scenario.append(case.scenario)
+            self.description.append("\n".join(case.description))
+        # Published last so readers never see a half-written case
+        self._count = index + 1
+
+    def ids(self) -> list:
+        count = self._count
+        given = self.source_ids[:count]
+        if all(given) and len(set(given)) == count:
+            return given
+        return [_case_id(i) for i in range(count)]
+
+    def titles(self) -> list:
+        return (self.title if self.traditional else self.scenario)[:self._count]
+
+    def _step_range(self, index: int) -> range:
+        # The next case's start is recorded before any of its steps
+        end = self.step_start[index + 1] if index + 1 < len(self.step_start) else len(self.step_case)
+        return range(self.step_start[index], end)
+
+    def __getitem__(self, index: int) -> TestCase:
+        if not -self._count <= index < self._count:
+            raise IndexError(index)
+        return self._case(index % self._count, self.ids())
+
+    def _case(self, index: int, ids: list) -> TestCase:
+        case = TestCase()
+        case.source_id = ids[index]
+        case.preconditions = self.preconditions[index]
+        if self.traditional:
+            case.title = self.title[index]
+            case.expected = self.expected[index]
+            case.priority = self.priority[index]
+            case.tags = self.tags[index]
+            case.steps = [Step(self.step_line[s], self.step_text[s], self.step_expected[s])
+                          for s in self._step_range(index)]
+        else:
+            case.scenario = self.scenario[index]
+            case.description = self.description[index].split("\n")
+        return case
+
+    def __iter__(self):
+        ids = self.ids()
+        return (self._case(i, ids) for i in range(len(ids)))
+
+    # ---- row views ----
+    def _case_columns(self, start: int, stop: int) -> dict:
+        ids = self.ids()[start:stop]
+        if not self.traditional:
+            return {'ID': ids, 'Scenario': self.scenario[start:stop],
+                    'Preconditions': self.preconditions[start:stop],
+                    'Description': self.description[start:stop]}
+        steps = ["\n".join(self.step_line[s] for s in self._step_range(i)) for i in range(start, stop)]
+        return {'ID': ids, 'Title': self.title[start:stop], 'Preconditions': self.preconditions[start:stop],
+                'Steps': steps, 'Expected Results': self.expected[start:stop]}
+
+    def _step_columns(self) -> dict:
+        if not self.traditional:
+            return {name: [] for name in STEP_COLUMNS}
+        stop = self._count
+        cases = self.step_case[:self._step_range(stop - 1).stop] if stop else []
+        ids = self.ids()
+        # Case-level values are shared by reference, not copied per step
+        return {
+            'ID': [ids[c] for c in cases],
+            'Title': [self.title[c] for c in cases],
+            'Preconditions': [self.preconditions[c] for c in cases],
+            'Step': [f"{s - self.step_start[c] + 1}. {self.step_text[s]}" for s, c in enumerate(cases)],
+            'Expected Result': [self.step_expected[s] or self.expected[c] for s, c in enumerate(cases)],
+            'Priority': [self.priority[c] for c in cases],
+            'Tags': [self.tags[c] for c in cases],
+        }
+
+    def case_rows(self, start: int = 0) -> list:
+        """Case-level rows as dicts, for callers that want plain rows."""
+        columns = self._case_columns(start, self._count)
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    def step_rows(self) -> list:
+        columns = self._step_columns()
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    def cases_frame(self):
+        import pandas as pd
+        return pd.DataFrame(self._case_columns(0, self._count), columns=self.columns)
+
+    def steps_frame(self):
+        import pandas as pd
+        return pd.DataFrame(self._step_columns(), columns=STEP_COLUMNS)
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+# Rule-based test case count, derived from the structure of the requirements
+# text. Runs locally in milliseconds instead of an ESTIMATE_PROMPT round trip.
+MIN_CASES = 3
+MAX_CASES = 500
+# AI estimates can be logged so the local estimator can be compared against
+# them. Off by default; entries hold a hash of the requirements and their
+# signal counts, never the text itself.
+ESTIMATE_LOG_ENABLED = os.getenv("ESTIMATE_LOG_ENABLED", "0") in ("1", "true", "True")
+ESTIMATE_LOG_PATH = os.getenv("ESTIMATE_LOG_PATH", os.path.join(".cache", "ai_estimates.jsonl"))
+# Most recent entries kept in the log
+ESTIMATE_LOG_MAX_ENTRIES = int(os.getenv("ESTIMATE_LOG_MAX_ENTRIES", "5000"))
+
+_NUMBERED_RE = re.compile(r"^\s*(?:\(?\d+(?:\.\d+)*[.)]|\(?[a-z][.)]|[-*•])\s+\S", re.IGNORECASE | re.MULTILINE)
+_REQ_ID_RE = re.compile(r"\b(?:REQ|FR|NFR|US|UC|BR)[-_ ]?\d+", re.IGNORECASE)
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?;])\s+|\n+")
+_MODAL_RE = re.compile(r"\b(?:shall|must|should|will|is required to|needs? to)\b", re.IGNORECASE)
+_ACCEPTANCE_RE = re.compile(r"^\s*(?:[-*•]\s*)?(?:given|when|then|and|but)\b|\bacceptance criteri(?:a|on)\b|\bAC[-\s]?\d+",
+                            re.IGNORECASE | re.MULTILINE)
+_FIELD_RE = re.compile(
+    r"\b(?:field|input|text ?box|dropdown|drop-down|checkbox|radio button|button|date picker|upload|"
+    r"email|password|username|phone|address|form)s?\b", re.IGNORECASE)
+_RULE_RE = re.compile(
+    r"\b(?:invalid|error|valid(?:ate|ation)?|required|mandatory|optional|maximum|minimum|max|min|"
+    r"limit|exceed|at least|at most|between|format|length|timeout|expire[sd]?|lock(?:ed|out)?|retry|duplicate)\b",
+    re.IGNORECASE)
+_ROLE_RE = re.compile(r"\b(?:admin(?:istrator)?|user|guest|manager|customer|operator|role)s?\b", re.IGNORECASE)
+
+
+def analyze_requirements(text: str) -> dict:
+    sentences = [s for s in _SENTENCE_SPLIT_RE.split(text) if s.strip()]
+    return {
+        "numbered_items": len(_NUMBERED_RE.findall(text)),
+        "requirement_ids": len(set(m.upper() for m in _REQ_ID_RE.findall(text))),
+        "shall_statements": sum(1 for s in sentences if _MODAL_RE.search(s)),
+        "acceptance_criteria": len(_ACCEPTANCE_RE.findall(text)),
+        "input_fields": len(set(m.lower().rstrip("s") for m in _FIELD_RE.findall(text))),
+        "rules_and_limits": len(_RULE_RE.findall(text)),
+        "roles": len(set(m.lower().rstrip("s") for m in _ROLE_RE.findall(text))),
+    }
+
+
+def estimate_case_count(text: str) -> tuple:
+    """Return (count, signals) for the requirements text."""
+    signals = analyze_requirements(text or "")
+    return count_from_signals(signals), signals
+
+
+def count_from_signals(signals: dict) -> int:
+    """Case count for the signals of analyze_requirements."""
+    # Each distinct requirement gets a positive case plus some negative/edge cases
+    requirements = max(signals["shall_statements"], signals["numbered_items"], signals["requirement_ids"])
+    score = (
+        requirements * 1.5
+        + signals["acceptance_criteria"] * 0.5
+        + signals["input_fields"] * 1.0
+        + signals["rules_and_limits"] * 0.5
+        + max(signals["roles"] - 1, 0) * 1.0
+    )
+    return max(MIN_CASES, min(MAX_CASES, round(score)))
+
+
+def format_local_estimate(count: int, signals: dict) -> str:
+    """Render the estimate in the same shape as the AI estimation output."""
+    labels = {
+        "shall_statements": "requirement statements (shall/must/should)",
+        "numbered_items": "numbered or bulleted items",
+        "requirement_ids": "requirement ids",
+        "acceptance_criteria": "acceptance criteria lines",
+        "input_fields": "distinct input field types",
+        "rules_and_limits": "validation rules and limits",
+        "roles": "user roles",
+    }
+    points = "\n".join(f"  - {signals[key]} {label}" for key, label in labels.items() if signals[key])
+    return f"- number: {count}\n- rationale (local estimate):\n{points or '  - little structure found, using the minimum'}\n"
+
+
+_log_lock = threading.Lock()
+_logged = {}  # path -> list of logged entries, loaded on first use
+
+
+def _load_log(path: str) -> list:
+    entries = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return entries
+
+
+def record_ai_estimate(text: str, ai_count: int, model_id: str, path: str = ESTIMATE_LOG_PATH,
+                       enabled: bool = ESTIMATE_LOG_ENABLED):
+    """
+    Log an AI estimate with the requirement signals, for comparison with the
+    local estimate. Requirements already logged for the model are skipped, and
+    only the newest ESTIMATE_LOG_MAX_ENTRIES entries are kept.
+    """
+    if not enabled:
+        return
+    local_count, signals = estimate_case_count(text)
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sha256": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+        "model": model_id,
+        "ai_count": ai_count,
+        "local_count": local_count,
+        "chars": len(text),
+        "signals": signals,
+    }
+    with _log_lock:
+        entries = _logged.get(path)
+        if entries is None:
+            entries = _logged[path] = _load_log(path)
+        if any(e.get("sha256") == entry["sha256"] and e.get("model") == model_id for e in entries):
+            return
+        entries.append(entry)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if len(entries) <= ESTIMATE_LOG_MAX_ENTRIES:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            return
+        # Over the bound: rewrite the log with the newest entries
+        del entries[:len(entries) - ESTIMATE_LOG_MAX_ENTRIES]
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(e) + "\n" for e in entries)
+        os.replace(tmp, path)
@@ -0,0 +1,66 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Built exports kept per (generation id, view, format); oldest dropped first
+EXPORT_CACHE_SIZE = int(os.getenv("EXPORT_CACHE_SIZE", "64"))
+
+
+def csv_bytes(df) -> bytes:
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def xlsx_bytes(df, sheet_name: str = "TestCases", extra_sheets: dict = None) -> bytes:
+    """
+    Write the table with openpyxl's write-only workbook, which streams rows
+    to the zip instead of building a cell tree, so memory stays flat for
+    step-level tables with thousands of rows. Nothing touches the disk.
+    extra_sheets maps further sheet names to DataFrames.
+    """
+    # openpyxl is only loaded once someone downloads a spreadsheet
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    wb = Workbook(write_only=True)
+    bold = Font(bold=True)
+    for name, table in [(sheet_name, df)] + list((extra_sheets or {}).items()):
+        ws = wb.create_sheet(name)
+        header = []
+        for column in table.columns:
+            cell = WriteOnlyCell(ws, value=str(column))
+            cell.font = bold
+            header.append(cell)
+        ws.append(header)
+        for row in table.itertuples(index=False, name=None):
+            ws.append(["" if value is None else value for value in row])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def txt_bytes(text: str) -> bytes:
+    return (text or "").encode("utf-8")
+
+
+_exports = OrderedDict()
+_exports_lock = threading.Lock()
+
+
+def get_export(generation_id: str, view: str, fmt: str, build):
+    """
+    Return the export for one generation, calling build() only the first time
+    it is requested. Safe to use as a deferred download_button callable.
+    """
+    key = (generation_id, view, fmt)
+    with _exports_lock:
+        if key in _exports:
+            _exports.move_to_end(key)
+            return _exports[key]
+    data = build()
+    with _exports_lock:
+        _exports[key] = data
+        while len(_exports) > EXPORT_CACHE_SIZE:
+            _exports.popitem(last=False)
+    return data
@@ -0,0 +1,188 @@
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import threading
+import time
+from botocore.exceptions import ClientError
+from bedrock_client import model_family
+
+# Stand-in for the bedrock-runtime client, used when BEDROCK_FAKE=1. It answers
+# estimate and generation prompts with well-formed test cases after a
+# simulated delay, so the scheduler, rate limiter and UI can be exercised
+# without AWS credentials.
+FAKE_BEDROCK_LATENCY = float(os.getenv("FAKE_BEDROCK_LATENCY", "0.5"))
+FAKE_BEDROCK_TOKENS_PER_SECOND = float(os.getenv("FAKE_BEDROCK_TOKENS_PER_SECOND", "200"))
+FAKE_BEDROCK_THROTTLE_RATE = float(os.getenv("FAKE_BEDROCK_THROTTLE_RATE", "0"))
+# Per-region latency overrides, e.g. '{"us-west-2": 0.8}', and a slow tail:
+# this share of calls waits FAKE_BEDROCK_TAIL_LATENCY extra seconds
+FAKE_BEDROCK_REGION_LATENCY = json.loads(os.getenv("FAKE_BEDROCK_REGION_LATENCY", "{}") or "{}")
+FAKE_BEDROCK_TAIL_RATE = float(os.getenv("FAKE_BEDROCK_TAIL_RATE", "0"))
+FAKE_BEDROCK_TAIL_LATENCY = float(os.getenv("FAKE_BEDROCK_TAIL_LATENCY", "5"))
+# Prompt cache simulation: prefixes marked with cache_control are written on
+# first use and read while unexpired; shorter prefixes are not cached.
+FAKE_BEDROCK_CACHE_TTL = float(os.getenv("FAKE_BEDROCK_CACHE_TTL", "300"))
+FAKE_BEDROCK_CACHE_MIN_TOKENS = int(os.getenv("FAKE_BEDROCK_CACHE_MIN_TOKENS", "1024"))
+
+_COUNT_RE = re.compile(r"(?:Generate|Write only the remaining) (\d+)")
+_START_RE = re.compile(r"starting at TC-(\d+)")
+
+
+def _fake_cases(prompt: str) -> str:
+    if "optimal number of manual test cases" in prompt:
+        return "- number: 12\n- rationale:\n  - fake estimate\n  - covers main flows\n"
+    counts = _COUNT_RE.findall(prompt)
+    count = int(counts[-1]) if counts else 5
+    starts = _START_RE.findall(prompt)
+    start = int(starts[-1]) if starts else 1
+    bdd = "in the BDD format" in prompt
+    if "single JSON array" in prompt:
+        return _fake_json_cases(start, count, bdd)
+    cases = []
+    for n in range(start, start + count):
+        if bdd:
+            cases.append(f"Scenario: Fake scenario {n}\nGiven the system is ready\n"
+                         f"When the user performs action {n}\nThen outcome {n} is shown")
+        else:
+            cases.append(f"ID: TC-{n:03d}\nTitle: Fake test case {n}\nPreconditions: None\nSteps:\n"
+                         f"1. Open the page\n2. Perform action {n}\n3. Submit\n"
+                         f"Expected Result: Outcome {n} is shown\nPriority: Medium\nTags: fake")
+    return "\n\n".join(cases) + "\n"
+
+
+def _fake_json_cases(start: int, count: int, bdd: bool) -> str:
+    cases = []
+    for n in range(start, start + count):
+        if bdd:
+            cases.append({"test_case_id": f"TC-{n:03d}", "scenario": f"Fake scenario {n}", "preconditions": "",
+                          "steps": ["Given the system is ready", f"When the user performs action {n}",
+                                    f"Then outcome {n} is shown"]})
+        else:
+            cases.append({"test_case_id": f"TC-{n:03d}", "title": f"Fake test case {n}", "preconditions": "None",
+                          "steps": [{"step_number": 1, "action": "Open the page", "expected_result": "Page is shown"},
+                                    {"step_number": 2, "action": f"Perform action {n}", "expected_result": "Accepted"},
+                                    {"step_number": 3, "action": "Submit", "expected_result": f"Outcome {n} is shown"}],
+                          "expected_result": f"Outcome {n} is shown", "priority": "Medium", "tags": ["fake"]})
+    return json.dumps(cases, indent=2) + "\n"
+
+
+class FakeBedrockClient:
+    def __init__(self, latency: float = None,
+                 tokens_per_second: float = FAKE_BEDROCK_TOKENS_PER_SECOND,
+                 throttle_rate: float = FAKE_BEDROCK_THROTTLE_RATE, region: str = None):
+        self.region = region
+        self.latency = FAKE_BEDROCK_REGION_LATENCY.get(region, FAKE_BEDROCK_LATENCY) if latency is None else latency
+        self.tokens_per_second = tokens_per_second
+        self.throttle_rate = throttle_rate
+        self.calls = 0
+        self._prompt_cache = {}  # prefix hash -> expiry
+        self._cache_lock = threading.Lock()
+
+    def _cache_usage(self, blocks: list) -> tuple:
+        """(cache read tokens, cache write tokens) for a messages request, refreshing used prefixes."""
+        checkpoints = []
+        digest = hashlib.sha256()
+        tokens = 0
+        for block in blocks:
+            digest.update(block["text"].encode("utf-8"))
+            tokens += len(block["text"]) // 4
+            if "cache_control" in block and tokens >= FAKE_BEDROCK_CACHE_MIN_TOKENS:
+                checkpoints.append((digest.hexdigest(), tokens))
+        if not checkpoints:
+            return 0, 0
+        now = time.monotonic()
+        with self._cache_lock:
+            read = 0
+            for key, prefix_tokens in checkpoints:
+                if self._prompt_cache.get(key, 0) > now:
+                    read = prefix_tokens
+            # Reads refresh the TTL; the longest prefix is written if it was missing
+            for key, _ in checkpoints:
+                self._prompt_cache[key] = now + FAKE_BEDROCK_CACHE_TTL
+        return read, checkpoints[-1][1] - read
+
+    def _first_token_delay(self) -> float:
+        if random.random() < FAKE_BEDROCK_TAIL_RATE:
+            return self.latency + FAKE_BEDROCK_TAIL_LATENCY
+        return self.latency
+
+    def _complete(self, body: str, operation: str):
+        self.calls += 1
+        if random.random() < self.throttle_rate:
+            time.sleep(self.latency / 10)
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Too many requests"}},
+                              operation)
+        request = json.loads(body)
+        cache_read = cache_write = 0
+        if "messages" in request:
+            blocks = request["messages"][0]["content"]
+            prompt = "".join(block["text"] for block in blocks)
+            max_tokens = request["max_tokens"]
+            cache_read, cache_write = self._cache_usage(blocks)
+        elif "prompt" in request:
+            prompt, max_tokens = request["prompt"], request["max_tokens_to_sample"]
+        else:
+            prompt, max_tokens = request["inputText"], request["textGenerationConfig"]["maxTokenCount"]
+        text = _fake_cases(prompt)
+        stop_reason = "end_turn"
+        # About 4 characters per token, cut off at max_tokens like the real service
+        if len(text) // 4 > max_tokens:
+            text, stop_reason = text[:max_tokens * 4], "max_tokens"
+        # Like the service, input tokens exclude the cached part of the prompt
+        usage = {"input_tokens": len(prompt) // 4 - cache_read - cache_write, "output_tokens": len(text) // 4,
+                 "cache_read_input_tokens": cache_read, "cache_creation_input_tokens": cache_write}
+        return usage, text, stop_reason
+
+    def _body(self, model_id: str, text: str, stop_reason: str, usage: dict) -> dict:
+        family = model_family(model_id)
+        if family == "messages":
+            return {"content": [{"type": "text", "text": text}], "stop_reason": stop_reason, "usage": usage}
+        input_tokens, output_tokens = usage["input_tokens"], usage["output_tokens"]
+        if family == "anthropic":
+            return {"completion": text, "stop_reason": stop_reason}
+        return {"inputTextTokenCount": input_tokens,
+                "results": [{"outputText": text, "tokenCount": output_tokens,
+                             "completionReason": "LENGTH" if stop_reason == "max_tokens" else "FINISH"}]}
+
+    def invoke_model(self, modelId: str, body: str, **kwargs) -> dict:
+        usage, text, stop_reason = self._complete(body, "InvokeModel")
+        time.sleep(self._first_token_delay() + usage["output_tokens"] / self.tokens_per_second)
+        payload = self._body(modelId, text, stop_reason, usage)
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8")),
+                "ResponseMetadata": {"HTTPHeaders": {
+                    "x-amzn-bedrock-input-token-count": str(usage["input_tokens"]),
+                    "x-amzn-bedrock-output-token-count": str(usage["output_tokens"])}}}
+
+    def invoke_model_with_response_stream(self, modelId: str, body: str, **kwargs) -> dict:
+        usage, text, stop_reason = self._complete(body, "InvokeModelWithResponseStream")
+        return {"body": self._events(modelId, usage, text, stop_reason)}
+
+    def _events(self, model_id: str, usage: dict, text: str, stop_reason: str):
+        family = model_family(model_id)
+        time.sleep(self._first_token_delay())
+        if family == "messages":
+            start = {"type": "message_start", "message": {"role": "assistant", "usage": usage}}
+            yield {"chunk": {"bytes": json.dumps(start).encode("utf-8")}}
+        pieces = [text[i:i + 40] for i in range(0, len(text), 40)]
+        for piece in pieces:
+            time.sleep(len(piece) / 4 / self.tokens_per_second)
+            if family == "messages":
+                chunk = {"type": "content_block_delta", "delta": {"type": "text_delta", "text": piece}}
+            elif family == "anthropic":
+                chunk = {"completion": piece}
+            else:
+                chunk = {"outputText": piece}
+            yield {"chunk": {"bytes": json.dumps(chunk).encode("utf-8")}}
+        metrics = {"inputTokenCount": usage["input_tokens"], "outputTokenCount": usage["output_tokens"],
+                   "cacheReadInputTokenCount": usage["cache_read_input_tokens"],
+                   "cacheWriteInputTokenCount": usage["cache_creation_input_tokens"]}
+        if family == "messages":
+            last = {"type": "message_delta", "delta": {"stop_reason": stop_reason}}
+        elif family == "anthropic":
+            last = {"completion": "", "stop_reason": stop_reason}
+        else:
+            last = {"outputText": "", "completionReason": "LENGTH" if stop_reason == "max_tokens" else "FINISH"}
+        last["amazon-bedrock-invocationMetrics"] = metrics
+        yield {"chunk": {"bytes": json.dumps(last).encode("utf-8")}}
@@ -0,0 +1,49 @@
+"""
+Download tiktoken BPE files into the bundled tokenizer directory, so token
+counting works without network access at runtime (see utils.py).
+
+    python fetch_tokenizer.py                          # cl100k_base into tokenizer_data/
+    python fetch_tokenizer.py cl100k_base --dir /opt/tokenizer_data
+
+Each file is checked against tiktoken's expected sha256 and written as
+<name>.tiktoken. Only encodings listed in utils.LOCAL_ENCODINGS can be
+loaded from a local file.
+"""
+import argparse
+import os
+import sys
+
+from utils import LOCAL_ENCODINGS, TOKENIZER_BPE_DIR, bpe_path
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Download tiktoken BPE files for offline use.")
+    parser.add_argument("encodings", nargs="*", default=["cl100k_base"],
+                        help=f"Encodings to fetch: {', '.join(sorted(LOCAL_ENCODINGS))} (default: cl100k_base)")
+    parser.add_argument("--dir", default=TOKENIZER_BPE_DIR, help=f"Target directory (default: {TOKENIZER_BPE_DIR})")
+    args = parser.parse_args()
+    unknown = [name for name in args.encodings if name not in LOCAL_ENCODINGS]
+    if unknown:
+        parser.error(f"no local loader for {', '.join(unknown)}")
+    os.makedirs(args.dir, exist_ok=True)
+    from tiktoken.load import check_hash, read_file
+    for name in args.encodings:
+        spec = LOCAL_ENCODINGS[name]
+        try:
+            contents = read_file(spec["url"])
+        except Exception as e:
+            print(f"[failed] {name}: {e}", file=sys.stderr)
+            return 1
+        if not check_hash(contents, spec["sha256"]):
+            print(f"[failed] {name}: hash mismatch for {spec['url']}", file=sys.stderr)
+            return 1
+        path = bpe_path(name, args.dir)
+        with open(path + ".tmp", "wb") as f:
+            f.write(contents)
+        os.replace(path + ".tmp", path)
+        print(f"[ok] {name}: {path} ({len(contents)} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,36 @@
-import pdfplumber
-from docx import Document
-import streamlit as st
-import pandas as pd
+import hashlib
+import importlib
 import io
+import json
+import os
 import re
-import pandas as pd
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from utils import count_tokens
+from tracing import add_span, span
+
+# pdfplumber, python-docx, pandas and streamlit are imported where they are
+# used, so pasting text never pays for the PDF/DOCX libraries at startup.
+
+# Extracted text and token counts, keyed by a hash of the upload's content.
+# The in-memory LRU is always on; set EXTRACTION_CACHE_DIR to also keep
+# results on disk across restarts.
+EXTRACTION_CACHE_SIZE = int(os.getenv("EXTRACTION_CACHE_SIZE", "32"))
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", "")
+
+# PDFs with at least PDF_PARALLEL_MIN_PAGES selected pages are extracted by a
+# process pool in batches of PDF_PAGES_PER_TASK pages.
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(os.cpu_count() or 1, 8))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
 
 
 def save_test_cases(text, format):
+    import pandas as pd
+    import streamlit as st
     lines = [line.strip() for line in text.split("\n") if line.strip()]
     df = pd.DataFrame({"Test Cases": lines})
 
@@ -28,29 +51,264 @@ def save_test_cases(text, format):
 
 
 
-def extract_text_from_pdf(file_stream) -> str:
-    text = []
-    with pdfplumber.open(file_stream) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text.append(page_text)
-    return "\n\n".join(text)
+def parse_page_range(spec: str, page_count: int) -> list:
+    """
+    Turn a page selection such as "1-5, 8, 12-" into sorted 0-based page
+    indices. An empty spec selects every page; out-of-range pages are ignored.
+    """
+    if not spec or not spec.strip():
+        return list(range(page_count))
+    selected = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        m = re.fullmatch(r"(\d*)\s*-\s*(\d*)|(\d+)", part)
+        if not m:
+            raise ValueError(f"Invalid page range: {part!r}")
+        if m.group(3):
+            first = last = int(m.group(3))
+        else:
+            first = int(m.group(1) or 1)
+            last = int(m.group(2) or page_count)
+        selected.update(range(max(first, 1) - 1, min(last, page_count)))
+    return sorted(selected)
+
+
+def _page_text(pdf, index: int) -> str:
+    page = pdf.pages[index]
+    text = page.extract_text() or ""
+    # Release the parsed layout so memory stays flat on long documents
+    page.close()
+    return text
+
+
+def _extract_pdf_pages(data: bytes, indices: list) -> list:
+    # Runs in a worker process, so it reopens the document from bytes
+    import pdfplumber
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        return [_page_text(pdf, i) for i in indices]
+
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # spawn: forking a multi-threaded Streamlit server is not safe
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _pdf_pool
+
+
+def iter_pdf_pages(file_stream, pages: str = None, workers: int = None):
+    """
+    Yield (page_number, text) in page order. Large selections are split into
+    page batches across a process pool; each batch is yielded as soon as it
+    and all batches before it are done.
+    """
+    import pdfplumber
+    data = file_stream.getvalue() if hasattr(file_stream, "getvalue") else file_stream.read()
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        indices = parse_page_range(pages, len(pdf.pages))
+        workers = PDF_EXTRACT_WORKERS if workers is None else workers
+        if workers <= 1 or len(indices) < PDF_PARALLEL_MIN_PAGES:
+            for i in indices:
+                yield i + 1, _page_text(pdf, i)
+            return
+    batches = [indices[k:k + PDF_PAGES_PER_TASK] for k in range(0, len(indices), PDF_PAGES_PER_TASK)]
+    pool = _get_pdf_pool() if workers == PDF_EXTRACT_WORKERS else \
+        ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        futures = [pool.submit(_extract_pdf_pages, data, batch) for batch in batches]
+        for batch, future in zip(batches, futures):
+            for i, text in zip(batch, future.result()):
+                yield i + 1, text
+    finally:
+        if pool is not _pdf_pool:
+            pool.shutdown(cancel_futures=True)
+
+
+def _normalize_margin_line(line: str) -> str:
+    # Short lines such as "Page 3 of 40" and "Page 4 of 40" count as the same
+    # footer; longer lines must repeat verbatim so real content is kept.
+    line = line.strip().lower()
+    return re.sub(r"\d+", "#", line) if len(line) <= 40 else line
+
+
+def strip_repeated_headers_footers(pages: list, margin_lines: int = 2, min_share: float = 0.6) -> list:
+    """Drop lines at the top/bottom of pages that repeat on most pages."""
+    if len(pages) < 3:
+        return pages
+    counts = Counter()
+    for text in pages:
+        lines = [l for l in text.split("\n") if l.strip()]
+        margin = set(lines[:margin_lines] + lines[-margin_lines:])
+        counts.update({_normalize_margin_line(l) for l in margin})
+    threshold = max(2, int(len(pages) * min_share))
+    repeated = {line for line, n in counts.items() if n >= threshold}
+    if not repeated:
+        return pages
+    cleaned = []
+    for text in pages:
+        lines = text.split("\n")
+        non_blank = [i for i, l in enumerate(lines) if l.strip()]
+        edge = set(non_blank[:margin_lines] + non_blank[-margin_lines:])
+        cleaned.append("\n".join(l for i, l in enumerate(lines)
+                                 if not (i in edge and _normalize_margin_line(l) in repeated)))
+    return cleaned
+
+
+def extract_text_from_pdf(file_stream, pages: str = None, strip_headers: bool = True) -> str:
+    text = [page_text for _, page_text in iter_pdf_pages(file_stream, pages)]
+    if strip_headers:
+        text = strip_repeated_headers_footers(text)
+    return "\n\n".join(t for t in text if t.strip())
 
 def extract_text_from_docx(file_stream) -> str:
+    from docx import Document
     doc = Document(file_stream)
     return "\n\n".join([p.text for p in doc.paragraphs if p.text])
 
-def read_uploaded_file(uploaded) -> str:
+def extract_text_from_txt(file_stream) -> str:
+    return file_stream.getvalue().decode('utf-8', errors='ignore')
+
+
+# Extractors by file extension, called as extractor(file_stream, pages). An
+# entry may be a "module:function" string, imported the first time a file
+# of that type is read.
+_EXTRACTORS = {
+    ".pdf": extract_text_from_pdf,
+    ".docx": lambda file_stream, pages=None: extract_text_from_docx(file_stream),
+    ".txt": lambda file_stream, pages=None: extract_text_from_txt(file_stream),
+}
+_extractors_lock = threading.Lock()
+
+
+def register_extractor(extension: str, extractor):
+    """
+    Add or replace the extractor for a file extension such as ".md", either a
+    callable or a "module:function" string resolved on first use.
+    """
+    with _extractors_lock:
+        _EXTRACTORS[extension.lower()] = extractor
+
+
+def supported_extensions() -> list:
+    with _extractors_lock:
+        return sorted(_EXTRACTORS)
+
+
+def get_extractor(filename: str):
+    ext = os.path.splitext(filename.lower())[1]
+    with _extractors_lock:
+        extractor = _EXTRACTORS.get(ext, _EXTRACTORS[".txt"])
+        if isinstance(extractor, str):
+            module, _, name = extractor.partition(":")
+            extractor = _EXTRACTORS[ext] = getattr(importlib.import_module(module), name)
+    return extractor
+
+
+def read_uploaded_file(uploaded, pages: str = None) -> str:
     if not uploaded:
         return ""
-    fname = uploaded.name.lower()
-    if fname.endswith('.pdf'):
-        return extract_text_from_pdf(uploaded)
-    elif fname.endswith('.docx'):
-        return extract_text_from_docx(uploaded)
-    else:
-        return uploaded.getvalue().decode('utf-8', errors='ignore')
+    # Unknown extensions are read as plain text
+    return get_extractor(uploaded.name)(uploaded, pages)
+
+
+_extraction_cache = OrderedDict()
+_extraction_lock = threading.Lock()
+_extraction_inflight = {}
+
+
+def upload_digest(uploaded, pages: str = None) -> str:
+    ext = os.path.splitext(uploaded.name.lower())[1]
+    options = f"{ext}\0{(pages or '').replace(' ', '')}\0"
+    return hashlib.sha256(options.encode() + uploaded.getvalue()).hexdigest()
+
+
+def _disk_path(digest: str) -> str:
+    return os.path.join(EXTRACTION_CACHE_DIR, f"{digest}.json")
+
+
+def _load_from_disk(digest: str):
+    if not EXTRACTION_CACHE_DIR:
+        return None
+    try:
+        with open(_disk_path(digest), encoding="utf-8") as f:
+            data = json.load(f)
+        return data["text"], data["tokens"], data.get("timings", {})
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _save_to_disk(digest: str, result: tuple):
+    if not EXTRACTION_CACHE_DIR:
+        return
+    os.makedirs(EXTRACTION_CACHE_DIR, exist_ok=True)
+    tmp = _disk_path(digest) + f".{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"text": result[0], "tokens": result[1], "timings": result[2]}, f)
+    os.replace(tmp, _disk_path(digest))
+
+
+def _remember(digest: str, result: tuple):
+    with _extraction_lock:
+        _extraction_cache[digest] = result
+        _extraction_cache.move_to_end(digest)
+        while len(_extraction_cache) > EXTRACTION_CACHE_SIZE:
+            _extraction_cache.popitem(last=False)
+
+
+def extract_uploaded_file(uploaded, pages: str = None) -> tuple:
+    """
+    Return (text, token_count) for an upload, extracting each unique file
+    content only once per process no matter how often the script reruns.
+    """
+    if not uploaded:
+        return "", 0
+    digest = upload_digest(uploaded, pages)
+    with _extraction_lock:
+        result = _extraction_cache.get(digest)
+        if result is not None:
+            _extraction_cache.move_to_end(digest)
+        else:
+            # Concurrent sessions uploading the same file wait for one extraction
+            inflight = _extraction_inflight.setdefault(digest, threading.Lock())
+    if result is None:
+        with inflight:
+            with _extraction_lock:
+                result = _extraction_cache.get(digest)
+            try:
+                if result is None:
+                    result = _load_from_disk(digest)
+                if result is None:
+                    if hasattr(uploaded, "seek"):
+                        uploaded.seek(0)
+                    with span("extract"):
+                        started = time.perf_counter()
+                        text = read_uploaded_file(uploaded, pages)
+                        extract_seconds = time.perf_counter() - started
+                    with span("count_tokens"):
+                        started = time.perf_counter()
+                        tokens = count_tokens(text)
+                    result = (text, tokens, {"extract": extract_seconds,
+                                             "count_tokens": time.perf_counter() - started})
+                    _save_to_disk(digest, result)
+                    _remember(digest, result)
+                    return result[:2]
+                _remember(digest, result)
+            finally:
+                with _extraction_lock:
+                    _extraction_inflight.pop(digest, None)
+    # Served from cache: report what the original extraction cost so traced
+    # runs still show the per-document breakdown
+    for stage, seconds in result[2].items():
+        add_span(stage, seconds, cached=True)
+    return result[:2]
 
 # def parse_test_cases_to_rows(ai_output: str):
 #     """
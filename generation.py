@@ -0,0 +1,446 @@
+import json
+import os
+import queue
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from bedrock_client import call_bedrock_model, prompt_text
+from parsers import json_case_objects, parse_store
+from scheduler import run_in_context
+from section_store import get_section_store, section_hash, section_key
+from prompts import (PROMPT_PREFIX, ESTIMATE_TASK, GENERATE_INSTRUCTIONS, GENERATE_TASK, FORMAT_INSTRUCTIONS,
+                     JSON_FORMAT_INSTRUCTIONS, BATCH_PROMPT_SUFFIX, CONTINUE_PROMPT_SUFFIX)
+from token_budget import get_token_stats
+
+MAX_TOKENS_PER_CALL = 8000
+# Upper bound on concurrent section calls per generation
+GENERATION_MAX_WORKERS = int(os.getenv("GENERATION_MAX_WORKERS", "4"))
+# Target section size in characters (roughly 2k tokens of requirements)
+SECTION_TARGET_CHARS = int(os.getenv("GENERATION_SECTION_CHARS", "8000"))
+# Requests for more cases than this are paged through in batches
+GENERATION_BATCH_SIZE = int(os.getenv("GENERATION_BATCH_SIZE", "25"))
+# Follow-up calls allowed per batch when output hits max_tokens
+GENERATION_MAX_CONTINUATIONS = int(os.getenv("GENERATION_MAX_CONTINUATIONS", "3"))
+# Incremental sections end after a paragraph whose hash is divisible by this,
+# so section boundaries depend only on nearby text (about 4 paragraphs each)
+SECTION_BOUNDARY_EVERY = int(os.getenv("GENERATION_SECTION_BOUNDARY_EVERY", "4"))
+# Hash boundaries are ignored until a section has this many characters
+SECTION_MIN_CHARS = SECTION_TARGET_CHARS // 4
+
+# Coverage areas handed to concurrent batches so they don't overlap. Batches
+# sharing an area run one after another and see what was already written.
+BATCH_FOCUS = [
+    "core positive flows and happy paths",
+    "negative cases and invalid input",
+    "boundary values and limits",
+    "roles, permissions and security",
+    "error handling and recovery",
+    "data persistence, state changes and integrations",
+    "usability and uncommon edge cases",
+]
+
+# Lines that start a new requirement section: markdown headings, numbered
+# headings ("3.", "3.2 Login"), requirement ids ("REQ-12", "FR 3") and
+# short ALL-CAPS titles.
+_HEADING_RE = re.compile(
+    r"^\s*(?:#{1,6}\s+\S"
+    r"|(?:\d+\.)+\d*\s+\S"
+    r"|(?:REQ|FR|NFR|US|UC)[-_ ]?\d+"
+    r"|[A-Z][A-Z0-9 /&\-]{3,60}$)"
+)
+_ESTIMATE_NUMBER_RE = re.compile(r'number:\s*(\d+)', re.IGNORECASE)
+_CASE_START_RE = {
+    "Traditional": re.compile(r"^[ \t]*(?:[-*][ \t]*)?(?:\*\*)?(?:ID\b|TC-\d+)", re.IGNORECASE | re.MULTILINE),
+    "BDD": re.compile(r"^.*\bscenario(?: outline)?\b\W*:", re.IGNORECASE | re.MULTILINE),
+}
+_TC_TAG_LINE_RE = re.compile(r"^[ \t]*@TC-\d+[ \t]*\n", re.IGNORECASE | re.MULTILINE)
+_ID_LINE_RE = re.compile(r"^(\s*(?:[-*]\s*)?(?:\*\*)?ID:?(?:\*\*)?:?\s*)TC-\d+", re.IGNORECASE | re.MULTILINE)
+
+
+def build_estimate_prompt(requirements: str) -> tuple:
+    """Estimate prompt as (cacheable prefix, task) segments."""
+    return PROMPT_PREFIX.format(requirements=requirements), ESTIMATE_TASK
+
+
+def build_generate_prompt(requirements: str, count: int, test_type: str, output_format: str = "text",
+                          task_suffix: str = "") -> tuple:
+    """
+    Generation prompt as (requirements prefix, format instructions, task)
+    segments. The first two are the same for every batch and continuation
+    on the same requirements; task_suffix is appended to the task.
+    """
+    instructions = JSON_FORMAT_INSTRUCTIONS if output_format == "json" else FORMAT_INSTRUCTIONS
+    fmt_inst = instructions["traditional"] if test_type == "Traditional" else instructions["bdd"]
+    return (
+        PROMPT_PREFIX.format(requirements=requirements),
+        GENERATE_INSTRUCTIONS.format(format_instructions=fmt_inst),
+        GENERATE_TASK.format(count=count, format=test_type.upper()) + task_suffix,
+    )
+
+
+def parse_estimated_count(estimation: str):
+    """Pull the suggested case count out of an estimate answer, or None."""
+    m = _ESTIMATE_NUMBER_RE.search(estimation or "")
+    return int(m.group(1)) if m else None
+
+
+def _heading_blocks(text: str) -> list:
+    blocks = []
+    current = []
+    for line in text.split("\n"):
+        if current and line.strip() and _HEADING_RE.match(line):
+            blocks.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current).strip())
+    return blocks
+
+
+def split_stable_sections(text: str, target_chars: int = SECTION_TARGET_CHARS,
+                          min_chars: int = SECTION_MIN_CHARS) -> list:
+    """
+    Content-defined sections for chunked generation. A section ends at
+    a heading or paragraph whose content hash marks a boundary once it has
+    min_chars, or before it would outgrow target_chars. Unlike greedy packing,
+    an edit only moves the boundaries of its own section (and at most the next
+    one), so the other sections keep their hashes.
+    """
+    units = []
+    for block in _heading_blocks(text):
+        if len(block) <= target_chars:
+            units.append(block)
+            continue
+        for para in re.split(r"\n\s*\n", block):
+            units += [para] if len(para) <= target_chars else para.split("\n")
+
+    sections = []
+    packed = ""
+    for unit in units:
+        unit = unit.strip()
+        if not unit:
+            continue
+        if packed and len(packed) + len(unit) + 2 > target_chars:
+            sections.append(packed)
+            packed = ""
+        packed = f"{packed}\n\n{unit}" if packed else unit
+        if len(packed) >= min_chars and zlib.crc32(" ".join(unit.split()).encode("utf-8")) % SECTION_BOUNDARY_EVERY == 0:
+            sections.append(packed)
+            packed = ""
+    if packed:
+        sections.append(packed)
+    return sections
+
+
+def allocate_case_counts(sections: list, total: int) -> list:
+    """
+    Spread `total` cases over sections in proportion to their size (largest
+    remainder). Every section gets at least one case when there are enough;
+    with fewer cases than sections the smallest get none.
+    """
+    sizes = [max(len(s), 1) for s in sections]
+    whole = sum(sizes)
+    floor = 1 if total >= len(sections) else 0
+    spare = total - floor * len(sections)
+    shares = [spare * size / whole for size in sizes]
+    counts = [floor + int(share) for share in shares]
+    remainder = total - sum(counts)
+    order = sorted(range(len(sections)), key=lambda i: (shares[i] - int(shares[i]), sizes[i]), reverse=True)
+    for i in order[:remainder]:
+        counts[i] += 1
+    return counts
+
+
+def _join_json(outputs: list, test_type: str, renumber: bool = False) -> str:
+    # JSON-mode outputs are stitched into one array of their valid objects
+    objects = [obj for out in outputs if out for obj in json_case_objects(out, test_type)]
+    if renumber:
+        for n, obj in enumerate(objects, start=1):
+            obj["test_case_id"] = f"TC-{n:03d}"
+    return json.dumps(objects, indent=2, ensure_ascii=False) if objects else ""
+
+
+def _join(outputs: list, test_type: str, output_format: str) -> str:
+    if output_format == "json":
+        return _join_json(outputs, test_type)
+    return "\n\n".join(o.strip() for o in outputs if o and o.strip())
+
+
+def renumber_case_ids(outputs: list, test_type: str = "Traditional", output_format: str = "text") -> str:
+    """Join per-section outputs and renumber their TC-### ids globally."""
+    if output_format == "json":
+        return _join_json(outputs, test_type, renumber=True)
+    counter = 0
+
+    def _next_id(match):
+        nonlocal counter
+        counter += 1
+        return f"{match.group(1)}TC-{counter:03d}"
+
+    return "\n\n".join(_ID_LINE_RE.sub(_next_id, out.strip()) for out in outputs if out and out.strip())
+
+
+def number_case_ids(output: str, test_type: str, output_format: str, first_id: int) -> str:
+    """Give one output's cases the ids first_id, first_id + 1, ... (BDD text gets @TC-### tags)."""
+    if output_format == "json":
+        objects = json_case_objects(output, test_type)
+        for n, obj in enumerate(objects, start=first_id):
+            obj["test_case_id"] = f"TC-{n:03d}"
+        return json.dumps(objects, indent=2, ensure_ascii=False) if objects else ""
+    counter = first_id - 1
+
+    def _next_id(match):
+        nonlocal counter
+        counter += 1
+        if test_type == "Traditional":
+            return f"{match.group(1)}TC-{counter:03d}"
+        return f"@TC-{counter:03d}\n{match.group(0)}"
+
+    if test_type == "Traditional":
+        return _ID_LINE_RE.sub(_next_id, output.strip())
+    return _CASE_START_RE["BDD"].sub(_next_id, _TC_TAG_LINE_RE.sub("", output.strip()))
+
+
+def _complete_cases(text: str, test_type: str, output_format: str = "text") -> tuple:
+    """Cut a truncated completion before its last (unfinished) case."""
+    if output_format == "json":
+        # Only closed objects are decoded, so the unfinished one is already gone
+        complete = _join_json([text], test_type)
+        return complete, parse_store(complete, test_type, output_format).titles()
+    starts = [m.start() for m in _CASE_START_RE[test_type].finditer(text)]
+    if not starts:
+        return "", []
+    complete = text[:starts[-1]].rstrip()
+    return complete, parse_store(complete, test_type).titles()
+
+
+def count_cases(text: str, test_type: str, output_format: str = "text") -> int:
+    """Cases in a completion, for usage accounting."""
+    if output_format == "json":
+        return len(json_case_objects(text, test_type))
+    return len(_CASE_START_RE[test_type].findall(text))
+
+
+def record_usage(model_id: str, test_type: str, output_format: str, prompt, result: dict):
+    """Feed one generation call's reported usage into the learned token budget."""
+    if result.get("truncated"):
+        cases = len(_complete_cases(result["text"], test_type, output_format)[1])
+    else:
+        cases = count_cases(result["text"], test_type, output_format)
+    get_token_stats().record(model_id, test_type, output_format, cases, result, len(prompt_text(prompt)))
+
+
+def generate_cases(requirements: str, count: int, test_type: str, model_id: str,
+                   temperature: float = 0.0, use_cache: bool = True,
+                   suffix: str = "", start: int = 1, written: list = None, output_format: str = "text") -> str:
+    """
+    Generate `count` cases in one call, continuing from the last complete case
+    whenever the completion stops at max_tokens. max_tokens comes from the
+    usage learned for the model, test type and output format.
+    """
+    stats = get_token_stats()
+    written = list(written or [])
+    outputs = []
+    produced = 0
+    for _ in range(GENERATION_MAX_CONTINUATIONS + 1):
+        remaining = count - produced
+        task_suffix = suffix
+        if written:
+            task_suffix += CONTINUE_PROMPT_SUFFIX.format(
+                written="\n".join(f"- {t}" for t in written if t),
+                remaining=remaining,
+                start=start + produced
+            )
+        prompt = build_generate_prompt(requirements, remaining, test_type, output_format, task_suffix)
+        result = call_bedrock_model(
+            prompt=prompt,
+            model_id=model_id,
+            max_tokens=min(stats.output_budget(model_id, test_type, output_format, remaining), MAX_TOKENS_PER_CALL),
+            temperature=temperature,
+            use_cache=use_cache,
+            return_details=True
+        )
+        if not result["truncated"]:
+            stats.record(model_id, test_type, output_format, count_cases(result["text"], test_type, output_format),
+                         result, len(prompt_text(prompt)))
+            outputs.append(result["text"])
+            break
+        complete, titles = _complete_cases(result["text"], test_type, output_format)
+        stats.record(model_id, test_type, output_format, len(titles), result, len(prompt_text(prompt)))
+        if not titles:
+            # Not even one full case fit; keep what there is rather than loop
+            outputs.append(result["text"])
+            break
+        outputs.append(complete)
+        produced += len(titles)
+        written += titles
+        if produced >= count:
+            break
+    return _join(outputs, test_type, output_format)
+
+
+def continue_truncated(text: str, requirements: str, count: int, test_type: str, model_id: str,
+                       temperature: float = 0.0, use_cache: bool = True, output_format: str = "text") -> str:
+    """Keep the complete cases of a truncated completion and generate the rest."""
+    complete, titles = _complete_cases(text, test_type, output_format)
+    if not titles or len(titles) >= count:
+        return text
+    rest = generate_cases(requirements, count - len(titles), test_type, model_id, temperature, use_cache,
+                          start=len(titles) + 1, written=titles, output_format=output_format)
+    return renumber_case_ids([complete, rest], test_type, output_format)
+
+
+def batch_sizes(count: int, batch_size: int = GENERATION_BATCH_SIZE) -> list:
+    full, rest = divmod(count, batch_size)
+    return [batch_size] * full + ([rest] if rest else [])
+
+
+def generate_paged(requirements_text: str, count: int, test_type: str, model_id: str,
+                   temperature: float = 0.0, max_workers: int = GENERATION_MAX_WORKERS,
+                   use_cache: bool = True, batch_size: int = GENERATION_BATCH_SIZE,
+                   on_batch_done=None, output_format: str = "text") -> str:
+    """
+    Page through a large case count in fixed-size batches. Each batch gets a
+    coverage focus; batches with different focus areas run concurrently,
+    batches sharing one run in order and are told what was already written.
+    Outputs are stitched in batch order with global TC-### ids.
+    """
+    sizes = batch_sizes(count, batch_size)
+    if len(sizes) == 1:
+        return generate_cases(requirements_text, count, test_type, model_id, temperature, use_cache,
+                              output_format=output_format)
+    starts = [1 + sum(sizes[:i]) for i in range(len(sizes))]
+    chains = {}
+    for i in range(len(sizes)):
+        chains.setdefault(i % len(BATCH_FOCUS), []).append(i)
+    outputs = [None] * len(sizes)
+    finished = queue.Queue()
+
+    def _run_chain(focus, indices):
+        written = []
+        for i in indices:
+            suffix = BATCH_PROMPT_SUFFIX.format(part=i + 1, parts=len(sizes), total=count,
+                                                focus=BATCH_FOCUS[focus], start=starts[i])
+            outputs[i] = generate_cases(requirements_text, sizes[i], test_type, model_id, temperature,
+                                        use_cache, suffix=suffix, start=starts[i], written=written,
+                                        output_format=output_format)
+            written += parse_store(outputs[i], test_type, output_format).titles()
+            finished.put(i)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chains)))) as pool:
+        futures = [run_in_context(pool, _run_chain, focus, indices) for focus, indices in chains.items()]
+        # Report progress from the calling thread so callers can touch widgets
+        done = 0
+        while done < len(sizes):
+            try:
+                finished.get(timeout=0.5)
+            except queue.Empty:
+                failed = [f for f in futures if f.done() and f.exception()]
+                if failed:
+                    raise failed[0].exception()
+                continue
+            done += 1
+            if on_batch_done:
+                on_batch_done(done, len(sizes))
+        for future in futures:
+            future.result()
+    return renumber_case_ids(outputs, test_type, output_format)
+
+
+def _fit_reused(stored: list, shares: list, count: int) -> list:
+    # A stored section is reused only when its case count is close to its
+    # share of `count` (within a quarter, or one case); the furthest off are
+    # then dropped until the reused cases leave at least one case for every
+    # section to generate, or add up to exactly `count` when none is left.
+    stored = [entry if entry and abs(entry[1] - share) <= max(1, share // 4) else None
+              for entry, share in zip(stored, shares)]
+    while True:
+        reused = [i for i, entry in enumerate(stored) if entry]
+        todo = len(stored) - len(reused)
+        total = sum(stored[i][1] for i in reused)
+        if not reused or (total + todo <= count if todo else total == count):
+            return stored
+        worst = max(reused, key=lambda i: (abs(stored[i][1] - shares[i]), stored[i][1]))
+        stored[worst] = None
+
+
+def generate_incremental(requirements_text: str, count: int, test_type: str, model_id: str,
+                         temperature: float = 0.0, max_workers: int = GENERATION_MAX_WORKERS,
+                         use_cache: bool = True, on_section_done=None, output_format: str = "text",
+                         previous_plan: list = None) -> tuple:
+    """
+    Chunked generation that only sends added or edited sections to the model.
+
+    Requirements are split into content-defined sections (split_stable_sections)
+    and each section's generated cases are stored under its content hash.
+    With fewer cases than sections, the smallest sections get no share and
+    are left out of this run.
+    Sections found in the store are reused as they are, as long as their case
+    counts still match their share of `count`; the others share the rest and are
+    generated concurrently. Without use_cache every section is regenerated
+    (and stored again).
+
+    previous_plan is the plan returned by the last run on an earlier version
+    of the same requirements: sections still present keep their TC ids, and
+    new cases are numbered after the highest id used so far.
+
+    Returns (output, plan, reused) where plan is a list of
+    {"hash", "first_id", "cases"} in document order.
+    """
+    store = get_section_store()
+    sections = split_stable_sections(requirements_text)
+    # Boundaries depend only on the text; the count only decides which sections get cases
+    shares = allocate_case_counts(sections, count)
+    sections, shares = [s for s, n in zip(sections, shares) if n], [n for n in shares if n]
+    hashes = [section_hash(section) for section in sections]
+    keys = [section_key(h, test_type, output_format, model_id) for h in hashes]
+    stored = [store.get(key) if store is not None and use_cache else None for key in keys]
+    stored = _fit_reused(stored, shares, count)
+    todo = [i for i, entry in enumerate(stored) if entry is None]
+    # New and edited sections share what the reused ones do not already cover
+    remaining = count - sum(entry[1] for entry in stored if entry)
+    counts = allocate_case_counts([sections[i] for i in todo], remaining) if todo else []
+
+    def _generate(section, section_count):
+        return generate_paged(section, section_count, test_type, model_id, temperature,
+                              max_workers=1, use_cache=use_cache, output_format=output_format)
+
+    outputs = [entry[0] if entry else None for entry in stored]
+    cases = [entry[1] if entry else 0 for entry in stored]
+    done = len(sections) - len(todo)
+    if on_section_done and done:
+        on_section_done(done, len(sections))
+    if todo:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(todo)))) as pool:
+            futures = {run_in_context(pool, _generate, sections[i], c): i for i, c in zip(todo, counts)}
+            for future in as_completed(futures):
+                i = futures[future]
+                outputs[i] = future.result()
+                cases[i] = len(parse_store(outputs[i], test_type, output_format))
+                if store is not None:
+                    store.put(keys[i], outputs[i], cases[i])
+                done += 1
+                if on_section_done:
+                    on_section_done(done, len(sections))
+
+    # Stable ids: sections carried over from the previous plan keep their range
+    previous = {}
+    for entry in previous_plan or []:
+        previous.setdefault(entry["hash"], entry)
+    first_ids = [None] * len(sections)
+    claimed = set()
+    for i, h in enumerate(hashes):
+        entry = previous.get(h)
+        if entry and h not in claimed and entry["cases"] == cases[i]:
+            first_ids[i] = entry["first_id"]
+            claimed.add(h)
+    next_id = 1 + max([e["first_id"] + e["cases"] - 1 for e in previous.values()] +
+                      [first_ids[i] + cases[i] - 1 for i in range(len(sections)) if first_ids[i]] + [0])
+    for i in range(len(sections)):
+        if first_ids[i] is None:
+            first_ids[i], next_id = next_id, next_id + cases[i]
+
+    numbered = [number_case_ids(outputs[i], test_type, output_format, first_ids[i]) for i in range(len(sections))]
+    output = _join(numbered, test_type, output_format)
+    plan = [{"hash": h, "first_id": f, "cases": n} for h, f, n in zip(hashes, first_ids, cases)]
+    return output, plan, len(sections) - len(todo)
@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from scheduler import bind_session
+
+# Generation jobs run here instead of in the Streamlit script thread, so a
+# rerun (any widget interaction) neither blocks on nor interrupts them.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Finished jobs kept in memory; the oldest are dropped first
+JOB_HISTORY_SIZE = int(os.getenv("JOB_HISTORY_SIZE", "50"))
+# How often the page refreshes the status of a running job
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """
+    One background run. The worker reports through update(); readers take a
+    consistent copy with snapshot().
+    """
+
+    def __init__(self, session_id: str, label: str, params: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.session_id = session_id
+        self.label = label
+        self.params = params
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Queued"
+        self.partial_cases = None   # CaseStore filled while the output streams
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def update(self, progress: float = None, message: str = None, partial_cases=None):
+        if self._cancel.is_set():
+            raise JobCancelled()
+        with self._lock:
+            if progress is not None:
+                self.progress = max(0.0, min(1.0, progress))
+            if message is not None:
+                self.message = message
+            if partial_cases is not None:
+                self.partial_cases = partial_cases
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            end = self.finished or time.time()
+            return {
+                "id": self.id, "label": self.label, "status": self.status, "progress": self.progress,
+                "message": self.message, "partial_cases": self.partial_cases, "error": self.error,
+                "elapsed": end - (self.started or end),
+            }
+
+
+class JobStore:
+    """Process-wide registry of jobs; lives as long as the server process."""
+
+    def __init__(self, workers: int = JOB_WORKERS, history: int = JOB_HISTORY_SIZE):
+        self.history = history
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+    def submit(self, session_id: str, label: str, fn, **params) -> Job:
+        """Run fn(job, **params) on the worker pool and return the job."""
+        job = Job(session_id, label, params)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        self._pool.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn):
+        # Model calls made by the job are queued under its session and the
+        # wait shows up as the job's status message
+        bind_session(job.session_id, on_wait=lambda position, waiting: job.update(
+            message=f"Waiting for a model slot (position {position} of {waiting})" if position else "Running"))
+        with job._lock:
+            if job._cancel.is_set():
+                job.status, job.message, job.finished = CANCELLED, "Cancelled", time.time()
+                return
+            job.status, job.message, job.started = RUNNING, "Running", time.time()
+        try:
+            result = fn(job, **job.params)
+        except JobCancelled:
+            status, result, error, message = CANCELLED, None, None, "Cancelled"
+        except Exception as e:
+            traceback.print_exc()
+            status, result, error, message = FAILED, None, str(e), "Failed"
+        else:
+            status, error, message = DONE, None, "Done"
+        with job._lock:
+            job.status, job.result, job.error, job.message = status, result, error, message
+            if status == DONE:
+                job.progress = 1.0
+            job.finished = time.time()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def for_session(self, session_id: str) -> list:
+        """The session's jobs, newest first."""
+        with self._lock:
+            return [job for job in reversed(self._jobs.values()) if job.session_id == session_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {status: sum(1 for job in jobs if job.status == status)
+                for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JobStore()
+        return _store
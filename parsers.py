@@ -0,0 +1,349 @@
+import json
+import re
+from case_store import BDD_COLUMNS, TRADITIONAL_COLUMNS, CaseStore, Step, TestCase
+
+# All patterns are compiled once and tolerate markdown decoration such as
+# "**Title:** x", "- **Title**: x" or "## Steps".
+_FIELD_RE = re.compile(
+    r"^[\s>#*-]*\**\s*"
+    r"(id|title|pre-?conditions?|steps?|expected results?|expected outcome|expected|priority|tags?)"
+    r"\s*\**\s*:\s*\**\s*(.*?)\s*$",
+    re.IGNORECASE,
+)
+_TC_LINE_RE = re.compile(r"^[\s#*-]*\**\s*(TC-\d+)\b", re.IGNORECASE)
+_STEP_RE = re.compile(r"^\s*(?:step\s*)?(\d+)\s*[.):-]\s*(.*?)\s*$", re.IGNORECASE)
+_BULLET_RE = re.compile(r"^\s*[-*•]\s+(.*?)\s*$")
+_SCENARIO_RE = re.compile(r"scenario(?: outline)?\s*\**\s*:\s*\**\s*(.*?)\s*$", re.IGNORECASE)
+_TAG_LINE_RE = re.compile(r"^@\S+(?:\s+@\S+)*$")
+_PRECONDITION_RE = re.compile(r"^[\s#*-]*\**\s*pre-?conditions?\s*\**\s*:\s*\**\s*(.*?)\s*$", re.IGNORECASE)
+
+# Canonical field names keyed by the lower-cased label
+_FIELDS = {
+    'id': 'id', 'title': 'title',
+    'precondition': 'preconditions', 'preconditions': 'preconditions',
+    'pre-condition': 'preconditions', 'pre-conditions': 'preconditions',
+    'step': 'steps', 'steps': 'steps',
+    'expected': 'expected', 'expected result': 'expected', 'expected results': 'expected',
+    'expected outcome': 'expected',
+    'priority': 'priority', 'tag': 'tags', 'tags': 'tags',
+}
+
+
+class TestCaseParser:
+    """
+    Single-pass, line-oriented parser for generated test cases.
+
+    feed() accepts arbitrary stream chunks and returns the test cases it
+    completed; all cases accumulate in `cases` (a columnar CaseStore).
+    A case closes at the blank line after it once it is complete, or when
+    the next case starts, so extra blank lines inside a case are tolerated.
+    """
+
+    def __init__(self, test_type: str):
+        self.test_type = test_type
+        self.traditional = test_type == 'Traditional'
+        self.columns = TRADITIONAL_COLUMNS if self.traditional else BDD_COLUMNS
+        self.cases = CaseStore(test_type)
+        self._completed = []
+        self._buffer = ""
+        self._case = TestCase()
+        self._field = None
+        self._tag_id = ""   # BDD: "@TC-###" tag line seen before the next scenario
+
+    # ---- stream interface ----
+    def feed(self, chunk: str) -> list:
+        """Add streamed text and return the test cases it completed."""
+        self._buffer += chunk
+        end = self._buffer.rfind('\n')
+        if end < 0:
+            return []
+        lines, self._buffer = self._buffer[:end], self._buffer[end + 1:]
+        handle = self._traditional_line if self.traditional else self._bdd_line
+        for line in lines.split('\n'):
+            handle(line)
+        return self._take_completed()
+
+    def close(self) -> list:
+        """Flush buffered text and the trailing case once the stream has ended."""
+        if self._buffer:
+            handle = self._traditional_line if self.traditional else self._bdd_line
+            handle(self._buffer)
+            self._buffer = ""
+        self._emit()
+        return self._take_completed()
+
+    def _take_completed(self) -> list:
+        completed, self._completed = self._completed, []
+        return completed
+
+    # ---- case bookkeeping ----
+    def _has_content(self) -> bool:
+        c = self._case
+        if self.traditional:
+            return bool(c.title or c.steps or c.expected)
+        return c.scenario is not None
+
+    def _is_complete(self) -> bool:
+        c = self._case
+        if self.traditional:
+            return bool(c.steps and c.expected)
+        return len(c.description) > 1
+
+    def _emit(self):
+        if self._has_content():
+            self.cases.append(self._case)
+            self._completed.append(self._case)
+        self._case = TestCase()
+        self._field = None
+
+    # ---- line handlers ----
+    def _traditional_line(self, line: str):
+        stripped = line.strip()
+        c = self._case
+        if not stripped:
+            if self._is_complete():
+                self._emit()
+            return
+        if self._field == 'steps' and stripped[0].isdigit():
+            # Fast path: numbered step lines are the bulk of the output
+            self._add_step(stripped)
+            return
+        m = _FIELD_RE.match(stripped)
+        if m:
+            field = _FIELDS[m.group(1).lower()]
+            value = m.group(2)
+            if field == 'id' or (field == 'title' and c.title):
+                if self._has_content():
+                    self._emit()
+                    c = self._case
+                if field == 'id':
+                    c.source_id = value
+                    self._field = None
+                    return
+            if field == 'steps':
+                self._field = 'steps'
+                if value:
+                    self._add_step(value, value)
+                return
+            if field == 'expected':
+                c.expected = value
+            else:
+                setattr(c, field, value)
+            self._field = field if field in ('expected', 'preconditions') else None
+            return
+        m = _TC_LINE_RE.match(stripped)
+        if m:
+            if self._has_content():
+                self._emit()
+            self._case.source_id = m.group(1)
+            return
+        if self._field == 'steps':
+            self._add_step(stripped)
+        elif self._field == 'expected':
+            c.expected = f"{c.expected}\n{stripped}" if c.expected else stripped
+        elif self._field == 'preconditions':
+            c.preconditions = f"{c.preconditions}\n{stripped}" if c.preconditions else stripped
+        elif stripped[0].isdigit() and (c.title or c.source_id):
+            # Numbered steps without a "Steps:" header
+            m = _STEP_RE.match(stripped)
+            if m:
+                self._add_step(stripped)
+
+    def _add_step(self, line: str, text: str = None):
+        if text is None:
+            m = _STEP_RE.match(line) or _BULLET_RE.match(line)
+            text = m.group(m.lastindex) if m else line
+        self._case.steps.append(Step(line, text))
+
+    def _bdd_line(self, line: str):
+        stripped = line.strip()
+        c = self._case
+        if not stripped:
+            if self._is_complete():
+                self._emit()
+            return
+        m = _SCENARIO_RE.search(stripped)
+        if m:
+            if c.scenario is not None:
+                self._emit()
+                c = self._case
+            c.scenario = m.group(1)
+            c.source_id, self._tag_id = self._tag_id, ""
+            c.description.append(stripped)
+            return
+        if _TAG_LINE_RE.match(stripped):
+            # Gherkin tags belong to the scenario that follows
+            self._tag_id = next((t[1:] for t in stripped.split() if t[1:].upper().startswith("TC-")), "")
+            return
+        m = _PRECONDITION_RE.match(stripped)
+        if m:
+            c.preconditions = m.group(1)
+        elif c.scenario is not None:
+            c.description.append(stripped)
+
+
+# Structural characters outside and inside JSON strings
+_JSON_STRUCT_RE = re.compile(r'[{}"]')
+_JSON_STRING_RE = re.compile(r'["\\]')
+
+
+def _text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(_text(v) for v in value if v)
+    return str(value).strip()
+
+
+class JsonCaseParser:
+    """
+    Incremental parser for JSON output mode (prompts.JSON_FORMAT_INSTRUCTIONS).
+
+    Same interface as TestCaseParser. feed() tracks brace depth and string
+    state across chunks, so each top-level test-case object is decoded once,
+    as soon as its closing brace arrives. Markdown fences or prose around the
+    array are skipped, and objects that fail to decode or validate are
+    counted in `rejected` instead of producing cases. The valid objects are
+    kept in `objects` for stitching outputs back into one array.
+    """
+
+    def __init__(self, test_type: str):
+        self.test_type = test_type
+        self.traditional = test_type == 'Traditional'
+        self.columns = TRADITIONAL_COLUMNS if self.traditional else BDD_COLUMNS
+        self.cases = CaseStore(test_type)
+        self.objects = []
+        self.rejected = 0
+        self._buffer = ""   # text from the start of the open object
+        self._scan = 0      # resume position in _buffer
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> list:
+        """Add streamed text and return the test cases it completed."""
+        completed = []
+        buf = self._buffer + chunk
+        pos = self._scan
+        obj_start = 0 if self._depth else None
+        if self._escape:
+            pos += 1
+            self._escape = False
+        while True:
+            m = (_JSON_STRING_RE if self._in_string else _JSON_STRUCT_RE).search(buf, pos)
+            if not m:
+                break
+            ch, pos = m.group(), m.end()
+            if self._in_string:
+                if ch == '"':
+                    self._in_string = False
+                elif pos < len(buf):
+                    pos += 1
+                else:
+                    # The escaped character arrives with the next chunk
+                    self._escape = True
+            elif ch == '"':
+                # Quotes in prose around the array are not strings
+                self._in_string = self._depth > 0
+            elif ch == '{':
+                if self._depth == 0:
+                    obj_start = m.start()
+                self._depth += 1
+            elif self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    case = self._add_object(buf[obj_start:pos])
+                    if case is not None:
+                        completed.append(case)
+                    obj_start = None
+        if obj_start is None:
+            self._buffer, self._scan = "", 0
+        else:
+            self._buffer, self._scan = buf[obj_start:], len(buf) - obj_start
+        return completed
+
+    def close(self) -> list:
+        """An object still open here was cut off (e.g. at max_tokens) and is dropped."""
+        self._buffer, self._scan, self._depth = "", 0, 0
+        return []
+
+    def _add_object(self, text: str):
+        try:
+            obj = json.loads(text)
+        except ValueError:
+            self.rejected += 1
+            return None
+        case = self._case(obj) if isinstance(obj, dict) else None
+        if case is None:
+            self.rejected += 1
+            return None
+        self.objects.append(obj)
+        self.cases.append(case)
+        return case
+
+    @staticmethod
+    def _steps(obj: dict) -> list:
+        """(action, expected) pairs; steps may be objects or plain strings."""
+        steps = []
+        for step in obj.get('steps') or []:
+            if isinstance(step, dict):
+                action = _text(step.get('action') or step.get('step') or step.get('description'))
+                expected = _text(step.get('expected_result'))
+            else:
+                action, expected = _text(step), ""
+            if action:
+                steps.append((action, expected))
+        return steps
+
+    def _case(self, obj: dict):
+        """A validated TestCase from one decoded object, or None."""
+        case = TestCase()
+        case.preconditions = _text(obj.get('preconditions'))
+        case.source_id = _text(obj.get('test_case_id'))
+        steps = self._steps(obj)
+        if self.traditional:
+            case.title = _text(obj.get('title'))
+            if not case.title or not steps:
+                return None
+            case.steps = [Step(f"{idx}. {action}", action, expected)
+                          for idx, (action, expected) in enumerate(steps, start=1)]
+            case.expected = _text(obj.get('expected_result')) or steps[-1][1]
+            case.priority = _text(obj.get('priority'))
+            case.tags = _text(obj.get('tags'))
+        else:
+            case.scenario = _text(obj.get('scenario') or obj.get('title'))
+            if not case.scenario or not steps:
+                return None
+            case.description = [f"Scenario: {case.scenario}"] + [action for action, _ in steps]
+        return case
+
+
+def make_parser(test_type: str, output_format: str = "text"):
+    """Streaming parser for the given output format ("text" or "json")."""
+    return JsonCaseParser(test_type) if output_format == "json" else TestCaseParser(test_type)
+
+
+def parse_store(text: str, test_type: str, output_format: str = "text") -> CaseStore:
+    """Parse a complete completion into a columnar CaseStore in one pass."""
+    parser = make_parser(test_type, output_format)
+    parser.feed(text)
+    parser.close()
+    return parser.cases
+
+
+def parse_output(text: str, test_type: str, output_format: str = "text"):
+    """Parse a complete completion into (case_rows, step_rows) dict lists."""
+    cases = parse_store(text, test_type, output_format)
+    return cases.case_rows(), cases.step_rows()
+
+
+def parse_cases(text: str, test_type: str, output_format: str = "text") -> list:
+    """Parse a complete completion into case-level rows (one dict per test case)."""
+    return parse_output(text, test_type, output_format)[0]
+
+
+def json_case_objects(text: str, test_type: str) -> list:
+    """The valid test-case objects of a JSON-mode completion (complete ones only)."""
+    parser = JsonCaseParser(test_type)
+    parser.feed(text)
+    return parser.objects
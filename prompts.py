@@ -1,17 +1,39 @@
-ESTIMATE_PROMPT = (
+# Prompts are sent as segments: a prefix that is identical on every call for
+# the same requirements (estimate, generation, batches and continuations), the
+# format instructions, and a short task that varies per call. The leading
+# segments are marked for Bedrock prompt caching on models that support it.
+PROMPT_PREFIX = (
     "You are an experienced QA test engineer.\n"
-    "Given the following requirements (delimited by triple backticks), suggest an optimal number of manual test cases to thoroughly test the described functionality, and briefly justify your choice (2-4 short bullet points).\n\n"
-    "Requirements:\n```{requirements}```\n\n"
+    "Requirements (delimited by triple backticks):\n```{requirements}```\n\n"
+)
+
+ESTIMATE_TASK = (
+    "Suggest an optimal number of manual test cases to thoroughly test the described functionality, and briefly justify your choice (2-4 short bullet points).\n\n"
     "Answer format:\n- number: <integer>\n- rationale:\n  - <point1>\n  - <point2>\n"
 )
 
-GENERATE_PROMPT = (
-    "You are an expert QA test engineer. Generate {count} manual test cases in the {format} format for the following requirements.\n\n"
-    "Requirements:\n```{requirements}```\n\n"
+GENERATE_INSTRUCTIONS = (
     "Format instructions:\n{format_instructions}\n\n"
-    "Each test case should include a unique id, title, preconditions (if any), steps, expected result, and tags (optional). Keep cases concise but actionable."
+    "Each test case should include a unique id, title, preconditions (if any), steps, expected result, and tags (optional). Keep cases concise but actionable.\n\n"
+)
+
+GENERATE_TASK = "Generate {count} manual test cases in the {format} format for the requirements above."
+
+# The same prompts as single templates
+ESTIMATE_PROMPT = PROMPT_PREFIX + ESTIMATE_TASK
+GENERATE_PROMPT = PROMPT_PREFIX + GENERATE_INSTRUCTIONS + GENERATE_TASK
+
+# Appended to the generation task when a large request is split into batches
+BATCH_PROMPT_SUFFIX = (
+    "\n\nThis request is part {part} of {parts} of a larger suite of {total} test cases. "
+    "In this part, focus on: {focus}. Number the cases starting at TC-{start:03d}."
 )
 
+# Appended when earlier output for the same batch was cut off by the token limit
+CONTINUE_PROMPT_SUFFIX = (
+    "\n\nThe following test cases have already been written and must not be repeated:\n{written}\n\n"
+    "Write only the remaining {remaining} test cases, starting at TC-{start:03d}."
+)
 
 
 NEW_TRADITIONAL_FORMAT_INST ="""You are a test case generator.  
@@ -72,3 +94,50 @@ Ensure:
 - Test coverage spans all requirement points
 - Test case IDs are unique
 """
+
+# Structured output: the BASE_PROMPT schema plus the fields the tables need.
+# The model answers with one JSON array, which parsers.JsonCaseParser reads
+# object by object while it streams.
+JSON_FORMAT_INSTRUCTIONS = {
+    'traditional': """Return the test cases as a single JSON array and nothing else: no markdown fences, no commentary.
+Each element must follow this schema:
+{
+  "test_case_id": "TC-001",
+  "title": "Test case title",
+  "description": "Brief description",
+  "preconditions": "Any setup or assumptions",
+  "steps": [
+    {
+      "step_number": 1,
+      "action": "Step action",
+      "expected_result": "Expected outcome"
+    }
+  ],
+  "expected_result": "Overall expected outcome",
+  "priority": "High",
+  "tags": ["tag1", "tag2"],
+  "requirement_ref": "REQ-001"
+}
+
+Rules:
+- Each test case must have at least 3 steps, and each step has an expected result
+- priority is one of High, Medium, Low
+- Test case IDs are unique""",
+    'bdd': """Return the test cases as a single JSON array and nothing else: no markdown fences, no commentary.
+Each element must follow this schema:
+{
+  "test_case_id": "TC-001",
+  "scenario": "Successful login with valid credentials",
+  "preconditions": "Any setup or assumptions",
+  "steps": [
+    "Given the user has a valid account",
+    "When the user enters valid username and password and clicks Login",
+    "Then the user should see the dashboard"
+  ],
+  "requirement_ref": "REQ-001"
+}
+
+Rules:
+- steps start with Given, When, Then, And or But
+- Test case IDs are unique""",
+}
@@ -0,0 +1,235 @@
+import json
+import os
+import random
+import threading
+import time
+
+# Client-side budgets per model. Defaults can be overridden per model with
+# BEDROCK_MODEL_LIMITS='{"anthropic.claude-3-sonnet-20240229-v1:0": {"rpm": 50, "tpm": 100000}}'.
+BEDROCK_RPM = float(os.getenv("BEDROCK_RPM", "60"))
+BEDROCK_TPM = float(os.getenv("BEDROCK_TPM", "200000"))
+BEDROCK_MODEL_LIMITS = json.loads(os.getenv("BEDROCK_MODEL_LIMITS", "{}") or "{}")
+BEDROCK_MAX_RETRIES = int(os.getenv("BEDROCK_MAX_RETRIES", "6"))
+BEDROCK_BACKOFF_BASE = float(os.getenv("BEDROCK_BACKOFF_BASE", "1.0"))
+BEDROCK_BACKOFF_CAP = float(os.getenv("BEDROCK_BACKOFF_CAP", "30"))
+BEDROCK_QUEUE_TIMEOUT = float(os.getenv("BEDROCK_QUEUE_TIMEOUT", "300"))
+
+# AIMD: halve the send rate on throttling, win back 5% per success
+AIMD_DECREASE = 0.5
+AIMD_INCREASE = 0.05
+AIMD_MIN_SCALE = 0.05
+
+THROTTLING_CODES = {"throttlingexception", "toomanyrequestsexception", "serviceunavailableexception",
+                    "serviceunavailable", "throttling"}
+TRANSIENT_CODES = {"modelnotreadyexception", "internalserverexception"}
+
+
+def error_code(exc) -> str:
+    """Lower-cased AWS error code for botocore ClientErrors and stream errors."""
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        return str(response.get("Error", {}).get("Code", "")).lower()
+    return str(getattr(exc, "code", "")).lower()
+
+
+def is_throttle(exc) -> bool:
+    return error_code(exc) in THROTTLING_CODES
+
+
+def is_retryable(exc) -> bool:
+    if is_throttle(exc) or error_code(exc) in TRANSIENT_CODES:
+        return True
+    # Dropped connections and read timeouts from botocore
+    return type(exc).__name__ in ("EndpointConnectionError", "ConnectionClosedError", "ReadTimeoutError",
+                                  "ConnectTimeoutError")
+
+
+def estimate_request_tokens(prompt: str, max_tokens: int) -> int:
+    # Roughly 4 characters per token; the output budget is reserved up front
+    return len(prompt) // 4 + max_tokens
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.base = per_minute
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def set_scale(self, scale: float):
+        self.capacity = max(self.base * scale, 1.0)
+        self.level = min(self.level, self.capacity)
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.capacity
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+
+class ModelRateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute token buckets for one model,
+    with jittered exponential backoff and AIMD rate adaptation on throttling.
+    """
+
+    def __init__(self, model_id: str, rpm: float, tpm: float):
+        self.model_id = model_id
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.scale = 1.0
+        self.waiting = 0
+        self.stats = {"calls": 0, "throttled": 0, "retries": 0, "failed": 0}
+        self._cond = threading.Condition()
+
+    def acquire(self, tokens: int, timeout: float = BEDROCK_QUEUE_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+                    if wait == 0:
+                        self.requests.take(1)
+                        self.tokens.take(tokens)
+                        return
+                    if now + wait > deadline:
+                        raise TimeoutError(f"Timed out waiting for Bedrock capacity for {self.model_id}")
+                    self._cond.wait(wait)
+            finally:
+                self.waiting -= 1
+
+    def settle(self, reserved: int, used: int):
+        """Give back (or charge) the difference between reserved and actual tokens."""
+        with self._cond:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + reserved - used)
+            self._cond.notify_all()
+
+    def _set_scale(self, scale: float):
+        self.scale = max(AIMD_MIN_SCALE, min(1.0, scale))
+        self.requests.set_scale(self.scale)
+        self.tokens.set_scale(self.scale)
+
+    def on_success(self):
+        with self._cond:
+            self.stats["calls"] += 1
+            if self.scale < 1.0:
+                self._set_scale(self.scale + AIMD_INCREASE)
+                self._cond.notify_all()
+
+    def on_throttle(self):
+        with self._cond:
+            self.stats["throttled"] += 1
+            self._set_scale(self.scale * AIMD_DECREASE)
+
+    def _backoff(self, exc, attempt: int, max_retries: int):
+        """Record a failed attempt; sleep before the next one or re-raise."""
+        with self._cond:
+            if not is_retryable(exc) or attempt >= max_retries:
+                self.stats["failed"] += 1
+                raise exc
+            self.stats["retries"] += 1
+        if is_throttle(exc):
+            self.on_throttle()
+        time.sleep(random.uniform(0, min(BEDROCK_BACKOFF_CAP, BEDROCK_BACKOFF_BASE * 2 ** attempt)))
+
+    def call(self, fn, reserved_tokens: int, used_tokens=None, max_retries: int = BEDROCK_MAX_RETRIES,
+             info: dict = None):
+        """
+        Run fn() once capacity is available, retrying throttling and transient
+        errors with full-jitter exponential backoff. used_tokens(result) gives
+        the actual usage so the token bucket can be settled; info["retries"]
+        is set to the number of retries made.
+        """
+        info = {} if info is None else info
+        for attempt in range(max_retries + 1):
+            info["retries"] = attempt
+            self.acquire(reserved_tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                self.settle(reserved_tokens, 0)
+                self._backoff(e, attempt, max_retries)
+                continue
+            self.on_success()
+            self.settle(reserved_tokens, (used_tokens(result) if used_tokens else None) or reserved_tokens)
+            return result
+
+    def stream(self, start, reserved_tokens: int, used_tokens=None, max_retries: int = BEDROCK_MAX_RETRIES,
+               info: dict = None):
+        """
+        Like call() for a generator factory. Attempts are only retried until
+        the first piece has been yielded; later failures are raised as is.
+        Closing the generator early settles the tokens used so far.
+        """
+        info = {} if info is None else info
+        for attempt in range(max_retries + 1):
+            info["retries"] = attempt
+            self.acquire(reserved_tokens)
+            started = False
+            pieces = start()
+            try:
+                for piece in pieces:
+                    started = True
+                    yield piece
+            except GeneratorExit:
+                # Closed by the consumer, e.g. a losing hedged attempt: close
+                # the stream first so its usage so far is known, then give
+                # back the rest of the reservation
+                pieces.close()
+                self.settle(reserved_tokens, (used_tokens() if used_tokens else None) or 0)
+                raise
+            except Exception as e:
+                # Output already streamed was used; a failed start used nothing
+                self.settle(reserved_tokens, (used_tokens() if started and used_tokens else None) or 0)
+                if started:
+                    with self._cond:
+                        self.stats["failed"] += 1
+                    raise
+                self._backoff(e, attempt, max_retries)
+                continue
+            self.on_success()
+            self.settle(reserved_tokens, (used_tokens() if used_tokens else None) or reserved_tokens)
+            return
+
+    def status(self) -> dict:
+        with self._cond:
+            return dict(
+                self.stats,
+                model=self.model_id,
+                rpm=round(self.requests.capacity, 1),
+                tpm=round(self.tokens.capacity),
+                scale=round(self.scale, 2),
+                queue_depth=self.waiting,
+            )
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model_id: str, region: str = None) -> ModelRateLimiter:
+    """Limiter for a model in a region; quotas are per region, AWS_REGION (the default) is keyed by model id alone."""
+    key = model_id if region in (None, os.getenv("AWS_REGION", "us-east-1")) else f"{region}/{model_id}"
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limits = BEDROCK_MODEL_LIMITS.get(key, BEDROCK_MODEL_LIMITS.get(model_id, {}))
+            limiter = ModelRateLimiter(key, limits.get("rpm", BEDROCK_RPM), limits.get("tpm", BEDROCK_TPM))
+            _limiters[key] = limiter
+        return limiter
+
+
+def limiter_status() -> list:
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.status() for limiter in limiters]
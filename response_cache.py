@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Disk-backed cache of model completions. Bounded by TTL and total size, with
+# least-recently-used entries evicted first.
+CACHE_ENABLED = os.getenv("BEDROCK_CACHE_ENABLED", "1") not in ("0", "false", "False")
+CACHE_PATH = os.getenv("BEDROCK_CACHE_PATH", os.path.join(".cache", "bedrock_responses.sqlite3"))
+CACHE_TTL_SECONDS = float(os.getenv("BEDROCK_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_BYTES = int(float(os.getenv("BEDROCK_CACHE_MAX_MB", "200")) * 1024 * 1024)
+CACHE_DETERMINISTIC_ONLY = os.getenv("BEDROCK_CACHE_DETERMINISTIC_ONLY", "1") not in ("0", "false", "False")
+
+
+def cache_key(model_id: str, prompt: str, max_tokens: int, temperature: float) -> str:
+    payload = json.dumps([model_id, prompt, int(max_tokens), float(temperature)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: str = CACHE_PATH, ttl_seconds: float = CACHE_TTL_SECONDS,
+                 max_bytes: int = CACHE_MAX_BYTES, deterministic_only: bool = CACHE_DETERMINISTIC_ONLY):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.deterministic_only = deterministic_only
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # One connection shared by all threads; every access holds self._lock.
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def cacheable(self, temperature: float) -> bool:
+        return not self.deterministic_only or float(temperature) == 0.0
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._stats["evictions"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._stats["hits"] += 1
+            return row[0]
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._stats["stores"] += 1
+            self._evict(now)
+
+    def _evict(self, now: float):
+        cur = self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        self._stats["evictions"] += max(cur.rowcount, 0)
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._stats["evictions"] += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            stats = dict(self._stats, entries=entries, bytes=size)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide cache instance, or None when caching is disabled."""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
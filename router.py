@@ -0,0 +1,310 @@
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+from rate_limiter import is_retryable
+from scheduler import current_session, get_scheduler
+from telemetry import Histogram
+
+# Where calls for a model id may go. Without BEDROCK_TARGETS every call goes to
+# AWS_REGION with the requested model id. Otherwise a JSON object maps model
+# ids (or "*" for any model) to targets, each a region name or
+# {"region": ..., "model": ...} (e.g. a cross-region inference profile):
+#   BEDROCK_TARGETS='{"*": ["us-east-1", "us-west-2"]}'
+BEDROCK_TARGETS = json.loads(os.getenv("BEDROCK_TARGETS", "{}") or "{}")
+# Hedging: when the primary target has produced neither a first token (streams)
+# nor a response (invokes) within the recent p95 latency of that target, the
+# same request is sent to the next target and whichever answers first is kept.
+# "auto" hedges only when a model has more than one target, "1" also
+# duplicates on a single target, "0" never hedges.
+BEDROCK_HEDGE = os.getenv("BEDROCK_HEDGE", "auto")
+BEDROCK_HEDGE_QUANTILE = float(os.getenv("BEDROCK_HEDGE_QUANTILE", "0.95"))
+BEDROCK_HEDGE_MIN_DELAY = float(os.getenv("BEDROCK_HEDGE_MIN_DELAY", "0.5"))
+# Latency samples a target needs before its calls are hedged
+BEDROCK_HEDGE_MIN_SAMPLES = int(os.getenv("BEDROCK_HEDGE_MIN_SAMPLES", "20"))
+# Share of calls that may be hedged; each call earns this much hedge budget
+BEDROCK_HEDGE_MAX_RATE = float(os.getenv("BEDROCK_HEDGE_MAX_RATE", "0.05"))
+# A target failing this many calls in a row is skipped for the cooldown
+BEDROCK_TARGET_MAX_FAILURES = int(os.getenv("BEDROCK_TARGET_MAX_FAILURES", "3"))
+BEDROCK_TARGET_COOLDOWN = float(os.getenv("BEDROCK_TARGET_COOLDOWN", "30"))
+
+_EWMA_WEIGHT = 0.2
+_LATENCY_WINDOW = 256
+
+
+def latency_kind(mode: str, max_tokens: int) -> str:
+    """Latency series a call is compared against: first token for streams, whole call per max_tokens size for invokes."""
+    return "first_token" if mode == "stream" else f"invoke_{max(max_tokens, 1).bit_length()}"
+
+
+class Target:
+    """One (region, model id) destination with its health and latency history."""
+
+    def __init__(self, region: str, model_id: str):
+        self.region = region          # None: AWS_REGION
+        self.model_id = model_id
+        self.failures = 0             # consecutive
+        self.down_until = 0.0
+        self.latency = {}             # kind -> Histogram
+        self.ewma = {}                # kind -> seconds
+        self.stats = {"calls": 0, "errors": 0, "hedges": 0, "wins": 0}
+
+    @property
+    def name(self) -> str:
+        return f"{self.region or os.getenv('AWS_REGION', 'us-east-1')}/{self.model_id}"
+
+    def observe(self, kind: str, seconds: float):
+        histogram = self.latency.get(kind)
+        if histogram is None:
+            histogram = self.latency[kind] = Histogram(_LATENCY_WINDOW)
+        histogram.observe(seconds)
+        previous = self.ewma.get(kind)
+        self.ewma[kind] = seconds if previous is None else previous + _EWMA_WEIGHT * (seconds - previous)
+
+    def quantile(self, kind: str, q: float):
+        histogram = self.latency.get(kind)
+        if histogram is None or len(histogram.values) < BEDROCK_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(histogram.values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _parse_target(spec, model_id: str) -> Target:
+    if isinstance(spec, str):
+        return Target(spec, model_id)
+    return Target(spec.get("region"), spec.get("model", model_id))
+
+
+class BedrockRouter:
+    """
+    Routes the calls for one model id over its targets. Healthy targets are
+    tried in order of smoothed latency (targets without samples first, so each
+    gets measured); a target is skipped for BEDROCK_TARGET_COOLDOWN after
+    BEDROCK_TARGET_MAX_FAILURES failures in a row.
+
+    Hedged attempts run on worker threads and take their own scheduler slot,
+    but only when one is free; the losing attempt is cancelled. A cancelled
+    stream is closed, while a cancelled invoke can only be abandoned: its
+    response is discarded when it arrives.
+    """
+
+    def __init__(self, model_id: str, targets: list):
+        self.model_id = model_id
+        self.targets = targets
+        if BEDROCK_HEDGE in ("0", "false", "False"):
+            self.hedging = False
+        else:
+            self.hedging = len(targets) > 1 or BEDROCK_HEDGE in ("1", "true", "True")
+        self.hedge_budget = 0.0
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "failovers": 0}
+        self._lock = threading.Lock()
+
+    # ---- health and ordering ----
+    def _ordered(self, kind: str) -> list:
+        now = time.monotonic()
+        with self._lock:
+            healthy = [t for t in self.targets if t.down_until <= now] or list(self.targets)
+            return sorted(healthy, key=lambda t: t.ewma.get(kind, 0.0))
+
+    def _succeeded(self, target: Target):
+        with self._lock:
+            target.stats["calls"] += 1
+            target.failures = 0
+
+    def _failed(self, target: Target):
+        with self._lock:
+            target.stats["calls"] += 1
+            target.stats["errors"] += 1
+            target.failures += 1
+            if target.failures >= BEDROCK_TARGET_MAX_FAILURES and len(self.targets) > 1:
+                target.down_until = time.monotonic() + BEDROCK_TARGET_COOLDOWN
+
+    def _observe(self, target: Target, kind: str, seconds: float):
+        with self._lock:
+            target.observe(kind, seconds)
+
+    # ---- hedging ----
+    def _hedge_delay(self, primary: Target, kind: str):
+        """Seconds to wait for the primary before hedging, or None to not hedge this call."""
+        with self._lock:
+            self.stats["calls"] += 1
+            if not self.hedging:
+                return None
+            self.hedge_budget = min(2.0, self.hedge_budget + BEDROCK_HEDGE_MAX_RATE)
+            threshold = primary.quantile(kind, BEDROCK_HEDGE_QUANTILE)
+        return None if threshold is None else max(threshold, BEDROCK_HEDGE_MIN_DELAY)
+
+    def _take_hedge(self) -> bool:
+        with self._lock:
+            if self.hedge_budget < 1.0:
+                return False
+            self.hedge_budget -= 1.0
+            return True
+
+    def run(self, attempt, reserved: int, kind: str, info: dict):
+        """
+        Run attempt(target, attempt_info) -> iterator of ("piece", text) events
+        followed by one ("done", result) event, yielding the pieces of the
+        attempt that answers first and returning its result. info gets the
+        winner's retries plus "target" and "hedged".
+        """
+        targets = self._ordered(kind)
+        delay = self._hedge_delay(targets[0], kind)
+        if delay is None:
+            return (yield from self._direct(targets, attempt, kind, info))
+        return (yield from self._race(targets, attempt, reserved, kind, delay, info))
+
+    def _direct(self, targets: list, attempt, kind: str, info: dict):
+        # No hedge: run on the calling thread, failing over once to the next
+        # target when an error the rate limiter gave up retrying happens
+        # before any output
+        for position, target in enumerate(targets[:2]):
+            attempt_info = {"retries": 0}
+            started = time.monotonic()
+            first = True
+            try:
+                for event, value in attempt(target, attempt_info):
+                    if first:
+                        first = False
+                        self._observe(target, kind, time.monotonic() - started)
+                    if event == "piece":
+                        yield value
+                    else:
+                        self._succeeded(target)
+                        info.update(attempt_info, target=target.name, hedged=False)
+                        return value
+            except Exception as e:
+                self._failed(target)
+                if not first or position + 1 >= len(targets) or not is_retryable(e):
+                    raise
+                with self._lock:
+                    self.stats["failovers"] += 1
+
+    def _launch(self, index: int, target: Target, attempt, events: queue.Queue, cancelled: threading.Event,
+                release=None):
+        def work():
+            attempt_info = {"retries": 0}
+            steps = attempt(target, attempt_info)
+            try:
+                for event, value in steps:
+                    if cancelled.is_set():
+                        break
+                    events.put((index, event, value, attempt_info))
+            except Exception as e:
+                events.put((index, "error", e, attempt_info))
+            finally:
+                # Closing a cancelled stream closes its response body
+                steps.close()
+                if release:
+                    release()
+        # Carries the session over so the attempt is attributed to it
+        threading.Thread(target=contextvars.copy_context().run, args=(work,), daemon=True,
+                         name=f"bedrock-hedge-{target.name}").start()
+
+    def _race(self, targets: list, attempt, reserved: int, kind: str, delay: float, info: dict):
+        primary = targets[0]
+        runners = [(primary, time.monotonic(), threading.Event())]
+        events = queue.Queue()
+        self._launch(0, primary, attempt, events, runners[0][2])
+        running = {0}
+        winner = None
+        hedge_tried = False
+        try:
+            while True:
+                timeout = None
+                if winner is None and not hedge_tried:
+                    timeout = max(0.0, runners[0][1] + delay - time.monotonic())
+                try:
+                    index, event, value, attempt_info = events.get(timeout=timeout)
+                except queue.Empty:
+                    # At most one hedge; without budget or a free slot keep waiting for the primary
+                    hedge_tried = True
+                    if self._hedge(targets, attempt, reserved, events, runners):
+                        running.add(1)
+                    continue
+                if winner is not None and index != winner:
+                    continue
+                target, started, _ = runners[index]
+                if event == "error":
+                    running.discard(index)
+                    self._failed(target)
+                    if winner is None and running:
+                        continue  # the other attempt may still answer
+                    raise value
+                if winner is None:
+                    winner = index
+                    self._decided(runners, index, kind)
+                    info.update(attempt_info, target=target.name, hedged=len(runners) > 1)
+                if event == "piece":
+                    yield value
+                else:
+                    self._succeeded(target)
+                    return value
+        finally:
+            for _, _, cancelled in runners:
+                cancelled.set()
+
+    def _hedge(self, targets: list, attempt, reserved: int, events: queue.Queue, runners: list) -> bool:
+        if not self._take_hedge():
+            return False
+        scheduler = get_scheduler()
+        session = current_session()
+        if not scheduler.try_acquire(session, reserved):
+            with self._lock:
+                self.hedge_budget += 1.0  # not spent
+            return False
+        target = targets[1] if len(targets) > 1 else targets[0]
+        with self._lock:
+            self.stats["hedged"] += 1
+            target.stats["hedges"] += 1
+        runners.append((target, time.monotonic(), threading.Event()))
+        self._launch(1, target, attempt, events, runners[1][2], release=lambda: scheduler.release(session))
+        return True
+
+    def _decided(self, runners: list, winner: int, kind: str):
+        now = time.monotonic()
+        for index, (target, started, cancelled) in enumerate(runners):
+            # The loser's sample is cut off at the decision, which keeps its
+            # p95 from drifting down just because slow calls get hedged
+            self._observe(target, kind, now - started)
+            if index != winner:
+                cancelled.set()
+        if winner and len(runners) > 1:
+            with self._lock:
+                self.stats["hedge_wins"] += 1
+                runners[winner][0].stats["wins"] += 1
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            targets = [dict(target.stats, name=target.name, healthy=target.down_until <= now,
+                            first_token_p95=target.quantile("first_token", BEDROCK_HEDGE_QUANTILE))
+                       for target in self.targets]
+            return dict(self.stats, model=self.model_id, hedging=self.hedging, targets=targets)
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(model_id: str) -> BedrockRouter:
+    with _routers_lock:
+        router = _routers.get(model_id)
+        if router is None:
+            specs = BEDROCK_TARGETS.get(model_id, BEDROCK_TARGETS.get("*")) or [None]
+            targets = [_parse_target(spec, model_id) if spec else Target(None, model_id) for spec in specs]
+            router = _routers[model_id] = BedrockRouter(model_id, targets)
+        return router
+
+
+def router_status() -> list:
+    with _routers_lock:
+        routers = list(_routers.values())
+    return [router.status() for router in routers]
+
+
+def reset_routers():
+    with _routers_lock:
+        _routers.clear()
@@ -0,0 +1,181 @@
+import contextlib
+import contextvars
+import itertools
+import os
+import threading
+import time
+from collections import Counter
+
+# Process-wide cap on concurrent Bedrock calls across all Streamlit sessions
+BEDROCK_MAX_CONCURRENCY = int(os.getenv("BEDROCK_MAX_CONCURRENCY", "8"))
+# Calls reserving at most this many tokens (prompt estimate + max_tokens) go first
+BEDROCK_SMALL_REQUEST_TOKENS = int(os.getenv("BEDROCK_SMALL_REQUEST_TOKENS", "4000"))
+BEDROCK_SCHEDULER_TIMEOUT = float(os.getenv("BEDROCK_SCHEDULER_TIMEOUT", "600"))
+
+# Session the current call belongs to; worker threads inherit it through
+# contextvars.copy_context() (see run_in_context).
+_session = contextvars.ContextVar("bedrock_session", default=None)
+
+
+class _Ticket:
+    __slots__ = ("seq", "session", "small")
+
+    def __init__(self, seq: int, session: str, small: bool):
+        self.seq = seq
+        self.session = session
+        self.small = small
+
+
+class BedrockScheduler:
+    """
+    Admission control for model calls. At most max_concurrency calls run at
+    once; when a slot frees up, waiting calls are ordered by
+      1. small requests before large ones,
+      2. sessions with fewer calls running (fair share across users),
+      3. arrival order.
+    """
+
+    def __init__(self, max_concurrency: int = BEDROCK_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.running = 0
+        self._waiting = []
+        self._inflight = Counter()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.stats = {"admitted": 0, "queued": 0, "wait_seconds": 0.0}
+
+    def _key(self, ticket: _Ticket):
+        return (not ticket.small, self._inflight[ticket.session], ticket.seq)
+
+    def _position(self, ticket: _Ticket) -> int:
+        key = self._key(ticket)
+        return 1 + sum(1 for t in self._waiting if self._key(t) < key)
+
+    def acquire(self, session: str, tokens: int, on_wait=None, timeout: float = BEDROCK_SCHEDULER_TIMEOUT):
+        """
+        Block until the call may run. on_wait(position, waiting) is called
+        while queued, and once more with position 0 when the call is admitted.
+        """
+        start = time.monotonic()
+        notified = False
+        with self._cond:
+            ticket = _Ticket(next(self._seq), session, tokens <= BEDROCK_SMALL_REQUEST_TOKENS)
+            self._waiting.append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    if self.running < self.max_concurrency and self._position(ticket) == 1:
+                        self._waiting.remove(ticket)
+                        self.running += 1
+                        self._inflight[session] += 1
+                        waited = time.monotonic() - start
+                        self.stats["admitted"] += 1
+                        self.stats["wait_seconds"] += waited
+                        if waited > 0.01:
+                            self.stats["queued"] += 1
+                        position, waiting = 0, len(self._waiting)
+                    else:
+                        position, waiting = self._position(ticket), len(self._waiting)
+                if position == 0:
+                    if notified:
+                        try:
+                            on_wait(0, waiting)
+                        except BaseException:
+                            # e.g. the job was cancelled; the slot is already taken
+                            self.release(session)
+                            raise
+                    return
+                if time.monotonic() - start > timeout:
+                    raise TimeoutError(f"Waited over {timeout:.0f}s for a free Bedrock slot")
+                if on_wait:
+                    on_wait(position, waiting)
+                    notified = True
+                with self._cond:
+                    self._cond.wait(0.5)
+        except BaseException:
+            with self._cond:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    self._cond.notify_all()
+            raise
+
+    def try_acquire(self, session: str, tokens: int) -> bool:
+        """Take a slot only if one is free and no call is waiting, e.g. for a hedged duplicate."""
+        with self._cond:
+            if self.running >= self.max_concurrency or self._waiting:
+                return False
+            self.running += 1
+            self._inflight[session] += 1
+            self.stats["admitted"] += 1
+            return True
+
+    def release(self, session: str):
+        with self._cond:
+            self.running -= 1
+            self._inflight[session] -= 1
+            if self._inflight[session] <= 0:
+                del self._inflight[session]
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, tokens: int):
+        """Hold a slot for the current session's call."""
+        scope = _session.get()
+        session = current_session()
+        on_wait = scope.on_wait if scope and scope.thread == threading.get_ident() else None
+        self.acquire(session, tokens, on_wait)
+        try:
+            yield
+        finally:
+            self.release(session)
+
+    def status(self, session: str = None) -> dict:
+        with self._cond:
+            status = dict(self.stats, running=self.running, limit=self.max_concurrency,
+                          waiting=len(self._waiting), sessions=len(self._inflight))
+            if session is not None:
+                mine = [self._position(t) for t in self._waiting if t.session == session]
+                status.update(session_running=self._inflight.get(session, 0), session_waiting=len(mine),
+                              position=min(mine) if mine else 0)
+            return status
+
+
+class _Scope:
+    __slots__ = ("session_id", "on_wait", "thread")
+
+    def __init__(self, session_id: str, on_wait):
+        self.session_id = session_id
+        self.on_wait = on_wait
+        self.thread = threading.get_ident()
+
+
+def current_session() -> str:
+    scope = _session.get()
+    return scope.session_id if scope else "default"
+
+
+def bind_session(session_id: str, on_wait=None):
+    """
+    Attribute model calls made from the current context to session_id until
+    it is bound again; jobs binds each job's session on its worker thread
+    before running it. on_wait is only called for calls made from the
+    binding thread.
+    """
+    _session.set(_Scope(session_id, on_wait))
+
+
+def run_in_context(pool, fn, *args):
+    """pool.submit() that carries the caller's session over to the worker thread."""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> BedrockScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = BedrockScheduler()
+        return _scheduler
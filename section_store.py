@@ -0,0 +1,60 @@
+import hashlib
+import json
+import os
+import threading
+from response_cache import ResponseCache
+
+# Generated cases per requirement section, keyed by a hash of the section's
+# content. When the requirements are edited, sections whose text is
+# unchanged reuse their stored cases instead of going back to the model.
+SECTION_STORE_ENABLED = os.getenv("SECTION_STORE_ENABLED", "1") not in ("0", "false", "False")
+SECTION_STORE_PATH = os.getenv("SECTION_STORE_PATH", os.path.join(".cache", "sections.sqlite3"))
+SECTION_STORE_TTL = float(os.getenv("SECTION_STORE_TTL", str(30 * 24 * 3600)))
+SECTION_STORE_MAX_BYTES = int(float(os.getenv("SECTION_STORE_MAX_MB", "100")) * 1024 * 1024)
+
+
+def section_hash(text: str) -> str:
+    """Content hash of a section; whitespace and line wrapping do not count as changes."""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()[:20]
+
+
+def section_key(digest: str, test_type: str, output_format: str, model_id: str) -> str:
+    payload = json.dumps([digest, test_type, output_format, model_id])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SectionStore:
+    """Stored section outputs on top of the response cache's SQLite table (same TTL and LRU bounds)."""
+
+    def __init__(self, path: str = SECTION_STORE_PATH, ttl_seconds: float = SECTION_STORE_TTL,
+                 max_bytes: int = SECTION_STORE_MAX_BYTES):
+        self._cache = ResponseCache(path, ttl_seconds, max_bytes, deterministic_only=False)
+
+    def get(self, key: str):
+        """(output, case count) stored for the section, or None."""
+        value = self._cache.get(key)
+        if value is None:
+            return None
+        entry = json.loads(value)
+        return entry["output"], entry["cases"]
+
+    def put(self, key: str, output: str, cases: int):
+        self._cache.put(key, json.dumps({"output": output, "cases": cases}, ensure_ascii=False))
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_section_store():
+    """Process-wide store, or None when section reuse is disabled."""
+    global _store
+    if not SECTION_STORE_ENABLED:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = SectionStore()
+        return _store
@@ -0,0 +1,237 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from scheduler import current_session
+from tracing import add_span
+
+# "stderr" (default), "off", or a file path for JSON-lines call logs
+TELEMETRY_LOG = os.getenv("TELEMETRY_LOG", "stderr")
+# Most recent observations kept per histogram for percentiles
+TELEMETRY_WINDOW = int(os.getenv("TELEMETRY_WINDOW", "2048"))
+
+# On-demand USD prices per 1K (input, output) tokens. Override or extend with
+# BEDROCK_PRICING='{"<model id>": [input_per_1k, output_per_1k]}'.
+MODEL_PRICING = {
+    "anthropic.claude-3-sonnet-20240229-v1:0": (0.003, 0.015),
+    "anthropic.claude-3-haiku-20240307-v1:0": (0.00025, 0.00125),
+    "anthropic.claude-3-opus-20240229-v1:0": (0.015, 0.075),
+    "anthropic.claude-3-5-haiku-20241022-v1:0": (0.0008, 0.004),
+    "anthropic.claude-3-7-sonnet-20250219-v1:0": (0.003, 0.015),
+    "anthropic.claude-sonnet-4-20250514-v1:0": (0.003, 0.015),
+    "anthropic.claude-instant-v1": (0.0008, 0.0024),
+    "anthropic.claude-v2": (0.008, 0.024),
+    "anthropic.claude-v2:1": (0.008, 0.024),
+    "amazon.titan-text-express-v1": (0.0002, 0.0006),
+    "amazon.titan-text-lite-v1": (0.00015, 0.0002),
+}
+MODEL_PRICING.update({k: tuple(v) for k, v in json.loads(os.getenv("BEDROCK_PRICING", "{}") or "{}").items()})
+
+
+# Prompt cache reads and writes are billed relative to the input price
+CACHE_READ_PRICE_FACTOR = 0.1
+CACHE_WRITE_PRICE_FACTOR = 1.25
+
+
+def _model_price(model_id: str):
+    # Inference profile ids ("us.anthropic...") are priced like the model
+    return MODEL_PRICING.get(model_id) or MODEL_PRICING.get(model_id.split(".", 1)[-1])
+
+
+def estimate_cost(model_id: str, input_tokens, output_tokens, cache_read_tokens=None,
+                  cache_write_tokens=None) -> float:
+    price = _model_price(model_id)
+    if price is None:
+        return 0.0
+    input_cost = ((input_tokens or 0) + (cache_read_tokens or 0) * CACHE_READ_PRICE_FACTOR
+                  + (cache_write_tokens or 0) * CACHE_WRITE_PRICE_FACTOR) * price[0]
+    return (input_cost + (output_tokens or 0) * price[1]) / 1000.0
+
+
+def prompt_cache_savings(model_id: str, cache_read_tokens, cache_write_tokens) -> float:
+    """USD saved by prompt caching versus sending the cached tokens as plain input (negative while only writing)."""
+    price = _model_price(model_id)
+    if price is None:
+        return 0.0
+    return ((cache_read_tokens or 0) * (1 - CACHE_READ_PRICE_FACTOR)
+            - (cache_write_tokens or 0) * (CACHE_WRITE_PRICE_FACTOR - 1)) * price[0] / 1000.0
+
+
+def _percentile(ordered: list, q: float):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Histogram:
+    """Count and sum over all observations, percentiles over a recent window."""
+
+    def __init__(self, window: int = TELEMETRY_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.values = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.values.append(value)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.values)
+        return {"count": self.count, "sum": round(self.total, 4),
+                "p50": _percentile(ordered, 0.50), "p95": _percentile(ordered, 0.95),
+                "p99": _percentile(ordered, 0.99)}
+
+
+class MetricsRegistry:
+    """In-process counters and histograms keyed by name and labels."""
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict):
+        return (name,) + tuple(sorted(labels.items()))
+
+    def incr(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        def label(key):
+            return key[0] + ("{" + ",".join(f"{k}={v}" for k, v in key[1:]) + "}" if key[1:] else "")
+        with self._lock:
+            return {
+                "counters": {label(k): v for k, v in self._counters.items()},
+                "histograms": {label(k): h.summary() for k, h in self._histograms.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+metrics = MetricsRegistry()
+
+_logger = logging.getLogger("aitestgen.telemetry")
+_logger.propagate = False
+if TELEMETRY_LOG != "off" and not _logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr) if TELEMETRY_LOG == "stderr" else logging.FileHandler(TELEMETRY_LOG)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _logger.addHandler(_handler)
+    _logger.setLevel(logging.INFO)
+
+
+def log_event(event: str, **fields):
+    """Emit one structured JSON log line."""
+    if TELEMETRY_LOG == "off":
+        return
+    _logger.info(json.dumps(dict(time=time.strftime("%Y-%m-%dT%H:%M:%S"), event=event, **fields), default=str))
+
+
+# Per-session call totals for the sidebar panel; least recently active dropped first
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+_SESSION_LIMIT = 1000
+
+
+def _session_totals(session: str) -> dict:
+    totals = _sessions.get(session)
+    if totals is None:
+        totals = _sessions[session] = {"calls": 0, "cache_hits": 0, "errors": 0, "retries": 0,
+                                       "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0,
+                                       "cache_read_tokens": 0, "cache_write_tokens": 0, "cache_saved_usd": 0.0,
+                                       "latency": Histogram(256), "ttft": Histogram(256)}
+        while len(_sessions) > _SESSION_LIMIT:
+            _sessions.popitem(last=False)
+    _sessions.move_to_end(session)
+    return totals
+
+
+def record_call(model_id: str, mode: str, wall: float, max_tokens: int, result: dict = None,
+                ttft: float = None, cache_hit: bool = False, retries: int = 0, error: Exception = None,
+                target: str = None, hedged: bool = False):
+    """Record one model call (invoke or stream) in the log, the registry and the session totals."""
+    result = result or {}
+    input_tokens, output_tokens = result.get("input_tokens"), result.get("output_tokens")
+    cache_read, cache_write = result.get("cache_read_tokens") or 0, result.get("cache_write_tokens") or 0
+    if cache_hit:
+        # Response cache hits cost nothing and used no prompt cache
+        cost = saved = 0.0
+        cache_read = cache_write = 0
+    else:
+        cost = estimate_cost(model_id, input_tokens, output_tokens, cache_read, cache_write)
+        saved = prompt_cache_savings(model_id, cache_read, cache_write)
+    session = current_session()
+    outcome = "error" if error else "cache_hit" if cache_hit else "ok"
+    log_event("bedrock_call", session=session, model=model_id, mode=mode, outcome=outcome,
+              wall_ms=round(wall * 1000), ttft_ms=round(ttft * 1000) if ttft is not None else None,
+              input_tokens=input_tokens, output_tokens=output_tokens, max_tokens=max_tokens,
+              cache_read_tokens=cache_read, cache_write_tokens=cache_write, target=target, hedged=hedged,
+              stop_reason=result.get("stop_reason"), cost_usd=round(cost, 6), retries=retries,
+              error=str(error) if error else None)
+
+    add_span(f"bedrock.{mode}", wall, outcome=outcome)
+    metrics.incr("bedrock_calls", model=model_id, outcome=outcome)
+    if retries:
+        metrics.incr("bedrock_retries", retries, model=model_id)
+    if hedged:
+        metrics.incr("bedrock_hedged_calls", model=model_id, target=target)
+    if not cache_hit and not error:
+        metrics.observe("bedrock_call_seconds", wall, model=model_id, mode=mode)
+        if ttft is not None:
+            metrics.observe("bedrock_ttft_seconds", ttft, model=model_id)
+        if output_tokens is not None:
+            metrics.observe("bedrock_output_tokens", output_tokens, model=model_id)
+            # Share of the max_tokens budget actually used, for tuning it
+            metrics.observe("bedrock_max_tokens_used", output_tokens / max(max_tokens, 1), model=model_id)
+        metrics.incr("bedrock_input_tokens", input_tokens or 0, model=model_id)
+        metrics.incr("bedrock_output_tokens_total", output_tokens or 0, model=model_id)
+        metrics.incr("bedrock_cost_usd", cost, model=model_id)
+        if cache_read or cache_write:
+            metrics.incr("bedrock_cache_read_tokens", cache_read, model=model_id)
+            metrics.incr("bedrock_cache_write_tokens", cache_write, model=model_id)
+            metrics.incr("bedrock_cache_saved_usd", saved, model=model_id)
+
+    with _sessions_lock:
+        totals = _session_totals(session)
+        totals["calls"] += 1
+        totals["cache_hits"] += cache_hit
+        totals["errors"] += error is not None
+        totals["retries"] += retries
+        totals["input_tokens"] += input_tokens or 0
+        totals["output_tokens"] += output_tokens or 0
+        totals["cost_usd"] += cost
+        totals["cache_read_tokens"] += cache_read
+        totals["cache_write_tokens"] += cache_write
+        totals["cache_saved_usd"] += saved
+        if not cache_hit and not error:
+            totals["latency"].observe(wall)
+            if ttft is not None:
+                totals["ttft"].observe(ttft)
+
+
+def session_summary(session: str) -> dict:
+    with _sessions_lock:
+        totals = _sessions.get(session)
+        if totals is None:
+            return None
+        summary = {k: v for k, v in totals.items() if k not in ("latency", "ttft")}
+        summary["latency"] = totals["latency"].summary()
+        summary["ttft"] = totals["ttft"].summary()
+        return summary
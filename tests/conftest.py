@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+
+# Settings are read when the modules are imported, so the environment is set
+# up before any of them load: the fake Bedrock client answers instantly and
+# on-disk stores live in a throwaway directory.
+_tmp = tempfile.mkdtemp(prefix="testgen-tests-")
+os.environ.update(
+    AWS_REGION="us-east-1",
+    BEDROCK_FAKE="1",
+    FAKE_BEDROCK_LATENCY="0",
+    FAKE_BEDROCK_TOKENS_PER_SECOND="1000000",
+    FAKE_BEDROCK_THROTTLE_RATE="0",
+    BEDROCK_RPM="100000",
+    BEDROCK_TPM="100000000",
+    TELEMETRY_LOG="off",
+    BEDROCK_CACHE_ENABLED="0",
+    BEDROCK_TARGETS="{}",
+    FAKE_BEDROCK_TAIL_RATE="0",
+    SECTION_STORE_PATH=os.path.join(_tmp, "sections.sqlite3"),
+    TOKEN_STATS_PATH=os.path.join(_tmp, "token_stats.json"),
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
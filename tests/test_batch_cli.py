@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+from batch_cli import MANIFEST_NAME, build_arg_parser, run
+
+
+@pytest.fixture
+def specs(tmp_path):
+    folder = tmp_path / "specs"
+    folder.mkdir()
+    (folder / "login.txt").write_text("## Login\nUsers shall log in with an email and a password.\n")
+    return folder
+
+
+def _run(specs, out, *options) -> dict:
+    args = build_arg_parser().parse_args([str(specs), "--out", str(out), "--workers", "1", *options])
+    assert run(args) == 0
+    with open(out / MANIFEST_NAME, encoding="utf-8") as f:
+        return {entry["source"]: entry for entry in json.load(f)["inputs"]}
+
+
+@pytest.mark.parametrize("options", [["--count", "4"], ["--temperature", "0.5"], ["--estimate", "local"],
+                                     ["--chunked"], ["--format", "BDD"], ["--output", "json"]])
+def test_changed_settings_rerun_done_inputs(specs, tmp_path, capsys, options):
+    out = tmp_path / "out"
+    first = _run(specs, out, "--count", "3")
+    _run(specs, out, "--count", "3")
+    assert "1 skipped" in capsys.readouterr().out
+    second = _run(specs, out, "--count", "3", *options)
+    assert "0 skipped" in capsys.readouterr().out
+    [before], [after] = first.values(), second.values()
+    assert before["settings"] != after["settings"]
@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import bedrock_client
+from bedrock_client import client_stats, get_bedrock_client, reset_clients
+
+
+@pytest.fixture(autouse=True)
+def real_clients(monkeypatch):
+    # Pooling is about the boto3 clients; building them needs no credentials
+    monkeypatch.setattr(bedrock_client, "BEDROCK_FAKE", False)
+
+
+def test_clients_are_pooled_per_region_and_config():
+    reset_clients()
+    first = get_bedrock_client()
+    assert get_bedrock_client() is first
+    assert get_bedrock_client("us-west-2") is not first
+    assert get_bedrock_client(read_timeout=5) is not first
+    stats = client_stats()
+    assert (stats["created"], stats["reused"], stats["cached"]) == (3, 1, 3)
+    reset_clients()
+    assert client_stats()["cached"] == 0
+
+
+def test_threads_share_one_client():
+    reset_clients()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        clients = list(pool.map(lambda _: get_bedrock_client(), range(32)))
+    assert all(client is clients[0] for client in clients)
+    assert client_stats()["created"] == 1
+
+
+def test_model_family_strips_geo_prefix():
+    assert bedrock_client.model_family("us.anthropic.claude-3-sonnet-20240229-v1:0") == "messages"
+    assert bedrock_client.model_family("anthropic.claude-sonnet-4-20250514-v1:0") == "messages"
+    assert bedrock_client.model_family("anthropic.claude-instant-v1") == "anthropic"
+    assert bedrock_client.model_family("amazon.titan-text-express-v1") == "titan"
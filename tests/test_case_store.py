@@ -0,0 +1,58 @@
+import pytest
+
+import case_store
+from case_store import CaseStore, Step
+
+
+def _case(title: str, priority: str = "High", source_id: str = ""):
+    # Not imported by name: pytest would try to collect a class called TestCase
+    case = case_store.TestCase()
+    case.source_id = source_id
+    case.title = title
+    case.expected = "Done"
+    case.priority = priority
+    case.steps = [Step("1. Open the page", "Open the page"), Step("2. Submit", "Submit", "Saved")]
+    return case
+
+
+def _store(*titles) -> CaseStore:
+    store = CaseStore("Traditional")
+    for title in titles:
+        store.append(_case(title))
+    return store
+
+
+def test_step_rows_share_case_columns():
+    store = _store("Case 0", "Case 1")
+    rows = store.step_rows()
+    assert len(rows) == 4
+    assert [row["ID"] for row in rows] == ["TC-001", "TC-001", "TC-002", "TC-002"]
+    assert [row["Expected Result"] for row in rows[:2]] == ["Done", "Saved"]
+    assert rows[2]["Step"] == "1. Open the page"
+    assert rows[0]["Priority"] is rows[3]["Priority"]
+
+
+def test_cases_read_back_from_columns():
+    store = _store("Case 0", "Case 1", "Case 2")
+    assert [case.title for case in store] == ["Case 0", "Case 1", "Case 2"]
+    last = store[-1]
+    assert last.source_id == "TC-003"
+    assert [step.text for step in last.steps] == ["Open the page", "Submit"]
+    assert store.case_rows(start=2)[0]["Steps"] == "1. Open the page\n2. Submit"
+    assert list(store.steps_frame().columns) == case_store.STEP_COLUMNS
+
+
+def test_ids_keep_unique_source_ids():
+    # e.g. stable ids from incremental regeneration, with gaps
+    store = CaseStore("Traditional")
+    for source_id in ("TC-004", "tc-7", "TC-012"):
+        store.append(_case("Case", source_id=source_id))
+    assert store.ids() == ["TC-004", "TC-007", "TC-012"]
+
+
+@pytest.mark.parametrize("source_ids", [("TC-004", "", "TC-012"), ("TC-001", "TC-001")])
+def test_ids_renumber_when_missing_or_duplicated(source_ids):
+    store = CaseStore("Traditional")
+    for source_id in source_ids:
+        store.append(_case("Case", source_id=source_id))
+    assert store.ids() == [f"TC-{n:03d}" for n in range(1, len(source_ids) + 1)]
@@ -0,0 +1,26 @@
+import io
+import sys
+import types
+
+import file_utils
+
+
+def test_string_extractor_is_imported_on_first_use(monkeypatch):
+    module = types.ModuleType("fake_markdown_reader")
+    module.read = lambda file_stream, pages=None: "# " + file_stream.getvalue().decode()
+    monkeypatch.setitem(sys.modules, "fake_markdown_reader", module)
+    monkeypatch.setattr(file_utils, "_EXTRACTORS", dict(file_utils._EXTRACTORS))
+    file_utils.register_extractor(".MD", "fake_markdown_reader:read")
+    assert file_utils._EXTRACTORS[".md"] == "fake_markdown_reader:read"
+
+    upload = io.BytesIO(b"Login")
+    upload.name = "spec.md"
+    assert file_utils.read_uploaded_file(upload) == "# Login"
+    assert file_utils._EXTRACTORS[".md"] is module.read
+    assert ".md" in file_utils.supported_extensions()
+
+
+def test_unknown_extensions_are_read_as_text():
+    upload = io.BytesIO(b"plain")
+    upload.name = "notes.rst"
+    assert file_utils.get_extractor(upload.name) is file_utils._EXTRACTORS[".txt"]
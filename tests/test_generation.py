@@ -0,0 +1,127 @@
+import json
+
+import pytest
+
+import generation
+from generation import (allocate_case_counts, generate_incremental, number_case_ids, renumber_case_ids,
+                        split_stable_sections)
+from parsers import parse_store
+from section_store import SectionStore
+
+MODEL = "anthropic.claude-3-sonnet-20240229-v1:0"
+
+
+def _document(sections: int) -> str:
+    # Each block is too large to share a section with its neighbour
+    return "\n\n".join(f"## {n}. Feature {n}\nUsers shall be able to use feature {n}. " +
+                       f"Feature {n} detail sentence number {n}. " * 120 for n in range(1, sections + 1))
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    section_store = SectionStore(str(tmp_path / "sections.sqlite3"))
+    monkeypatch.setattr(generation, "get_section_store", lambda: section_store)
+    return section_store
+
+
+@pytest.mark.parametrize("sizes,total", [([100, 100, 100], 10), ([5000, 100, 100], 10), ([1, 1], 2), ([10] * 7, 7),
+                                         ([100] * 5, 3), ([5000, 100, 100, 2000], 2)])
+def test_allocate_case_counts(sizes, total):
+    counts = allocate_case_counts(["x" * size for size in sizes], total)
+    assert sum(counts) == total
+    # Every section gets a case when there are enough to go round
+    assert min(counts) >= (1 if total >= len(sizes) else 0)
+    # Larger sections never get fewer cases
+    for (a, ca), (b, cb) in zip(zip(sizes, counts), zip(sizes[1:], counts[1:])):
+        assert (ca >= cb) if a >= b else (ca <= cb)
+
+
+def test_stable_sections_start_at_headings():
+    text = "\n\n".join(f"## {n}. Feature {n}\n" + f"Users shall use feature {n}. " * 40 for n in range(1, 13))
+    sections = split_stable_sections(text, target_chars=2500)
+    assert 1 < len(sections) < 12
+    assert all(section.startswith("## ") and len(section) <= 2500 for section in sections)
+    assert "\n\n".join(sections).split() == text.split()
+
+
+def test_renumber_case_ids_is_global():
+    outputs = ["ID: TC-001\nTitle: A\n\nID: TC-002\nTitle: B", "ID: TC-001\nTitle: C", ""]
+    assert renumber_case_ids(outputs).count("TC-") == 3
+    assert [line for line in renumber_case_ids(outputs).splitlines() if line.startswith("ID")] == \
+        ["ID: TC-001", "ID: TC-002", "ID: TC-003"]
+
+
+def test_number_case_ids_traditional():
+    output = "ID: TC-001\nTitle: A\n\nID: TC-001\nTitle: B\n"
+    numbered = number_case_ids(output, "Traditional", "text", 7)
+    assert parse_store(numbered, "Traditional").ids() == ["TC-007", "TC-008"]
+
+
+def test_number_case_ids_bdd_tags_replace_old_ones():
+    output = "@TC-003\nScenario: A\nGiven x\n\nScenario: B\nGiven y\n"
+    numbered = number_case_ids(output, "BDD", "text", 12)
+    assert numbered.count("@TC-") == 2
+    assert parse_store(numbered, "BDD").ids() == ["TC-012", "TC-013"]
+
+
+def test_number_case_ids_json():
+    output = json.dumps([{"test_case_id": "TC-001", "scenario": "A", "steps": ["Given x"]},
+                         {"test_case_id": "TC-001", "scenario": "B", "steps": ["Given y"]}])
+    numbered = json.loads(number_case_ids(output, "BDD", "json", 3))
+    assert [obj["test_case_id"] for obj in numbered] == ["TC-003", "TC-004"]
+
+
+def test_incremental_reuses_unchanged_sections_with_stable_ids(store):
+    text = _document(6)
+    assert len(split_stable_sections(text)) == 6
+    first, plan, reused = generate_incremental(text, 12, "Traditional", MODEL)
+    assert reused == 0
+    assert len(parse_store(first, "Traditional")) == 12
+    edited = text.replace("use feature 3.", "use feature three.")
+    second, new_plan, reused = generate_incremental(edited, 12, "Traditional", MODEL, previous_plan=plan)
+    assert reused == 5
+    assert len(parse_store(second, "Traditional")) == 12
+    kept = {e["hash"]: e["first_id"] for e in plan}
+    assert sum(1 for e in new_plan if kept.get(e["hash"]) == e["first_id"]) == 5
+
+
+def test_incremental_keeps_to_requested_count(store):
+    text = _document(20)
+    assert len(split_stable_sections(text)) == 20
+    for count in (5, 20, 33):
+        output, plan, _ = generate_incremental(text, count, "Traditional", MODEL)
+        assert len(parse_store(output, "Traditional")) == count
+        assert sum(entry["cases"] for entry in plan) == count
+
+
+def test_incremental_json_count(store):
+    output, plan, _ = generate_incremental(_document(6), 4, "BDD", MODEL, output_format="json")
+    assert len(parse_store(output, "BDD", "json")) == 4
+
+
+def test_incremental_does_not_reuse_counts_that_no_longer_fit(store):
+    text = _document(6)
+    generate_incremental(text, 30, "Traditional", MODEL)
+    output, plan, reused = generate_incremental(text, 6, "Traditional", MODEL)
+    assert reused == 0
+    assert len(parse_store(output, "Traditional")) == 6
+
+
+def test_stable_sections_do_not_end_on_tiny_paragraphs():
+    text = "\n\n".join(f"Requirement {n}: the user can do thing {n}." for n in range(200))
+    sections = split_stable_sections(text, target_chars=2000, min_chars=500)
+    assert all(500 <= len(section) <= 2000 for section in sections[:-1])
+    assert "\n\n".join(sections).split() == text.split()
+
+
+def test_section_boundaries_do_not_depend_on_the_count(store):
+    text = _document(8)
+    _, plan, _ = generate_incremental(text, 16, "Traditional", MODEL)
+    _, small_plan, reused = generate_incremental(text, 3, "Traditional", MODEL)
+    assert len(plan) == 8 and len(small_plan) == 3
+    assert {e["hash"] for e in small_plan} <= {e["hash"] for e in plan}
+    assert sum(e["cases"] for e in small_plan) == 3
+    # Back to the first count: the sections the small run left alone are reused
+    output, _, reused = generate_incremental(text, 16, "Traditional", MODEL)
+    assert reused >= 5
+    assert len(parse_store(output, "Traditional")) == 16
@@ -0,0 +1,112 @@
+import json
+
+import parsers
+from parsers import JsonCaseParser, json_case_objects, parse_output, parse_store
+
+TRADITIONAL = """Here are the test cases:
+
+**ID:** TC-001
+**Title:** Log in with valid credentials
+**Preconditions:** A registered user
+**Steps:**
+1. Open the login page
+2. Enter a valid email and password
+3. Click "Log in"
+**Expected Result:** The dashboard is shown
+**Priority:** High
+**Tags:** login, smoke
+
+ID: TC-002
+Title: Log in with a wrong password
+Preconditions: A registered user
+Steps:
+1. Enter a wrong password
+2. Click "Log in"
+Expected Result: An error message is shown
+Priority: Medium
+Tags: login
+"""
+
+BDD = """Feature: Login
+
+Scenario: Valid login
+Given a registered user
+When they log in with valid credentials
+Then the dashboard is shown
+
+Scenario Outline: Invalid login
+Given a registered user
+When they log in with "<password>"
+Then an error is shown
+"""
+
+
+JSON_CASES = [
+    {"test_case_id": "TC-001", "title": "Valid login", "preconditions": "A registered user",
+     "steps": [{"step_number": 1, "action": "Open the login page", "expected_result": "The form is shown"},
+               {"step_number": 2, "action": "Submit valid credentials", "expected_result": "The dashboard is shown"}],
+     "expected_result": "The dashboard is shown", "priority": "High", "tags": ["login"]},
+    {"test_case_id": "TC-002", "title": "Wrong password {not a brace}", "preconditions": "",
+     "steps": [{"step_number": 1, "action": "Submit \"bad\" password", "expected_result": "An error is shown"}],
+     "expected_result": "An error is shown", "priority": "Medium", "tags": []},
+]
+
+
+def test_traditional_text_fields_and_steps():
+    cases, steps = parse_output(TRADITIONAL, "Traditional")
+    assert [case["Title"] for case in cases] == ["Log in with valid credentials", "Log in with a wrong password"]
+    assert cases[0]["Preconditions"] == "A registered user"
+    assert cases[0]["Expected Results"] == "The dashboard is shown"
+    assert [step["Step"] for step in steps if step["ID"] == "TC-001"] == [
+        "1. Open the login page", "2. Enter a valid email and password", '3. Click "Log in"']
+    assert steps[0]["Priority"] == "High"
+    assert len(steps) == 5
+
+
+def test_traditional_stream_chunks_match_whole_text():
+    # Not imported by name: pytest would try to collect a class called Test...
+    parser = parsers.TestCaseParser("Traditional")
+    completed = []
+    for i in range(0, len(TRADITIONAL), 7):
+        completed += parser.feed(TRADITIONAL[i:i + 7])
+    completed += parser.close()
+    assert len(completed) == 2
+    assert parser.cases.case_rows() == parse_output(TRADITIONAL, "Traditional")[0]
+
+
+def test_store_matches_row_view():
+    store = parse_store(TRADITIONAL, "Traditional")
+    assert store[1].title == "Log in with a wrong password"
+    assert [step.text for step in store[0].steps] == ["Open the login page", "Enter a valid email and password",
+                                                     'Click "Log in"']
+    assert store.step_rows() == parse_output(TRADITIONAL, "Traditional")[1]
+
+
+def test_bdd_scenarios():
+    cases, _ = parse_output(BDD, "BDD")
+    assert [case["Scenario"] for case in cases] == ["Valid login", "Invalid login"]
+    assert cases[0]["Description"].startswith("Scenario: Valid login")
+
+
+def test_json_objects_are_validated_and_survive_chunking():
+    text = "```json\n" + json.dumps(JSON_CASES, indent=2) + "\n```"
+    parser = JsonCaseParser("Traditional")
+    completed = []
+    for i in range(0, len(text), 5):
+        completed += parser.feed(text[i:i + 5])
+    assert len(completed) == 2
+    assert parser.cases.titles() == ["Valid login", "Wrong password {not a brace}"]
+    assert [step.text for step in parser.cases[1].steps] == ['Submit "bad" password']
+    assert [row["Expected Result"] for row in parser.cases.step_rows()[:2]] == [
+        "The form is shown", "The dashboard is shown"]
+    assert parser.rejected == 0
+
+
+def test_json_drops_truncated_and_invalid_objects():
+    text = json.dumps(JSON_CASES)
+    truncated = text[:text.rindex('"expected_result"')]
+    assert [o["test_case_id"] for o in json_case_objects(truncated, "Traditional")] == ["TC-001"]
+    parser = JsonCaseParser("Traditional")
+    parser.feed('[{"foo": 1}, ' + json.dumps(JSON_CASES[0]) + "]")
+    assert parser.rejected == 1
+    assert len(parser.cases) == 1
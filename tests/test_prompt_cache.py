@@ -0,0 +1,80 @@
+import contextvars
+
+import pytest
+
+import bedrock_client
+from bedrock_client import call_bedrock_model, stream_bedrock_model
+from fake_bedrock import FakeBedrockClient
+from scheduler import bind_session
+from telemetry import estimate_cost, prompt_cache_savings, session_summary
+
+CACHED_MODEL = "anthropic.claude-3-5-haiku-20241022-v1:0"
+UNCACHED_MODEL = "anthropic.claude-3-sonnet-20240229-v1:0"
+REQUIREMENTS = "Requirements:\n" + "The user shall be able to reset a forgotten password. " * 120
+FORMAT = "Write every case with ID, Title, Preconditions, Steps and Expected Result. " * 20
+# Tokens the fake counts for the cached prefix (4 characters per token, per segment)
+PREFIX_TOKENS = len(REQUIREMENTS) // 4 + len(FORMAT) // 4
+
+
+def _prompt(task: str) -> tuple:
+    return (REQUIREMENTS, FORMAT, task)
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    # A client of its own, so earlier tests have not warmed its prompt cache
+    client = FakeBedrockClient(latency=0, tokens_per_second=1e6)
+    monkeypatch.setattr(bedrock_client, "get_bedrock_client", lambda region=None: client)
+    return client
+
+
+def _calls() -> list:
+    bind_session("prompt-cache-test")
+    first = call_bedrock_model(_prompt("Generate 2 manual test cases in the TRADITIONAL format."),
+                               CACHED_MODEL, 1000, 0.0, use_cache=False, return_details=True)
+    second = call_bedrock_model(_prompt("Generate 3 manual test cases in the TRADITIONAL format."),
+                                CACHED_MODEL, 1000, 0.0, use_cache=False, return_details=True)
+    details = {}
+    streamed = "".join(stream_bedrock_model(_prompt("Generate 1 manual test cases in the TRADITIONAL format."),
+                                            CACHED_MODEL, 1000, 0.0, use_cache=False, details=details))
+    return first, second, details, streamed
+
+
+def test_prefix_is_written_once_then_read(fake):
+    # In a context of its own so the session binding does not leak into other tests
+    first, second, details, streamed = contextvars.copy_context().run(_calls)
+    assert (first["cache_read_tokens"], first["cache_write_tokens"]) == (0, PREFIX_TOKENS)
+    assert (second["cache_read_tokens"], second["cache_write_tokens"]) == (PREFIX_TOKENS, 0)
+    assert (details["cache_read_tokens"], details["cache_write_tokens"]) == (PREFIX_TOKENS, 0)
+    assert "TC-001" in streamed
+    # Input tokens only count the uncached tail of the prompt
+    assert second["input_tokens"] < 50
+
+    summary = session_summary("prompt-cache-test")
+    assert summary["calls"] == 3
+    assert summary["cache_read_tokens"] == 2 * PREFIX_TOKENS
+    assert summary["cache_write_tokens"] == PREFIX_TOKENS
+    results = [first, second, details]
+    assert summary["cost_usd"] == pytest.approx(sum(
+        estimate_cost(CACHED_MODEL, r["input_tokens"], r["output_tokens"], r["cache_read_tokens"],
+                      r["cache_write_tokens"]) for r in results))
+    assert summary["cache_saved_usd"] == pytest.approx(
+        prompt_cache_savings(CACHED_MODEL, 2 * PREFIX_TOKENS, PREFIX_TOKENS))
+    assert summary["cache_saved_usd"] > 0
+
+
+def test_no_cache_checkpoints_without_model_support_or_for_short_prefixes(fake):
+    prompt = _prompt("Generate 2 manual test cases in the TRADITIONAL format.")
+    for _ in range(2):
+        result = call_bedrock_model(prompt, UNCACHED_MODEL, 1000, 0.0, use_cache=False, return_details=True)
+        assert not result["cache_read_tokens"] and not result["cache_write_tokens"]
+    short = ("Requirements: log in.", "Use the traditional format.", "Generate 1 manual test cases.")
+    for _ in range(2):
+        result = call_bedrock_model(short, CACHED_MODEL, 1000, 0.0, use_cache=False, return_details=True)
+        assert not result["cache_read_tokens"] and not result["cache_write_tokens"]
+
+
+def test_savings_are_negative_while_only_writing():
+    assert prompt_cache_savings(CACHED_MODEL, 0, 2000) < 0
+    assert prompt_cache_savings(CACHED_MODEL, 2000, 0) == pytest.approx(2000 * 0.9 * 0.0008 / 1000)
+    assert prompt_cache_savings("unknown.model", 2000, 0) == 0.0
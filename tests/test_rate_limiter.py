@@ -0,0 +1,143 @@
+import pytest
+
+import rate_limiter
+from rate_limiter import AIMD_DECREASE, AIMD_INCREASE, AIMD_MIN_SCALE, ModelRateLimiter, TokenBucket
+
+
+class Throttled(Exception):
+    response = {"Error": {"Code": "ThrottlingException"}}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff_sleep(monkeypatch):
+    monkeypatch.setattr(rate_limiter.random, "uniform", lambda low, high: 0.0)
+
+
+def test_bucket_take_wait_and_refill():
+    bucket = TokenBucket(60)  # one per second
+    bucket.updated = now = 100.0
+    assert bucket.wait_time(60, now) == 0.0
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 0.5) == pytest.approx(0.5)
+    assert bucket.wait_time(1, now + 1.0) == 0.0
+    # Refills stop at capacity
+    assert bucket.wait_time(1, now + 3600) == 0.0
+    assert bucket.level == 60
+
+
+def test_bucket_requests_larger_than_capacity_wait_for_a_full_bucket():
+    bucket = TokenBucket(100)
+    bucket.updated = 0.0
+    bucket.take(100)
+    assert bucket.wait_time(1000, 0.0) == pytest.approx(60.0)
+
+
+def test_bucket_scale_caps_level():
+    bucket = TokenBucket(100)
+    bucket.set_scale(0.25)
+    assert bucket.capacity == 25
+    assert bucket.level == 25
+
+
+def test_aimd_halves_on_throttle_and_recovers_additively():
+    limiter = ModelRateLimiter("m", rpm=100, tpm=10000)
+    limiter.on_throttle()
+    assert limiter.scale == AIMD_DECREASE
+    assert limiter.requests.capacity == 100 * AIMD_DECREASE
+    limiter.on_success()
+    assert limiter.scale == pytest.approx(AIMD_DECREASE + AIMD_INCREASE)
+    for _ in range(100):
+        limiter.on_throttle()
+    assert limiter.scale == AIMD_MIN_SCALE
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.scale == 1.0
+
+
+def test_call_settles_actual_usage():
+    limiter = ModelRateLimiter("m", rpm=1000, tpm=10000)
+    assert limiter.call(lambda: "ok", 1000, used_tokens=lambda result: 200) == "ok"
+    assert limiter.tokens.level == pytest.approx(10000 - 200, abs=5)
+
+
+def test_call_retries_throttling():
+    limiter = ModelRateLimiter("m", rpm=1000, tpm=10000)
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Throttled()
+        return "ok"
+
+    assert limiter.call(fn, 1000) == "ok"
+    assert limiter.stats["retries"] == 2
+    assert limiter.stats["throttled"] == 2
+    assert limiter.scale < 1.0
+
+
+def test_call_does_not_retry_other_errors():
+    limiter = ModelRateLimiter("m", rpm=1000, tpm=10000)
+
+    def fn():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        limiter.call(fn, 1000)
+    assert limiter.stats["failed"] == 1
+    assert limiter.tokens.level == pytest.approx(10000, abs=5)
+
+
+def test_stream_retries_only_before_the_first_piece():
+    limiter = ModelRateLimiter("m", rpm=1000, tpm=10000)
+    attempts = []
+
+    def start():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise Throttled()
+        yield "a"
+        raise Throttled()
+
+    stream = limiter.stream(start, 1000)
+    assert next(stream) == "a"
+    with pytest.raises(Throttled):
+        next(stream)
+    assert len(attempts) == 2
+    assert limiter.stats["failed"] == 1
+
+
+def test_closed_stream_gives_back_unused_reservation():
+    limiter = ModelRateLimiter("m", rpm=1000, tpm=100000)
+    usage = {}
+
+    def start():
+        try:
+            for piece in ("a", "b", "c"):
+                yield piece
+        finally:
+            usage["tokens"] = 120  # usage so far, recorded as the stream closes
+
+    stream = limiter.stream(start, 5000, lambda: usage.get("tokens"))
+    assert next(stream) == "a"
+    assert limiter.tokens.level == pytest.approx(95000, abs=50)
+    # e.g. the losing attempt of a hedged call
+    stream.close()
+    assert limiter.tokens.level == pytest.approx(100000 - 120, abs=50)
+
+
+def test_stream_failing_mid_way_settles_the_tokens_used():
+    limiter = ModelRateLimiter("m", rpm=1000, tpm=100000)
+    usage = {}
+
+    def start():
+        yield "a"
+        usage["tokens"] = 150
+        raise Throttled()
+
+    stream = limiter.stream(start, 5000, lambda: usage.get("tokens"))
+    assert next(stream) == "a"
+    with pytest.raises(Throttled):
+        next(stream)
+    assert limiter.tokens.level == pytest.approx(100000 - 150, abs=50)
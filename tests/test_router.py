@@ -0,0 +1,143 @@
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from router import BedrockRouter, Target
+from scheduler import get_scheduler
+
+MODEL = "anthropic.claude-3-sonnet-20240229-v1:0"
+
+
+def _unavailable():
+    return ClientError({"Error": {"Code": "ServiceUnavailableException", "Message": "down"}}, "InvokeModel")
+
+
+class Attempts:
+    """attempt() for the router: per-region delay before the answer, or an error."""
+
+    def __init__(self, delays: dict, errors: tuple = ()):
+        self.delays = delays
+        self.errors = errors
+        self.closed = []
+
+    def __call__(self, target, attempt_info):
+        try:
+            time.sleep(self.delays[target.region])
+            if target.region in self.errors:
+                raise _unavailable()
+            yield "piece", f"from {target.region}"
+            yield "done", {"text": f"from {target.region}"}
+        finally:
+            self.closed.append(target.region)
+
+
+def _router(regions=("us-east-1", "us-west-2")) -> BedrockRouter:
+    router = BedrockRouter(MODEL, [Target(region, MODEL) for region in regions])
+    router.hedge_budget = 1.0
+    return router
+
+
+def _drive(steps) -> tuple:
+    pieces = []
+    try:
+        while True:
+            pieces.append(next(steps))
+    except StopIteration as stop:
+        return pieces, stop.value
+
+
+def _race(router, attempt, delay=0.05) -> tuple:
+    info = {}
+    pieces, result = _drive(router._race(router.targets, attempt, 100, "first_token", delay, info))
+    return pieces, result, info
+
+
+def _settled(attempt, count):
+    # Losing attempts finish on their own thread
+    deadline = time.monotonic() + 2
+    while len(attempt.closed) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert get_scheduler().running == 0
+
+
+def test_hedge_wins_when_the_primary_is_slow():
+    router = _router()
+    attempt = Attempts({"us-east-1": 0.5, "us-west-2": 0.0})
+    pieces, result, info = _race(router, attempt)
+    assert pieces == ["from us-west-2"]
+    assert result["text"] == "from us-west-2"
+    assert info["hedged"] and info["target"] == f"us-west-2/{MODEL}"
+    assert (router.stats["hedged"], router.stats["hedge_wins"]) == (1, 1)
+    assert router.hedge_budget == 0.0
+    _settled(attempt, 2)
+
+
+def test_primary_answering_first_cancels_the_hedge():
+    router = _router()
+    attempt = Attempts({"us-east-1": 0.15, "us-west-2": 0.5})
+    pieces, result, info = _race(router, attempt)
+    assert result["text"] == "from us-east-1"
+    assert info["hedged"] and info["target"] == f"us-east-1/{MODEL}"
+    assert (router.stats["hedged"], router.stats["hedge_wins"]) == (1, 0)
+    _settled(attempt, 2)
+
+
+def test_no_hedge_without_budget():
+    router = _router()
+    router.hedge_budget = 0.0
+    attempt = Attempts({"us-east-1": 0.15, "us-west-2": 0.0})
+    _, result, info = _race(router, attempt)
+    assert result["text"] == "from us-east-1"
+    assert not info["hedged"]
+    assert router.stats["hedged"] == 0
+    assert attempt.closed == ["us-east-1"]
+
+
+def test_failed_primary_falls_back_to_the_running_hedge():
+    router = _router()
+    attempt = Attempts({"us-east-1": 0.15, "us-west-2": 0.3}, errors=("us-east-1",))
+    _, result, info = _race(router, attempt)
+    assert result["text"] == "from us-west-2"
+    assert router.targets[0].stats["errors"] == 1
+    assert router.targets[1].stats["calls"] == 1
+    _settled(attempt, 2)
+
+
+def test_race_raises_when_every_attempt_fails():
+    router = _router()
+    attempt = Attempts({"us-east-1": 0.1, "us-west-2": 0.0}, errors=("us-east-1", "us-west-2"))
+    with pytest.raises(ClientError):
+        _race(router, attempt)
+    _settled(attempt, 2)
+
+
+def test_unhedged_call_fails_over_once_and_marks_the_target_down():
+    router = _router()
+    router.hedging = False
+    attempt = Attempts({"us-east-1": 0.0, "us-west-2": 0.0}, errors=("us-east-1",))
+    for _ in range(3):
+        _, result = _drive(router.run(attempt, 100, "first_token", {}))
+        assert result["text"] == "from us-west-2"
+    assert router.stats["failovers"] == 3
+    # After three failures in a row the primary is skipped for the cooldown
+    assert [t.region for t in router._ordered("first_token")] == ["us-west-2"]
+    _, result = _drive(router.run(attempt, 100, "first_token", {}))
+    assert result["text"] == "from us-west-2"
+    assert router.stats["failovers"] == 3
+
+
+def test_hedge_needs_a_free_scheduler_slot():
+    router = _router()
+    scheduler = get_scheduler()
+    held = [scheduler.try_acquire("other", 100) for _ in range(scheduler.max_concurrency)]
+    try:
+        attempt = Attempts({"us-east-1": 0.15, "us-west-2": 0.0})
+        _, result, info = _race(router, attempt)
+    finally:
+        for _ in held:
+            scheduler.release("other")
+    assert result["text"] == "from us-east-1"
+    assert not info["hedged"]
+    # The budget is kept for the next slow call
+    assert router.hedge_budget == 1.0
@@ -0,0 +1,91 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bedrock_client
+from scheduler import BedrockScheduler
+
+MODEL = "anthropic.claude-3-sonnet-20240229-v1:0"
+
+
+def _queue(scheduler, session, tokens, admitted):
+    # Start a call in its own thread and wait until it is queued
+    waiting = len(scheduler._waiting)
+
+    def run():
+        scheduler.acquire(session, tokens)
+        admitted.append((session, tokens))
+        scheduler.release(session)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    while len(scheduler._waiting) == waiting:
+        time.sleep(0.001)
+    return thread
+
+
+def test_small_requests_and_idle_sessions_go_first():
+    scheduler = BedrockScheduler(max_concurrency=2)
+    scheduler.acquire("a", 10000)  # held for the whole test
+    scheduler.acquire("c", 10000)
+    admitted = []
+    threads = [_queue(scheduler, "a", 10000, admitted),
+               _queue(scheduler, "b", 10000, admitted),
+               _queue(scheduler, "a", 100, admitted)]
+    assert scheduler.status("a")["position"] == 1
+    scheduler.release("c")
+    for thread in threads:
+        thread.join(5)
+    # Small first, then the session with nothing running, then arrival order
+    assert admitted == [("a", 100), ("b", 10000), ("a", 10000)]
+    assert scheduler.running == 1
+    assert scheduler.stats["admitted"] == 5
+
+
+def test_concurrency_cap_holds_with_the_fake_client(monkeypatch):
+    scheduler = BedrockScheduler(max_concurrency=3)
+    monkeypatch.setattr(bedrock_client, "get_scheduler", lambda: scheduler)
+    invoke = bedrock_client._invoke_model
+    peak = []
+
+    def slow_invoke(*args):
+        peak.append(scheduler.running)
+        time.sleep(0.02)
+        return invoke(*args)
+
+    monkeypatch.setattr(bedrock_client, "_invoke_model", slow_invoke)
+    prompt = "Generate 1 manual test cases in the TRADITIONAL format."
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        texts = list(pool.map(lambda _: bedrock_client.call_bedrock_model(prompt, MODEL, 500, 0.0, use_cache=False),
+                              range(24)))
+    assert all("TC-001" in text for text in texts)
+    assert max(peak) == 3
+    assert scheduler.running == 0
+    assert scheduler.stats["admitted"] == 24
+
+
+def test_slot_is_released_when_the_admission_notice_raises():
+    scheduler = BedrockScheduler(max_concurrency=1)
+    scheduler.acquire("other", 100)
+    errors = []
+
+    def on_wait(position, waiting):
+        # e.g. Job.update() raising JobCancelled once the job was cancelled
+        if position == 0:
+            raise RuntimeError("cancelled")
+
+    def run():
+        try:
+            scheduler.acquire("job", 100, on_wait)
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    while not scheduler._waiting:
+        time.sleep(0.001)
+    scheduler.release("other")
+    thread.join(5)
+    assert len(errors) == 1
+    assert scheduler.running == 0
+    assert not scheduler._inflight
@@ -0,0 +1,18 @@
+import os
+
+import utils
+
+
+def test_bundled_encoding_loads_without_touching_the_environment(monkeypatch):
+    monkeypatch.setattr(utils, "_encodings", {})
+    before = dict(os.environ)
+    encoding = utils.get_encoding("anthropic.claude-3-sonnet-20240229-v1:0")
+    assert dict(os.environ) == before
+    assert encoding.name == "cl100k_base"
+    assert encoding.encode("hello world <|endoftext|>", allowed_special="all") == [15339, 1917, 220, 100257]
+
+
+def test_count_tokens_falls_back_without_an_encoding(monkeypatch):
+    assert utils.count_tokens("hello world") == 2
+    monkeypatch.setattr(utils, "_encodings", {"gpt-4": None})
+    assert utils.count_tokens("x" * 40) == 10
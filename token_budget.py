@@ -0,0 +1,173 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from utils import estimate_tokens_per_tc
+
+# max_tokens for generation calls, learned from the usage Bedrock reports.
+# Output tokens are fitted against the case count per (model, test type,
+# output format); the budget for a call is the fitted value scaled by the
+# chosen percentile of observed/fitted ratios, so most calls fit without
+# reserving far more than they use.
+TOKEN_STATS_PATH = os.getenv("TOKEN_STATS_PATH", os.path.join(".cache", "token_stats.json"))
+TOKEN_BUDGET_PERCENTILE = float(os.getenv("TOKEN_BUDGET_PERCENTILE", "0.95"))
+# Completed calls needed per key before the learned budget replaces the heuristic
+TOKEN_BUDGET_MIN_SAMPLES = int(os.getenv("TOKEN_BUDGET_MIN_SAMPLES", "5"))
+# Most recent calls kept per key, so the fit follows prompt and model changes
+TOKEN_BUDGET_WINDOW = int(os.getenv("TOKEN_BUDGET_WINDOW", "200"))
+# Seconds between saves of the statistics file
+TOKEN_STATS_SAVE_INTERVAL = float(os.getenv("TOKEN_STATS_SAVE_INTERVAL", "10"))
+# JSON output spends tokens on keys and quoting; the heuristic budget is scaled up by this
+JSON_OUTPUT_TOKEN_FACTOR = float(os.getenv("JSON_OUTPUT_TOKEN_FACTOR", "1.5"))
+
+HEURISTIC_BUFFER = 200
+
+
+def heuristic_budget(model_id: str, count: int, output_format: str = "text") -> int:
+    """Fixed tokens per case plus a flat buffer, used until enough usage has been seen."""
+    per_tc = estimate_tokens_per_tc(model_id)
+    if output_format == "json":
+        per_tc = int(per_tc * JSON_OUTPUT_TOKEN_FACTOR)
+    return per_tc * count + HEURISTIC_BUFFER
+
+
+def _fit(samples) -> tuple:
+    """Least-squares (intercept, tokens per case) over (cases, output tokens) samples."""
+    n = len(samples)
+    mean_x = sum(x for x, _ in samples) / n
+    mean_y = sum(y for _, y in samples) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in samples)
+    if var_x == 0:
+        # Every call had the same count (e.g. full batches): no intercept to separate
+        return 0.0, mean_y / max(mean_x, 1)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in samples) / var_x
+    intercept = mean_y - slope * mean_x
+    if slope <= 0 or intercept < 0:
+        return 0.0, mean_y / max(mean_x, 1)
+    return intercept, slope
+
+
+class TokenStats:
+    """
+    Observed usage per (model, test type, output format), persisted as JSON.
+
+    Output samples are (cases written, output tokens) per call. For a call
+    cut off at max_tokens, the cases are the complete ones and the tokens
+    include the unfinished case, which errs on the generous side instead of
+    leaving the calls that needed the most tokens out of the fit. Input usage
+    is kept per model as prompt characters versus billed input tokens
+    (cached prefix tokens included).
+    """
+
+    def __init__(self, path: str = TOKEN_STATS_PATH):
+        self.path = path
+        self.output = {}      # key -> deque of [cases, output tokens]
+        self.truncated = {}   # key -> count
+        self.input = {}       # model id -> [prompt chars, input tokens]
+        self._dirty = False
+        self._saved_at = 0.0
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def _key(model_id: str, test_type: str, output_format: str) -> str:
+        return f"{model_id}|{test_type}|{output_format}"
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.output = {k: deque(v, maxlen=TOKEN_BUDGET_WINDOW) for k, v in data.get("output", {}).items()}
+        self.truncated = data.get("truncated", {})
+        self.input = data.get("input", {})
+
+    def save(self, force: bool = False):
+        with self._lock:
+            if not self._dirty or (not force and time.monotonic() - self._saved_at < TOKEN_STATS_SAVE_INTERVAL):
+                return
+            data = {"output": {k: list(v) for k, v in self.output.items()},
+                    "truncated": dict(self.truncated), "input": dict(self.input)}
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Written to a temporary file and swapped in, so a crash never leaves half a file
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def record(self, model_id: str, test_type: str, output_format: str, cases: int, result: dict,
+               prompt_chars: int = None):
+        """Record one completed generation call's usage (result as returned with return_details=True)."""
+        if result.get("cache_hit"):
+            return  # a replayed response, already counted when it was made
+        key = self._key(model_id, test_type, output_format)
+        output_tokens = result.get("output_tokens")
+        input_tokens = sum(result.get(k) or 0 for k in ("input_tokens", "cache_read_tokens", "cache_write_tokens"))
+        with self._lock:
+            if result.get("truncated"):
+                self.truncated[key] = self.truncated.get(key, 0) + 1
+            if output_tokens and cases:
+                samples = self.output.get(key)
+                if samples is None:
+                    samples = self.output[key] = deque(maxlen=TOKEN_BUDGET_WINDOW)
+                samples.append([cases, output_tokens])
+            if prompt_chars and input_tokens:
+                totals = self.input.setdefault(model_id, [0, 0])
+                totals[0] += prompt_chars
+                totals[1] += input_tokens
+            self._dirty = True
+        self.save()
+
+    def output_budget(self, model_id: str, test_type: str, output_format: str, count: int,
+                      percentile: float = TOKEN_BUDGET_PERCENTILE) -> int:
+        """max_tokens for a call asked to write `count` cases."""
+        with self._lock:
+            samples = list(self.output.get(self._key(model_id, test_type, output_format), ()))
+        if len(samples) < TOKEN_BUDGET_MIN_SAMPLES:
+            return heuristic_budget(model_id, count, output_format)
+        intercept, per_case = _fit(samples)
+        ratios = sorted(y / max(intercept + per_case * x, 1.0) for x, y in samples)
+        ratio = ratios[min(len(ratios) - 1, int(percentile * len(ratios)))]
+        return math.ceil((intercept + per_case * count) * max(ratio, 1.0))
+
+    def tokens_per_case(self, model_id: str, test_type: str, output_format: str):
+        """Fitted output tokens per case, or None before enough calls were seen."""
+        with self._lock:
+            samples = list(self.output.get(self._key(model_id, test_type, output_format), ()))
+        if len(samples) < TOKEN_BUDGET_MIN_SAMPLES:
+            return None
+        return _fit(samples)[1]
+
+    def input_tokens(self, model_id: str, chars: int):
+        """Input tokens for `chars` prompt characters at the model's observed rate, or None if not seen yet."""
+        with self._lock:
+            totals = self.input.get(model_id)
+        if not totals or not totals[0]:
+            return None
+        return round(chars * totals[1] / totals[0])
+
+
+_stats = None
+_stats_lock = threading.Lock()
+
+
+def get_token_stats() -> TokenStats:
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = TokenStats()
+            # Saves are throttled; flush what is left on shutdown
+            atexit.register(_stats.save, True)
+        return _stats
+
+
+def output_token_budget(model_id: str, test_type: str, output_format: str, count: int) -> int:
+    return get_token_stats().output_budget(model_id, test_type, output_format, count)
@@ -0,0 +1,143 @@
+import contextlib
+import contextvars
+import cProfile
+import os
+import threading
+import time
+import uuid
+
+# Stage tracing is opt-in: off unless TRACE_STAGES=1 or the sidebar switch is on.
+TRACE_STAGES = os.getenv("TRACE_STAGES", "0") in ("1", "true", "True")
+# When set, each traced run is also profiled with cProfile and the stats are
+# written to <dir>/<trace id>.prof (open with snakeviz, or flameprof for a flame graph)
+TRACE_PROFILE_DIR = os.getenv("TRACE_PROFILE_DIR", "")
+
+TIMING_COLUMNS = ["Stage", "Calls", "Total (s)", "Mean (s)", "Max (s)", "% of Run"]
+
+_trace = contextvars.ContextVar("trace", default=None)
+_path = contextvars.ContextVar("trace_path", default="")
+
+
+class Trace:
+    """Named, nested stage spans collected for one run, from any thread."""
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.started = time.perf_counter()
+        self.ended = None
+        self.profile_path = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, path: str, duration: float, started: float = None, **attrs):
+        started = time.perf_counter() - duration if started is None else started
+        with self._lock:
+            self.spans.append((path, started, duration, attrs))
+
+    def finish(self):
+        if self.ended is None:
+            self.ended = time.perf_counter()
+
+    @property
+    def wall(self) -> float:
+        return (self.ended or time.perf_counter()) - self.started
+
+    def table(self) -> list:
+        """
+        One row per stage path, ordered by when the stage first started.
+        Concurrent spans (e.g. parallel sections) can add up to more than the run.
+        """
+        stages = {}
+        with self._lock:
+            for path, started, duration, _ in self.spans:
+                first, calls, total, longest = stages.get(path, (started, 0, 0.0, 0.0))
+                stages[path] = (min(first, started), calls + 1, total + duration, max(longest, duration))
+        wall = self.wall or 1e-9
+        rows = [dict(zip(TIMING_COLUMNS, ("(run)", 1, round(wall, 3), round(wall, 3), round(wall, 3), 100.0)))]
+        for path, (_, calls, total, longest) in sorted(stages.items(), key=lambda item: (item[1][0], item[0].count("/"))):
+            rows.append(dict(zip(TIMING_COLUMNS, (path, calls, round(total, 3), round(total / calls, 3),
+                                                  round(longest, 3), round(100 * total / wall, 1)))))
+        return rows
+
+    def frame(self):
+        """table() as a DataFrame, for the timings expander and export sheets."""
+        import pandas as pd
+        return pd.DataFrame(self.table(), columns=TIMING_COLUMNS)
+
+
+def current_trace():
+    return _trace.get()
+
+
+def start_trace(name: str, enabled: bool = None):
+    """Start a trace for the current context and return it, or None when tracing is off."""
+    if not (TRACE_STAGES if enabled is None else enabled):
+        _trace.set(None)
+        return None
+    trace = Trace(name)
+    _trace.set(trace)
+    _path.set("")
+    return trace
+
+
+@contextlib.contextmanager
+def use_trace(trace):
+    """Record spans in the block (e.g. on a worker thread) into an existing trace."""
+    token, path_token = _trace.set(trace), _path.set("")
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+        _path.reset(path_token)
+
+
+@contextlib.contextmanager
+def span(name: str, trace=None, **attrs):
+    """Time the block as a stage nested under the enclosing span. A no-op when no trace is active."""
+    trace = trace or _trace.get()
+    if trace is None:
+        yield
+        return
+    parent = _path.get()
+    path = f"{parent}/{name}" if parent else name
+    token = _path.set(path)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(path, time.perf_counter() - started, started, **attrs)
+        _path.reset(token)
+
+
+def traced(name: str, fn, trace=None):
+    """Wrap fn so each call is recorded as a span, e.g. for deferred export builds."""
+    def _call(*args, **kwargs):
+        with span(name, trace=trace):
+            return fn(*args, **kwargs)
+    return _call
+
+
+def add_span(name: str, duration: float, **attrs):
+    """Record an already measured stage (e.g. a stream consumed piecewise) under the current span."""
+    trace = _trace.get()
+    if trace is not None:
+        parent = _path.get()
+        trace.add(f"{parent}/{name}" if parent else name, duration, **attrs)
+
+
+@contextlib.contextmanager
+def profiled(trace):
+    """cProfile the block into TRACE_PROFILE_DIR when set. Covers the calling thread only."""
+    if trace is None or not TRACE_PROFILE_DIR:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(TRACE_PROFILE_DIR, exist_ok=True)
+        trace.profile_path = os.path.join(TRACE_PROFILE_DIR, f"{trace.name}-{trace.id}.prof")
+        profiler.dump_stats(trace.profile_path)
@@ -1,10 +1,147 @@
-import tiktoken
+import hashlib
+import os
+import random
+import re
+import threading
+from collections import OrderedDict
+
+# tiktoken downloads its BPE files on first use. BPE files found in
+# TOKENIZER_BPE_DIR as <name>.tiktoken are loaded from there instead, so
+# counting works offline; the repo bundles cl100k_base. Fetch or refresh them
+# with python fetch_tokenizer.py [name ...].
+TOKENIZER_BPE_DIR = os.getenv("TOKENIZER_BPE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                "tokenizer_data"))
+# Encodings that can be loaded from a local BPE file, as tiktoken defines them
+LOCAL_ENCODINGS = {
+    "cl100k_base": {
+        "url": "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+        "sha256": "223921b76ee99bde995b7ff738513eef100fb51d18c93597a113bcffe865b2a7",
+        "pat_str": r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s""",
+        "special_tokens": {"<|endoftext|>": 100257, "<|fim_prefix|>": 100258, "<|fim_middle|>": 100259,
+                           "<|fim_suffix|>": 100260, "<|endofprompt|>": 100276},
+    },
+}
+# Token counts kept per text hash
+TOKEN_COUNT_CACHE_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "256"))
+# Longer texts are counted from samples instead of encoded in full
+TOKEN_COUNT_EXACT_MAX_CHARS = int(os.getenv("TOKEN_COUNT_EXACT_MAX_CHARS", "500000"))
+# Relative error (at ~95% confidence) the sampled count must reach
+TOKEN_COUNT_MAX_ERROR = float(os.getenv("TOKEN_COUNT_MAX_ERROR", "0.01"))
+TOKEN_COUNT_SAMPLES = 64
+TOKEN_COUNT_SAMPLE_CHARS = 4096
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+_counts = OrderedDict()
+_counts_lock = threading.Lock()
+_WHITESPACE_RE = re.compile(r"\s")
+
+
+def bpe_path(name: str, directory: str = TOKENIZER_BPE_DIR) -> str:
+    return os.path.join(directory, f"{name}.tiktoken")
+
+
+def _load_encoding(name: str):
+    import tiktoken
+    spec = LOCAL_ENCODINGS.get(name)
+    path = bpe_path(name)
+    if spec is None or not os.path.exists(path):
+        return tiktoken.get_encoding(name)
+    from tiktoken.load import load_tiktoken_bpe
+    return tiktoken.Encoding(name=name, pat_str=spec["pat_str"],
+                             mergeable_ranks=load_tiktoken_bpe(path, expected_hash=spec["sha256"]),
+                             special_tokens=spec["special_tokens"])
+
+
+def get_encoding(model="gpt-4"):
+    """tiktoken encoding for a model, loaded once per process; None if its BPE file cannot be loaded."""
+    with _encodings_lock:
+        if model in _encodings:
+            return _encodings[model]
+        # Imported on first use; loading tiktoken is not needed to render the page
+        from tiktoken.model import encoding_name_for_model
+        try:
+            name = encoding_name_for_model(model)
+        except KeyError:
+            name = "cl100k_base"  # e.g. Bedrock model ids
+        try:
+            encoding = _load_encoding(name)
+        except Exception as e:
+            # Offline without the BPE file: don't retry the download on every call
+            from telemetry import log_event
+            log_event("tokenizer_unavailable", encoding=name, error=str(e))
+            encoding = None
+        _encodings[model] = encoding
+        return encoding
+
+
+def _sample_bounds(text: str, start: int, size: int) -> tuple:
+    # Samples start and end on whitespace so no word is split in two
+    match = _WHITESPACE_RE.search(text, start, start + size)
+    start = match.end() if match else start
+    end = min(len(text), start + size)
+    if end < len(text):
+        cut = max(text.rfind(" ", start, end), text.rfind("\n", start, end))
+        end = cut if cut > start else end
+    return start, end
+
+
+def approximate_token_count(text: str, encoding, samples: int = TOKEN_COUNT_SAMPLES,
+                            sample_chars: int = TOKEN_COUNT_SAMPLE_CHARS,
+                            max_error: float = TOKEN_COUNT_MAX_ERROR) -> tuple:
+    """
+    (estimated tokens, relative error at ~95% confidence) for a long text.
+    One sample is encoded from each of `samples` equal strata and the count
+    is scaled by tokens per character; the number of samples doubles until
+    the error bound is below max_error, falling back to an exact count once
+    half of the text would be sampled.
+    """
+    n = len(text)
+    rng = random.Random(n)  # the same text always gets the same estimate
+    while samples * sample_chars * 2 <= n:
+        stride = n / samples
+        ratios, tokens, chars = [], 0, 0
+        for i in range(samples):
+            start, end = _sample_bounds(text, int(i * stride + rng.random() * max(stride - sample_chars, 0)),
+                                        sample_chars)
+            if end <= start:
+                continue
+            sample_tokens = len(encoding.encode_ordinary(text[start:end]))
+            ratios.append(sample_tokens / (end - start))
+            tokens += sample_tokens
+            chars += end - start
+        if len(ratios) > 1 and chars:
+            mean = sum(ratios) / len(ratios)
+            variance = sum((r - mean) ** 2 for r in ratios) / (len(ratios) - 1)
+            # Standard error of the mean ratio, with the finite population correction
+            error = 1.96 * (variance / len(ratios) * (1 - chars / n)) ** 0.5 / mean if mean else 0.0
+            if error <= max_error:
+                return round(tokens / chars * n), error
+        samples *= 2
+    return len(encoding.encode_ordinary(text)), 0.0
+
 
 def count_tokens(text, model="gpt-4"):
     if not text:
         return 0
-    encoding = tiktoken.encoding_for_model(model)
-    return len(encoding.encode(text))
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(text) // 4  # same rough rate the rate limiter assumes
+    key = (encoding.name, hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest())
+    with _counts_lock:
+        count = _counts.get(key)
+        if count is not None:
+            _counts.move_to_end(key)
+            return count
+    if len(text) > TOKEN_COUNT_EXACT_MAX_CHARS:
+        count = approximate_token_count(text, encoding)[0]
+    else:
+        count = len(encoding.encode_ordinary(text))
+    with _counts_lock:
+        _counts[key] = count
+        while len(_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _counts.popitem(last=False)
+    return count
 
 def estimate_tokens_per_tc(model="gpt-4"):
     # Adjust based on model verbosity